@@ -1,9 +1,9 @@
 from importlib.metadata import entry_points
 
-from .brain import Brain
+from .brain import Brain, BrainGroup
 from .processor.registry import register_processor, registry
 
-__all__ = ["Brain", "registry", "register_processor"]
+__all__ = ["Brain", "BrainGroup", "registry", "register_processor"]
 
 
 def register_entries():
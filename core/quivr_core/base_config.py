@@ -1,8 +1,18 @@
+import hashlib
+import json
 from pathlib import Path
 
 import yaml
 from pydantic import BaseModel, ConfigDict
-from typing import Self
+from typing import Any, Self
+
+
+def _fingerprint_default(value: Any) -> Any:
+    # NOTE: tools and other objects are identified by their type and name
+    if isinstance(value, type):
+        return f"{value.__module__}.{value.__qualname__}"
+    name = getattr(value, "name", None)
+    return f"{type(value).__module__}.{type(value).__qualname__}:{name}"
 
 
 class QuivrBaseConfig(BaseModel):
@@ -19,6 +29,9 @@ class QuivrBaseConfig(BaseModel):
 
     Class Methods:
         from_yaml: Create an instance of the class from a YAML file.
+
+    Methods:
+        fingerprint: Stable hash of the configuration, e.g. to cache the objects built from it.
     """
 
     model_config = ConfigDict(extra="forbid")
@@ -40,3 +53,15 @@ class QuivrBaseConfig(BaseModel):
 
         # Instantiate the class using the YAML data
         return cls(**config_data)
+
+    def fingerprint(self) -> str:
+        """
+        Stable hash of the configuration: equal configurations have the same fingerprint.
+
+        Returns:
+            str: The SHA-256 hex digest of the configuration values.
+        """
+        data = json.dumps(
+            self.model_dump(mode="python"), sort_keys=True, default=_fingerprint_default
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
@@ -1,3 +1,4 @@
 from .brain import Brain
+from .brain_group import BrainGroup
 
-__all__ = ["Brain"]
+__all__ = ["Brain", "BrainGroup"]
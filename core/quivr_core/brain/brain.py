@@ -1,40 +1,74 @@
 import asyncio
 import logging
 import os
+import time
 from pathlib import Path
 from pprint import PrettyPrinter
-from typing import Any, AsyncGenerator, Callable, Dict, Self, Type, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Iterator,
+    Self,
+    Type,
+    Union,
+)
 from uuid import UUID, uuid4
 
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.messages import AIMessage, HumanMessage
-from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
 from quivr_core.rag.entities.models import ParsedRAGResponse
 from langchain_openai import OpenAIEmbeddings
 from quivr_core.rag.quivr_rag import QuivrQARAG
 from rich.console import Console
 from rich.panel import Panel
 
+from quivr_core.brain.docstore import iter_metadatas
+from quivr_core.brain.faiss_index import QuivrFAISS
 from quivr_core.brain.info import BrainInfo, ChatHistoryInfo
+from quivr_core.brain.persistence import (
+    SEGMENTS_DIR,
+    collect_garbage,
+    is_faiss,
+    load_vector_segments,
+    publish_manifest,
+    read_chat_journal,
+    read_manifest,
+    write_chat_journal,
+    write_vector_segments,
+)
 from quivr_core.brain.serialization import (
+    BrainManifest,
     BrainSerialized,
     EmbedderConfig,
+    ExternalVectorStoreConfig,
     FAISSConfig,
     LocalStorageConfig,
+    SegmentInfo,
     TransparentStorageConfig,
 )
+from quivr_core.brain.versioned_store import VersionedFAISS
 from quivr_core.rag.entities.chat import ChatHistory
-from quivr_core.rag.entities.config import RetrievalConfig
-from quivr_core.files.file import load_qfile
+from quivr_core.rag.entities.config import (
+    FAISSIndexConfig,
+    IngestionConfig,
+    RetrievalConfig,
+)
+from quivr_core.files.file import QuivrFile, load_qfile
 from quivr_core.llm import LLMEndpoint
 from quivr_core.rag.entities.models import (
     ParsedRAGChunkResponse,
     QuivrKnowledge,
     SearchResult,
 )
-from quivr_core.processor.registry import get_processor_class
+from quivr_core.processor.embedding_cache import CachedEmbeddings, with_embedding_cache
+from quivr_core.processor.ingestion import IngestionScheduler
+from quivr_core.rag.pipeline_cache import PipelineCache
 from quivr_core.rag.quivr_rag_langgraph import QuivrQARAGLangGraph
+from quivr_core.rag.utils import asearch_many
 from quivr_core.storage.local_storage import LocalStorage, TransparentStorage
 from quivr_core.storage.storage_base import StorageBase
 
@@ -44,14 +78,19 @@ logger = logging.getLogger("quivr_core")
 
 
 async def process_files(
-    storage: StorageBase, skip_file_error: bool, **processor_kwargs: dict[str, Any]
+    storage: StorageBase,
+    skip_file_error: bool,
+    ingestion_config: IngestionConfig | None = None,
+    **processor_kwargs: dict[str, Any],
 ) -> list[Document]:
     """
     Process files in storage.
     This function takes a StorageBase and return a list of langchain documents.
+    Files are parsed concurrently (see `IngestionConfig`) and the chunks are returned in the order of the storage files.
     Args:
         storage (StorageBase): The storage containing the files to process.
         skip_file_error (bool): Whether to skip files that cannot be processed.
+        ingestion_config (IngestionConfig | None): The concurrency configuration of the ingestion.
         processor_kwargs (dict[str, Any]): Additional arguments for the processor.
     Returns:
         list[Document]: List of processed documents in the Langchain Document format.
@@ -59,29 +98,35 @@ async def process_files(
         ValueError: If a file cannot be processed and skip_file_error is False.
         Exception: If no processor is found for a file of a specific type and skip_file_error is False.
     """
+    with IngestionScheduler(ingestion_config) as scheduler:
+        return await scheduler.aprocess_files(
+            await storage.get_files(), skip_file_error, **processor_kwargs
+        )
 
-    knowledge = []
-    for file in await storage.get_files():
-        try:
-            if file.file_extension:
-                processor_cls = get_processor_class(file.file_extension)
-                logger.debug(f"processing {file} using class {processor_cls.__name__}")
-                processor = processor_cls(**processor_kwargs)
-                docs = await processor.process_file(file)
-                knowledge.extend(docs)
-            else:
-                logger.error(f"can't find processor for {file}")
-                if skip_file_error:
-                    continue
-                else:
-                    raise ValueError(f"can't parse {file}. can't find file extension")
-        except KeyError as e:
-            if skip_file_error:
-                continue
-            else:
-                raise Exception(f"Can't parse {file}. No available processor") from e
 
-    return knowledge
+def _build_file_chunk_ids(vector_db: VectorStore | None) -> dict[UUID, list[str]]:
+    """Group the chunk ids of the vector store by the `qfile_id` of the chunks."""
+    if vector_db is None:
+        return {}
+
+    chunks: Iterator[tuple[str, dict[str, Any]]] | None = None
+    if isinstance(vector_db, InMemoryVectorStore):
+        chunks = ((id, doc["metadata"]) for id, doc in vector_db.store.items())
+    elif isinstance(vector_db, VersionedFAISS):
+        chunks = vector_db.metadatas()
+    elif hasattr(vector_db, "docstore"):
+        chunks = iter_metadatas(vector_db.docstore)
+    if chunks is None:
+        logger.warning(
+            f"can't list the chunks of {type(vector_db).__name__}, only files added to this brain can be removed"
+        )
+        return {}
+
+    file_chunk_ids: dict[UUID, list[str]] = {}
+    for chunk_id, metadata in chunks:
+        if (file_id := metadata.get("qfile_id")) is not None:
+            file_chunk_ids.setdefault(file_id, []).append(chunk_id)
+    return file_chunk_ids
 
 
 class Brain:
@@ -129,6 +174,11 @@ class Brain:
         self.llm = llm
         self.vector_db = vector_db
         self.embedder = embedder
+        self._file_chunk_ids: dict[UUID, list[str]] | None = None
+        # Compiled RAG pipelines reused across questions
+        self.pipeline_cache = PipelineCache()
+        # Duration of the phases of `Brain.load` in seconds
+        self.load_timings: dict[str, float] = {}
 
     def __repr__(self) -> str:
         pp = PrettyPrinter(width=80, depth=None, compact=False, sort_dicts=False)
@@ -141,16 +191,37 @@ class Brain:
         console.print(panel)
 
     @classmethod
-    def load(cls, folder_path: str | Path) -> Self:
+    def load(
+        cls,
+        folder_path: str | Path,
+        mmap: bool = False,
+        vector_db: VectorStore | None = None,
+        embedder: Embeddings | None = None,
+    ) -> Self:
         """
         Load a brain from a folder path.
+
+        The brain is loaded from the segments and the chat journal published by the last `save`. Brains saved
+        with a single `config.json` by previous versions are still loaded.
+
+        With `mmap=True`, the vector index is memory-mapped read-only and the docstore is loaded on first use:
+        processes loading the same brain share the page cache of the index and start almost instantly.
+        The index is copied in memory on the first modification of the brain, or at load if the brain has
+        segments not compacted yet (see `save`).
+        The duration of each phase of the load is logged and stored in `load_timings`.
+
         Args:
             folder_path (str | Path): The path to the folder containing the brain.
+            mmap (bool): Memory-map the vector index and load the docstore lazily.
+            vector_db (VectorStore | None): The vector store of a brain saved with a vector store other than FAISS.
+            embedder (Embeddings | None): The embedder of a brain saved with an embedder other than OpenAI.
         Returns:
             Brain: The brain loaded from the folder path.
+        Raises:
+            ValueError: If the brain was saved with a vector store or an embedder that must be passed back.
         Example:
         ```python
-        brain_loaded = Brain.load("path/to/brain")
+        brain_loaded = Brain.load("path/to/brain", mmap=True)
         brain_loaded.print_info()
         ```
         """
@@ -159,9 +230,23 @@ class Brain:
         if not folder_path.exists():
             raise ValueError(f"path {folder_path} doesn't exist")
 
+        timings: dict[str, float] = {}
+        start = phase_start = time.perf_counter()
+
+        def _phase(name: str) -> None:
+            nonlocal phase_start
+            now = time.perf_counter()
+            timings[name] = now - phase_start
+            phase_start = now
+
         # Load brainserialized
-        with open(os.path.join(folder_path, "config.json"), "r") as f:
-            bserialized = BrainSerialized.model_validate_json(f.read())
+        manifest = read_manifest(folder_path)
+        if manifest is not None:
+            bserialized = manifest.brain
+        else:
+            with open(os.path.join(folder_path, "config.json"), "r") as f:
+                bserialized = BrainSerialized.model_validate_json(f.read())
+        _phase("config")
 
         storage: StorageBase | None = None
         # Loading storage
@@ -171,41 +256,99 @@ class Brain:
             storage = LocalStorage.load(bserialized.storage_config)
         else:
             raise ValueError("unknown storage")
+        _phase("storage")
 
         # Load Embedder
-        if bserialized.embedding_config.embedder_type == "openai_embedding":
-            from langchain_openai import OpenAIEmbeddings
-
-            embedder = OpenAIEmbeddings(**bserialized.embedding_config.config)
-        else:
-            raise ValueError("unknown embedder")
+        if embedder is None:
+            if bserialized.embedding_config is None:
+                raise ValueError(
+                    "the brain was saved without its embedder: pass it to Brain.load"
+                )
+            if bserialized.embedding_config.embedder_type == "openai_embedding":
+                from langchain_openai import OpenAIEmbeddings
+
+                embedder = OpenAIEmbeddings(**bserialized.embedding_config.config)
+            else:
+                raise ValueError("unknown embedder")
+        _phase("embedder")
 
         # Load vector db
-        if bserialized.vectordb_config.vectordb_type == "faiss":
-            from langchain_community.vectorstores import FAISS
-
-            vector_db = FAISS.load_local(
-                folder_path=bserialized.vectordb_config.vectordb_folder_path,
-                embeddings=embedder,
-                allow_dangerous_deserialization=True,
-            )
+        vectordb_config = bserialized.vectordb_config
+        if vectordb_config.vectordb_type == "faiss":
+            if manifest is not None:
+                vector_db = load_vector_segments(
+                    folder_path,
+                    manifest,
+                    embedder,
+                    index_config=vectordb_config.index_config,
+                    mmap=mmap,
+                )
+            else:
+                vector_db = QuivrFAISS.load_local(
+                    folder_path=vectordb_config.vectordb_folder_path,
+                    embeddings=embedder,
+                    allow_dangerous_deserialization=True,
+                    mmap=mmap,
+                    lazy_docstore=mmap,
+                    index_config=vectordb_config.index_config,
+                )
+        elif vectordb_config.vectordb_type == "external":
+            if vector_db is None:
+                raise ValueError(
+                    f"the brain was saved with a {vectordb_config.class_name} vector store: pass it to Brain.load"
+                )
         else:
             raise ValueError("Unsupported vectordb")
+        _phase("vectordb")
 
-        return cls(
+        llm = LLMEndpoint.from_config(bserialized.llm_config)
+        _phase("llm")
+
+        brain = cls(
             id=bserialized.id,
             name=bserialized.name,
             embedder=embedder,
-            llm=LLMEndpoint.from_config(bserialized.llm_config),
+            llm=llm,
             storage=storage,
             vector_db=vector_db,
         )
+        if manifest is not None:
+            brain.default_chat._msgs = read_chat_journal(folder_path, manifest)
+        else:
+            brain.default_chat._msgs = list(bserialized.chat_history)
+        _phase("chat")
 
-    async def save(self, folder_path: str | Path):
+        timings.update(
+            {
+                f"vectordb_{k}": v
+                for k, v in getattr(vector_db, "load_timings", {}).items()
+            }
+        )
+        timings["total"] = time.perf_counter() - start
+        brain.load_timings = timings
+        logger.info(
+            f"loaded brain {brain.id} in {timings['total']:.3f}s: "
+            + ", ".join(f"{k}={v:.3f}s" for k, v in timings.items() if k != "total")
+        )
+        return brain
+
+    async def save(self, folder_path: str | Path, compact: bool | None = None):
         """
         Save the brain to a folder path.
+
+        Saves are incremental and atomic. The FAISS vectors and chunks added since the previous save to the same
+        folder are written to a new segment, the deleted chunks are recorded, and the new chat messages are
+        appended to the chat journal. The save is then published by atomically replacing the manifest of
+        the brain: a save interrupted before this leaves the previous save intact.
+        The segments are compacted into a single index when there are too many segments or deleted chunks,
+        or when `compact=True`.
+
+        Vector stores other than FAISS persist their data themselves: they are passed back to `Brain.load`.
+        A `VersionedFAISS` store is compacted and its published version is saved as a FAISS store.
+
         Args:
             folder_path (str | Path): The path to the folder where the brain will be saved.
+            compact (bool | None): Compact the segments of the vector store. Defaults to compacting when needed.
         Returns:
             str: The path to the folder where the brain was saved.
         Example:
@@ -216,25 +359,42 @@ class Brain:
         if isinstance(folder_path, str):
             folder_path = Path(folder_path)
 
-        brain_path = os.path.join(folder_path, f"brain_{self.id}")
+        brain_path = folder_path / f"brain_{self.id}"
         os.makedirs(brain_path, exist_ok=True)
-
-        from langchain_community.vectorstores import FAISS
-
-        if isinstance(self.vector_db, FAISS):
-            vectordb_path = os.path.join(brain_path, "vector_store")
-            os.makedirs(vectordb_path, exist_ok=True)
-            self.vector_db.save_local(folder_path=vectordb_path)
-            vector_store = FAISSConfig(vectordb_folder_path=vectordb_path)
+        previous = read_manifest(brain_path)
+        generation = previous.generation + 1 if previous is not None else 1
+
+        vector_db = self.vector_db
+        if isinstance(vector_db, VersionedFAISS):
+            vector_db = await asyncio.to_thread(vector_db.compact)
+
+        segments: list[SegmentInfo] = []
+        deleted_chunk_ids: list[str] = []
+        vector_store: Union[FAISSConfig, ExternalVectorStoreConfig]
+        if is_faiss(vector_db):
+            segments, deleted_chunk_ids = write_vector_segments(
+                brain_path, generation, vector_db, previous, compact=compact
+            )
+            vector_store = FAISSConfig(
+                vectordb_folder_path=str(brain_path / SEGMENTS_DIR),
+                index_config=getattr(vector_db, "index_config", FAISSIndexConfig()),
+            )
         else:
-            raise Exception("can't serialize other vector stores for now")
+            vector_store = ExternalVectorStoreConfig(
+                class_name=type(self.vector_db).__name__
+            )
 
-        if isinstance(self.embedder, OpenAIEmbeddings):
+        # NOTE: the embedding cache is a local optimization, the underlying embedder is saved
+        embedder = (
+            self.embedder.underlying
+            if isinstance(self.embedder, CachedEmbeddings)
+            else self.embedder
+        )
+        embedder_config: EmbedderConfig | None = None
+        if isinstance(embedder, OpenAIEmbeddings):
             embedder_config = EmbedderConfig(
-                config=self.embedder.dict(exclude={"openai_api_key"})
+                config=embedder.dict(exclude={"openai_api_key"})
             )
-        else:
-            raise Exception("can't serialize embedder other than openai for now")
 
         storage_config: Union[LocalStorageConfig, TransparentStorageConfig]
         # TODO : each instance should know how to serialize/deserialize itself
@@ -253,19 +413,28 @@ class Brain:
         else:
             raise Exception("can't serialize storage. not supported for now")
 
-        bserialized = BrainSerialized(
-            id=self.id,
-            name=self.name,
-            chat_history=self.chat_history.get_chat_history(),
-            llm_config=self.llm.get_config(),
-            vectordb_config=vector_store,
-            embedding_config=embedder_config,
-            storage_config=storage_config,
+        messages = self.chat_history.get_chat_history()
+        chat_path, chat_bytes = write_chat_journal(brain_path, messages, previous)
+
+        manifest = BrainManifest(
+            generation=generation,
+            brain=BrainSerialized(
+                id=self.id,
+                name=self.name,
+                llm_config=self.llm.get_config(),
+                vectordb_config=vector_store,
+                embedding_config=embedder_config,
+                storage_config=storage_config,
+            ),
+            segments=segments,
+            deleted_chunk_ids=deleted_chunk_ids,
+            chat_path=chat_path,
+            chat_bytes=chat_bytes,
+            n_chat_messages=len(messages),
         )
-
-        with open(os.path.join(brain_path, "config.json"), "w") as f:
-            f.write(bserialized.model_dump_json())
-        return brain_path
+        publish_manifest(brain_path, manifest)
+        collect_garbage(brain_path, manifest)
+        return str(brain_path)
 
     def info(self) -> BrainInfo:
         # TODO: dim of embedding
@@ -300,11 +469,12 @@ class Brain:
         name: str,
         file_paths: list[str | Path],
         vector_db: VectorStore | None = None,
-        storage: StorageBase = TransparentStorage(),
+        storage: StorageBase | None = None,
         llm: LLMEndpoint | None = None,
         embedder: Embeddings | None = None,
         skip_file_error: bool = False,
         processor_kwargs: dict[str, Any] | None = None,
+        ingestion_config: IngestionConfig | None = None,
     ):
         """
         Create a brain from a list of file paths.
@@ -312,11 +482,12 @@ class Brain:
             name (str): The name of the brain.
             file_paths (list[str | Path]): The list of file paths to add to the brain.
             vector_db (VectorStore | None): The vector store used to store the processed files.
-            storage (StorageBase): The storage used to store the files.
+            storage (StorageBase | None): The storage used to store the files. Defaults to a new `TransparentStorage`.
             llm (LLMEndpoint | None): The language model used to generate the answer.
             embedder (Embeddings | None): The embeddings used to create the index of the processed files.
             skip_file_error (bool): Whether to skip files that cannot be processed.
             processor_kwargs (dict[str, Any] | None): Additional arguments for the processor.
+            ingestion_config (IngestionConfig | None): The concurrency configuration for uploading and parsing files.
         Returns:
             Brain: The brain created from the file paths.
         Example:
@@ -330,33 +501,24 @@ class Brain:
 
         if embedder is None:
             embedder = default_embedder()
+        embedder = with_embedding_cache(embedder, ingestion_config)
+
+        if storage is None:
+            storage = TransparentStorage()
 
         processor_kwargs = processor_kwargs or {}
 
         brain_id = uuid4()
 
-        # TODO: run in parallel using tasks
-
-        for path in file_paths:
-            file = await load_qfile(brain_id, path)
-            await storage.upload_file(file)
-
-        logger.debug(f"uploaded all files to {storage}")
-
-        # Parse files
-        docs = await process_files(
-            storage=storage,
-            skip_file_error=skip_file_error,
-            **processor_kwargs,
-        )
-
-        # Building brain's vectordb
-        if vector_db is None:
-            vector_db = await build_default_vectordb(docs, embedder)
-        else:
-            await vector_db.aadd_documents(docs)
+        with IngestionScheduler(ingestion_config) as scheduler:
+            await scheduler.aupload_files(brain_id, file_paths, storage)
+            logger.debug(f"uploaded all files to {storage}")
 
-        logger.debug(f"added {len(docs)} chunks to vectordb")
+            # Parse files and stream the chunks to the brain's vectordb
+            chunks = scheduler.astream_files(
+                await storage.get_files(), skip_file_error, **processor_kwargs
+            )
+            vector_db = await scheduler.aindex_documents(chunks, embedder, vector_db)
 
         return cls(
             id=brain_id,
@@ -374,11 +536,12 @@ class Brain:
         name: str,
         file_paths: list[str | Path],
         vector_db: VectorStore | None = None,
-        storage: StorageBase = TransparentStorage(),
+        storage: StorageBase | None = None,
         llm: LLMEndpoint | None = None,
         embedder: Embeddings | None = None,
         skip_file_error: bool = False,
         processor_kwargs: dict[str, Any] | None = None,
+        ingestion_config: IngestionConfig | None = None,
     ) -> Self:
         loop = asyncio.get_event_loop()
         return loop.run_until_complete(
@@ -391,6 +554,7 @@ class Brain:
                 embedder=embedder,
                 skip_file_error=skip_file_error,
                 processor_kwargs=processor_kwargs,
+                ingestion_config=ingestion_config,
             )
         )
 
@@ -401,9 +565,10 @@ class Brain:
         name: str,
         langchain_documents: list[Document],
         vector_db: VectorStore | None = None,
-        storage: StorageBase = TransparentStorage(),
+        storage: StorageBase | None = None,
         llm: LLMEndpoint | None = None,
         embedder: Embeddings | None = None,
+        ingestion_config: IngestionConfig | None = None,
     ) -> Self:
         """
         Create a brain from a list of langchain documents.
@@ -411,9 +576,10 @@ class Brain:
             name (str): The name of the brain.
             langchain_documents (list[Document]): The list of langchain documents to add to the brain.
             vector_db (VectorStore | None): The vector store used to store the processed files.
-            storage (StorageBase): The storage used to store the files.
+            storage (StorageBase | None): The storage used to store the files. Defaults to a new `TransparentStorage`.
             llm (LLMEndpoint | None): The language model used to generate the answer.
             embedder (Embeddings | None): The embeddings used to create the index of the processed files.
+            ingestion_config (IngestionConfig | None): The configuration of the embedding requests.
         Returns:
             Brain: The brain created from the langchain documents.
         Example:
@@ -430,12 +596,18 @@ class Brain:
 
         if embedder is None:
             embedder = default_embedder()
+        embedder = with_embedding_cache(embedder, ingestion_config)
+
+        if storage is None:
+            storage = TransparentStorage()
 
         brain_id = uuid4()
 
         # Building brain's vectordb
         if vector_db is None:
-            vector_db = await build_default_vectordb(langchain_documents, embedder)
+            vector_db = await build_default_vectordb(
+                langchain_documents, embedder, ingestion_config
+            )
         else:
             await vector_db.aadd_documents(langchain_documents)
 
@@ -460,8 +632,10 @@ class Brain:
         Args:
             query (str | Document): The query to search for.
             n_results (int): The number of results to return.
-            filter (Callable | Dict[str, Any] | None): The filter to apply to the search.
-            fetch_n_neighbors (int): The number of neighbors to fetch.
+            filter (Callable | Dict[str, Any] | None): The filter to apply to the search. With the default FAISS
+                vector store, dict filters on file-level metadata (`qfile_id`, `file_sha1`, additional metadata...)
+                are resolved before the search, which only visits the matching chunks.
+            fetch_n_neighbors (int): The number of neighbors to fetch before applying the other filters.
         Returns:
             list[SearchResult]: The list of retrieved chunks.
         Example:
@@ -481,14 +655,190 @@ class Brain:
 
         return [SearchResult(chunk=d, distance=s) for d, s in result]
 
+    async def asearch_many(
+        self,
+        queries: list[str | Document],
+        n_results: int = 5,
+        filter: Callable | Dict[str, Any] | None = None,
+        fetch_n_neighbors: int = 20,
+    ) -> list[list[SearchResult]]:
+        """
+        Search for relevant documents in the brain for several queries at once.
+
+        The queries are embedded in a single request and, with the default FAISS vector store, searched with a
+        single search of the index. Chunks retrieved by several queries are only read once.
+        Args:
+            queries (list[str | Document]): The queries to search for.
+            n_results (int): The number of results to return per query.
+            filter (Callable | Dict[str, Any] | None): The filter to apply to the search, see `asearch`.
+            fetch_n_neighbors (int): The number of neighbors to fetch before applying the other filters.
+        Returns:
+            list[list[SearchResult]]: The list of retrieved chunks of each query.
+        Example:
+        ```python
+        results = await brain.asearch_many(["What is Quivr?", "Who made Quivr?"])
+        for query_results in results:
+            print([result.chunk.page_content for result in query_results])
+        ```
+        """
+        if not self.vector_db:
+            raise ValueError("No vector db configured for this brain")
+
+        results = await asearch_many(
+            self.vector_db,
+            [q.page_content if isinstance(q, Document) else q for q in queries],
+            k=n_results,
+            filter=filter,
+            fetch_k=fetch_n_neighbors,
+        )
+        return [
+            [SearchResult(chunk=d, distance=s) for d, s in query_results]
+            for query_results in results
+        ]
+
     def get_chat_history(self, chat_id: UUID):
         return self._chats[chat_id]
 
-    # TODO(@aminediro)
-    def add_file(self) -> None:
-        # add it to storage
-        # add it to vectorstore
-        raise NotImplementedError
+    @property
+    def file_chunk_ids(self) -> dict[UUID, list[str]]:
+        """
+        Index of the vector store chunk ids of each file of the brain, keyed by file id.
+        Built from the `qfile_id` metadata of the chunks on first access.
+        """
+        if self._file_chunk_ids is None:
+            self._file_chunk_ids = _build_file_chunk_ids(self.vector_db)
+        return self._file_chunk_ids
+
+    def _track_file_chunks(self, chunks: list[Document]) -> None:
+        # NOTE: called once the chunks are in the vector store, so that only indexed chunks are deleted
+        # when the file is removed
+        for chunk in chunks:
+            file_id = chunk.metadata.get("qfile_id")
+            if chunk.id is not None and file_id is not None:
+                self.file_chunk_ids.setdefault(file_id, []).append(chunk.id)
+
+    async def aadd_file(
+        self,
+        file_path: str | Path,
+        skip_file_error: bool = False,
+        processor_kwargs: dict[str, Any] | None = None,
+        ingestion_config: IngestionConfig | None = None,
+    ) -> QuivrFile | None:
+        """
+        Add a file to the brain: upload it to the storage, then parse and index only its chunks.
+        If a file with the same content is already in the brain, nothing is done.
+        If a file with the same name but a different content is in the brain, it is replaced.
+        Args:
+            file_path (str | Path): The path of the file to add.
+            skip_file_error (bool): Whether to skip the file if it cannot be processed.
+            processor_kwargs (dict[str, Any] | None): Additional arguments for the processor.
+            ingestion_config (IngestionConfig | None): The configuration of the ingestion.
+        Returns:
+            QuivrFile | None: The added file, the existing file if unchanged, or None if it was skipped.
+        Raises:
+            ValueError: If the brain has no storage.
+        Example:
+        ```python
+        brain = await Brain.afrom_files(name="My Brain", file_paths=["file1.pdf"])
+        await brain.aadd_file("file2.pdf")
+        ```
+        """
+        if self.storage is None:
+            raise ValueError("No storage configured for this brain")
+        if self.embedder is None:
+            self.embedder = default_embedder()
+
+        file = await load_qfile(self.id, file_path)
+        files = await self.storage.get_files()
+
+        existing = next((f for f in files if f.file_sha1 == file.file_sha1), None)
+        if existing is not None:
+            logger.info(f"file {file_path} unchanged, skipping it")
+            return existing
+
+        previous = next(
+            (f for f in files if f.original_filename == file.original_filename), None
+        )
+
+        processor_kwargs = processor_kwargs or {}
+        if self._file_chunk_ids is None:
+            # NOTE: built before the new chunks are added to the vector store, they are tracked as indexed
+            self._file_chunk_ids = _build_file_chunk_ids(self.vector_db)
+        with IngestionScheduler(ingestion_config) as scheduler:
+            await self.storage.upload_file(file)
+            try:
+                chunks = scheduler.astream_files(
+                    [file], skip_file_error, **processor_kwargs
+                )
+                self.vector_db = await scheduler.aindex_documents(
+                    chunks,
+                    self.embedder,
+                    self.vector_db,
+                    on_indexed=self._track_file_chunks,
+                )
+                for error in scheduler.file_errors:
+                    # NOTE: the chunks of a skipped file were deleted from the vector store
+                    self.file_chunk_ids.pop(error.file.id, None)
+            except BaseException:
+                try:
+                    await self.aremove_file(file.id)
+                except Exception:
+                    logger.exception(
+                        f"can't remove file {file_path} after its ingestion failed"
+                    )
+                raise
+
+        if file.id not in self.file_chunk_ids:
+            logger.warning(f"no chunks indexed for file {file_path}")
+            await self.storage.remove_file(file.id)
+            return None
+
+        if previous is not None:
+            logger.info(f"replacing previous version of file {file.original_filename}")
+            await self.aremove_file(previous.id)
+
+        return file
+
+    def add_file(
+        self,
+        file_path: str | Path,
+        skip_file_error: bool = False,
+        processor_kwargs: dict[str, Any] | None = None,
+        ingestion_config: IngestionConfig | None = None,
+    ) -> QuivrFile | None:
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(
+            self.aadd_file(
+                file_path=file_path,
+                skip_file_error=skip_file_error,
+                processor_kwargs=processor_kwargs,
+                ingestion_config=ingestion_config,
+            )
+        )
+
+    async def aremove_file(self, file_id: UUID) -> None:
+        """
+        Remove a file from the brain: delete its chunks from the vector store and the file from the storage.
+        Args:
+            file_id (UUID): The id of the file to remove.
+        Raises:
+            ValueError: If the file is not in the brain.
+        """
+        chunk_ids = self.file_chunk_ids.pop(file_id, [])
+        if chunk_ids and self.vector_db is not None:
+            await self.vector_db.adelete(chunk_ids)
+            logger.debug(f"deleted {len(chunk_ids)} chunks of file {file_id}")
+
+        if self.storage is not None and any(
+            f.id == file_id for f in await self.storage.get_files()
+        ):
+            await self.storage.remove_file(file_id)
+        elif not chunk_ids:
+            raise ValueError(f"file {file_id} is not in the brain")
+
+    def remove_file(self, file_id: UUID) -> None:
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(self.aremove_file(file_id))
 
     async def ask_streaming(
         self,
@@ -527,14 +877,14 @@ class Brain:
         if rag_pipeline is None:
             rag_pipeline = QuivrQARAGLangGraph
 
-        rag_instance = rag_pipeline(
-            retrieval_config=retrieval_config, llm=llm, vector_store=self.vector_db
-        )
-
         chat_history = self.default_chat if chat_history is None else chat_history
         list_files = [] if list_files is None else list_files
 
         full_answer = ""
+        # NOTE: the pipeline, and its compiled graph, is shared by the questions with the same config
+        rag_instance = self.pipeline_cache.get(
+            rag_pipeline, retrieval_config, llm, self.vector_db
+        )
         async for response in rag_instance.answer_astream(
             question=question, history=chat_history, list_files=list_files
         ):
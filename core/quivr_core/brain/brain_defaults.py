@@ -1,34 +1,90 @@
 import logging
+from uuid import uuid4
 
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
 
-from quivr_core.rag.entities.config import DefaultModelSuppliers, LLMEndpointConfig
+from quivr_core.brain.docstore import CompactDocstore, SQLiteDocstore
+from quivr_core.brain.faiss_index import QuivrFAISS, build_faiss_index, needs_training
 from quivr_core.llm import LLMEndpoint
+from quivr_core.processor.embedding import EmbeddingScheduler
+from quivr_core.rag.entities.config import (
+    DefaultModelSuppliers,
+    FAISSDocstoreType,
+    FAISSIndexConfig,
+    IngestionConfig,
+    LLMEndpointConfig,
+)
 
 logger = logging.getLogger("quivr_core")
 
 
-async def build_default_vectordb(
-    docs: list[Document], embedder: Embeddings
-) -> VectorStore:
+def build_faiss_vectordb(
+    embedder: Embeddings, dim: int, index_config: FAISSIndexConfig | None = None
+) -> QuivrFAISS:
+    """
+    Build an empty FAISS vector store for embeddings of dimension `dim`, with the index type of `index_config`.
+    Chunks are stored in a `CompactDocstore`, or a `SQLiteDocstore` if configured.
+    """
     try:
-        from langchain_community.vectorstores import FAISS
-
-        logger.debug("Using Faiss-CPU as vector store.")
-        # TODO(@aminediro) : embedding call is usually not concurrent for all documents but waits
-        if len(docs) > 0:
-            vector_db = await FAISS.afrom_documents(documents=docs, embedding=embedder)
-            return vector_db
-        else:
-            raise ValueError("can't initialize brain without documents")
+        from langchain_community.vectorstores.faiss import dependable_faiss_import
 
+        dependable_faiss_import()
     except ImportError as e:
         raise ImportError(
             "Please provide a valid vector store or install quivr-core['base'] package for using the default one."
         ) from e
 
+    logger.debug("Using Faiss-CPU as vector store.")
+    index_config = index_config or FAISSIndexConfig()
+    return QuivrFAISS(
+        embedding_function=embedder,
+        # NOTE: indexes needing training are built once enough vectors were added
+        index=None
+        if needs_training(index_config)
+        else build_faiss_index(dim, index_config),
+        docstore=SQLiteDocstore()
+        if index_config.docstore_type == FAISSDocstoreType.SQLITE
+        else CompactDocstore(),
+        index_to_docstore_id={},
+        index_config=index_config,
+    )
+
+
+async def build_default_vectordb(
+    docs: list[Document],
+    embedder: Embeddings,
+    ingestion_config: IngestionConfig | None = None,
+) -> VectorStore:
+    """
+    Build a FAISS vector store from documents. The documents are embedded by concurrent, token-packed
+    requests (see `EmbeddingScheduler`) and added to the index as the requests complete.
+    """
+    if len(docs) == 0:
+        raise ValueError("can't initialize brain without documents")
+
+    async def _docs():
+        for doc in docs:
+            yield doc
+
+    ingestion_config = ingestion_config or IngestionConfig()
+    scheduler = EmbeddingScheduler.from_config(embedder, ingestion_config)
+    vector_db = None
+    async for batch, vectors in scheduler.astream(_docs()):
+        if vector_db is None:
+            vector_db = build_faiss_vectordb(
+                embedder, len(vectors[0]), ingestion_config.faiss_index_config
+            )
+        vector_db.add_embeddings(
+            [(d.page_content, v) for d, v in zip(batch, vectors, strict=True)],
+            metadatas=[d.metadata for d in batch],
+            ids=[d.id or str(uuid4()) for d in batch],
+        )
+    assert vector_db is not None
+    vector_db.flush()
+    return vector_db
+
 
 def default_embedder() -> Embeddings:
     try:
@@ -0,0 +1,425 @@
+import asyncio
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    List,
+    Type,
+    TypeVar,
+    Union,
+)
+from uuid import uuid4
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+
+from quivr_core.brain.brain import Brain
+from quivr_core.llm import LLMEndpoint
+from quivr_core.rag.entities.chat import ChatHistory
+from quivr_core.rag.entities.config import RetrievalConfig
+from quivr_core.rag.entities.models import (
+    ParsedRAGChunkResponse,
+    ParsedRAGResponse,
+    QuivrKnowledge,
+    SearchResult,
+)
+from quivr_core.rag.pipeline_cache import PipelineCache
+from quivr_core.rag.quivr_rag import QuivrQARAG
+from quivr_core.rag.quivr_rag_langgraph import QuivrQARAGLangGraph
+
+logger = logging.getLogger("quivr_core")
+
+T = TypeVar("T")
+
+
+def _run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine to completion from sync code.
+
+    Called from a thread running an event loop, e.g. a sync LangChain runnable invoked in an async
+    application, the coroutine runs on a new event loop in a worker thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def similarity_fn(vector_db: VectorStore) -> Callable[[float], float]:
+    """
+    Function converting the scores of a vector store to a cosine similarity, comparable across vector stores.
+
+    FAISS indexes return squared L2 distances or inner products, and the in-memory store cosine similarities.
+    The conversions assume unit-norm embeddings, as OpenAI's. The other vector stores use their relevance
+    score function.
+    """
+    index = getattr(vector_db, "index", None)
+    if index is not None and hasattr(index, "metric_type"):
+        from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+        faiss = dependable_faiss_import()
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return float
+        # |a - b|^2 = 2 - 2 cos(a, b)
+        return lambda distance: 1.0 - float(distance) / 2
+    if isinstance(vector_db, InMemoryVectorStore):
+        return float
+    try:
+        return vector_db._select_relevance_score_fn()
+    except (NotImplementedError, ValueError):
+        logger.warning(
+            f"can't normalize the scores of {type(vector_db).__name__}, they are merged as distances"
+        )
+        return lambda distance: -float(distance)
+
+
+class BrainGroup:
+    """
+    A group of brains searched and asked as a single brain.
+
+    Searches fan out to the vector stores of all the brains concurrently. The scores of each vector store are
+    normalized to cosine similarities (see `similarity_fn`), and the best chunks of all the brains are merged.
+    A search waits at most `timeout` seconds for the brains: the results of the brains that didn't answer in
+    time are dropped, as well as those of the brains that failed, so that a slow or broken brain can't stall
+    the answer.
+
+    Merged results are copies of the chunks with the `brain_id` of their brain in their metadata, and their
+    cosine distance (1 - cosine similarity) as distance.
+
+    Args:
+        brains (list[Brain]): The brains of the group.
+        name (str): The name of the group.
+        llm (LLMEndpoint | None): The language model answering the questions. Defaults to the model of the first brain.
+        timeout (float | None): The default deadline of the searches in seconds, None to wait for all the brains.
+    """
+
+    def __init__(
+        self,
+        brains: list[Brain],
+        *,
+        name: str = "brain_group",
+        llm: LLMEndpoint | None = None,
+        timeout: float | None = None,
+    ):
+        if not brains:
+            raise ValueError("a brain group needs at least one brain")
+        self.id = uuid4()
+        self.name = name
+        self.brains = brains
+        self.llm = llm or brains[0].llm
+        self.timeout = timeout
+        self.default_chat = ChatHistory(chat_id=uuid4(), brain_id=self.id)
+        # Compiled RAG pipelines reused across questions
+        self.pipeline_cache = PipelineCache()
+        self._vector_stores: dict[float | None, FederatedVectorStore] = {}
+
+    @property
+    def chat_history(self) -> ChatHistory:
+        return self.default_chat
+
+    async def _fan_out(
+        self,
+        queries: list[str],
+        n_results: int,
+        filter: Callable | Dict[str, Any] | None,
+        fetch_n_neighbors: int,
+        timeout: float | None,
+    ) -> list[tuple[Brain, list[list[SearchResult]]]]:
+        tasks = {
+            asyncio.create_task(
+                brain.asearch_many(
+                    queries,
+                    n_results=n_results,
+                    filter=filter,
+                    fetch_n_neighbors=fetch_n_neighbors,
+                )
+            ): brain
+            for brain in self.brains
+            if brain.vector_db is not None
+        }
+        if not tasks:
+            raise ValueError("No vector db configured for the brains of this group")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+            logger.warning(
+                f"brain {tasks[task].id} didn't answer in {timeout}s, its results are dropped"
+            )
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        results = []
+        errors = []
+        for task in done:
+            if (error := task.exception()) is not None:
+                logger.warning(f"search of brain {tasks[task].id} failed: {error}")
+                errors.append(error)
+            else:
+                results.append((tasks[task], task.result()))
+        if errors and not results and not pending:
+            raise errors[0]
+        # NOTE: ordered as the brains, for a deterministic merge
+        order = {brain.id: i for i, brain in enumerate(self.brains)}
+        return sorted(results, key=lambda item: order[item[0].id])
+
+    async def asearch_many(
+        self,
+        queries: list[str | Document],
+        n_results: int = 5,
+        filter: Callable | Dict[str, Any] | None = None,
+        fetch_n_neighbors: int = 20,
+        timeout: float | None = None,
+    ) -> list[list[SearchResult]]:
+        """
+        Search for relevant documents in all the brains for several queries at once.
+
+        Args:
+            queries (list[str | Document]): The queries to search for.
+            n_results (int): The number of results to return per query.
+            filter (Callable | Dict[str, Any] | None): The filter to apply to the search of each brain.
+            fetch_n_neighbors (int): The number of neighbors to fetch before filtering.
+            timeout (float | None): The deadline of the search in seconds. Defaults to the timeout of the group.
+        Returns:
+            list[list[SearchResult]]: The best chunks of all the brains for each query.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        brain_results = await self._fan_out(
+            [q.page_content if isinstance(q, Document) else q for q in queries],
+            n_results,
+            filter,
+            fetch_n_neighbors,
+            timeout,
+        )
+
+        merged = []
+        for q in range(len(queries)):
+            candidates: list[tuple[float, int, Brain, Document]] = []
+            for brain, results in brain_results:
+                to_similarity = similarity_fn(brain.vector_db)  # type: ignore[arg-type]
+                for r in results[q]:
+                    candidates.append(
+                        (to_similarity(r.distance), len(candidates), brain, r.chunk)
+                    )
+            best = heapq.nlargest(n_results, candidates, key=lambda c: (c[0], -c[1]))
+            merged.append(
+                [
+                    SearchResult(
+                        chunk=Document(
+                            page_content=chunk.page_content,
+                            metadata={**chunk.metadata, "brain_id": brain.id},
+                        ),
+                        distance=1.0 - similarity,
+                    )
+                    for similarity, _, brain, chunk in best
+                ]
+            )
+        return merged
+
+    async def asearch(
+        self,
+        query: str | Document,
+        n_results: int = 5,
+        filter: Callable | Dict[str, Any] | None = None,
+        fetch_n_neighbors: int = 20,
+        timeout: float | None = None,
+    ) -> list[SearchResult]:
+        """
+        Search for relevant documents in all the brains.
+
+        Args:
+            query (str | Document): The query to search for.
+            n_results (int): The number of results to return.
+            filter (Callable | Dict[str, Any] | None): The filter to apply to the search of each brain.
+            fetch_n_neighbors (int): The number of neighbors to fetch before filtering.
+            timeout (float | None): The deadline of the search in seconds. Defaults to the timeout of the group.
+        Returns:
+            list[SearchResult]: The best chunks of all the brains.
+        Example:
+        ```python
+        group = BrainGroup([sales_brain, support_brain], timeout=2.0)
+        results = await group.asearch("What did the customer complain about?")
+        for result in results:
+            print(result.chunk.metadata["brain_id"], result.chunk.page_content)
+        ```
+        """
+        (results,) = await self.asearch_many(
+            [query],
+            n_results=n_results,
+            filter=filter,
+            fetch_n_neighbors=fetch_n_neighbors,
+            timeout=timeout,
+        )
+        return results
+
+    def as_vector_store(self, timeout: float | None = None) -> "FederatedVectorStore":
+        """Read-only vector store searching the brains of the group, for the RAG pipelines."""
+        vector_store = self._vector_stores.get(timeout)
+        if vector_store is None:
+            vector_store = self._vector_stores[timeout] = FederatedVectorStore(
+                self, timeout=timeout
+            )
+        return vector_store
+
+    async def ask_streaming(
+        self,
+        question: str,
+        retrieval_config: RetrievalConfig | None = None,
+        rag_pipeline: Type[Union[QuivrQARAG, QuivrQARAGLangGraph]] | None = None,
+        list_files: list[QuivrKnowledge] | None = None,
+        chat_history: ChatHistory | None = None,
+        timeout: float | None = None,
+    ) -> AsyncGenerator[ParsedRAGChunkResponse, ParsedRAGChunkResponse]:
+        """
+        Ask a question to the brains of the group and get a streamed generated answer.
+
+        The chunks are retrieved from all the brains, see `asearch`.
+        Args:
+            question (str): The question to ask.
+            retrieval_config (RetrievalConfig | None): The retrieval configuration (see RetrievalConfig docs).
+            rag_pipeline (Type[Union[QuivrQARAG, QuivrQARAGLangGraph]] | None): The RAG pipeline to use.
+            list_files (list[QuivrKnowledge] | None): The list of files to include in the RAG pipeline.
+            chat_history (ChatHistory | None): The chat history to use.
+            timeout (float | None): The deadline of each search in seconds. Defaults to the timeout of the group.
+        Returns:
+            AsyncGenerator[ParsedRAGChunkResponse, ParsedRAGChunkResponse]: The streamed generated answer.
+        """
+        llm = self.llm
+        if retrieval_config:
+            if retrieval_config.llm_config != self.llm.get_config():
+                llm = LLMEndpoint.from_config(config=retrieval_config.llm_config)
+        else:
+            retrieval_config = RetrievalConfig(llm_config=self.llm.get_config())
+
+        if rag_pipeline is None:
+            rag_pipeline = QuivrQARAGLangGraph
+
+        chat_history = self.default_chat if chat_history is None else chat_history
+        list_files = [] if list_files is None else list_files
+
+        full_answer = ""
+        rag_instance = self.pipeline_cache.get(
+            rag_pipeline, retrieval_config, llm, self.as_vector_store(timeout=timeout)
+        )
+        async for response in rag_instance.answer_astream(
+            question=question, history=chat_history, list_files=list_files
+        ):
+            if not response.last_chunk:
+                yield response
+            full_answer += response.answer
+
+        chat_history.append(HumanMessage(content=question))
+        chat_history.append(AIMessage(content=full_answer))
+        yield response
+
+    async def aask(
+        self,
+        question: str,
+        retrieval_config: RetrievalConfig | None = None,
+        rag_pipeline: Type[Union[QuivrQARAG, QuivrQARAGLangGraph]] | None = None,
+        list_files: list[QuivrKnowledge] | None = None,
+        chat_history: ChatHistory | None = None,
+        timeout: float | None = None,
+    ) -> ParsedRAGResponse:
+        """
+        Ask a question to the brains of the group and get a generated answer, see `ask_streaming`.
+        """
+        full_answer = ""
+        async for response in self.ask_streaming(
+            question=question,
+            retrieval_config=retrieval_config,
+            rag_pipeline=rag_pipeline,
+            list_files=list_files,
+            chat_history=chat_history,
+            timeout=timeout,
+        ):
+            full_answer += response.answer
+
+        return ParsedRAGResponse(answer=full_answer)
+
+
+class FederatedVectorStore(VectorStore):
+    """
+    Read-only vector store adapter of a `BrainGroup`, searching all its brains.
+
+    The brains may use different embedders: the queries are embedded by each brain, and `embeddings` is None.
+    The sync search methods run the async search of the group to completion.
+    """
+
+    def __init__(self, group: BrainGroup, timeout: float | None = None):
+        self.group = group
+        self.timeout = timeout
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return None
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: List[dict] | None = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        raise NotImplementedError("a brain group is read-only, add files to its brains")
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: List[dict] | None = None,
+        **kwargs: Any,
+    ) -> "FederatedVectorStore":
+        raise NotImplementedError("build a BrainGroup from brains")
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        return _run_sync(self.asimilarity_search_with_score(query, k, **kwargs))
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search_many_with_score(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filter: Callable | Dict[str, Any] | None = None,
+        fetch_k: int = 20,
+    ) -> List[List[tuple[Document, float]]]:
+        results = await self.group.asearch_many(
+            queries,  # type: ignore[arg-type]
+            n_results=k,
+            filter=filter,
+            fetch_n_neighbors=fetch_k,
+            timeout=self.timeout,
+        )
+        return [
+            [(r.chunk, r.distance) for r in query_results] for query_results in results
+        ]
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[tuple[Document, float]]:
+        (results,) = await self.asimilarity_search_many_with_score(
+            [query], k=k, filter=kwargs.get("filter"), fetch_k=kwargs.get("fetch_k", 20)
+        )
+        return results
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [
+            doc
+            for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)
+        ]
@@ -0,0 +1,378 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# Metadata keys specific to each chunk, the other keys are shared by the chunks of a file
+CHUNK_METADATA_KEYS = frozenset({"chunk_index", "chunk_size"})
+
+
+def _split_metadata(metadata: dict[str, Any]) -> tuple[dict[str, Any], dict[str, Any]]:
+    chunk_metadata = {}
+    shared_metadata = {}
+    for k, v in metadata.items():
+        if k in CHUNK_METADATA_KEYS:
+            chunk_metadata[k] = v
+        else:
+            shared_metadata[k] = v
+    return chunk_metadata, shared_metadata
+
+
+def _metadata_key(metadata: dict[str, Any]) -> Hashable:
+    items = []
+    for k, v in metadata.items():
+        try:
+            hash(v)
+        except TypeError:
+            # Processor configs (e.g. the splitter dict) are plain data: compared by value
+            v = ("__repr__", repr(v))
+        # NOTE: equal values of different types (1, 1.0 and True) are different metadata
+        items.append((k, type(v), v))
+    return tuple(sorted(items, key=lambda item: item[0]))
+
+
+class CompactDocstore(Docstore, AddableMixin):
+    """
+    In-memory docstore of the FAISS vector store storing chunk metadata compactly.
+
+    Chunks of the same file carry the same file-level and processor-level metadata (file id, path, sha1,
+    splitter config, ...). Instead of one full metadata dict per chunk, this metadata is interned once in a
+    table, and each chunk only keeps its text, its own metadata (`CHUNK_METADATA_KEYS`) and the id of its
+    table entry. Documents are expanded when they are returned by `search`, e.g. for search results.
+    The shared metadata values are not copied: expanded documents of a file reference the same objects.
+    Table entries are reference counted, and dropped with the last chunk referencing them.
+
+    This cuts the memory and the pickle size (see `FAISS.save_local`) of large vector stores.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: dict[str, tuple[str, dict[str, Any], int]] = {}
+        self._shared: dict[int, dict[str, Any]] = {}
+        self._shared_ids: dict[Hashable, int] = {}
+        # Number of chunks referencing each table entry
+        self._shared_counts: dict[int, int] = {}
+        self._next_ref = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def __getstate__(self):
+        return {"chunks": self._chunks, "shared": self._shared}
+
+    def __setstate__(self, state):
+        self._chunks = state["chunks"]
+        shared = state["shared"]
+        # NOTE: docstores saved before the entries were reference counted keep them in a list
+        if isinstance(shared, list):
+            shared = dict(enumerate(shared))
+        self._shared_counts = {}
+        for _, _, ref in self._chunks.values():
+            self._shared_counts[ref] = self._shared_counts.get(ref, 0) + 1
+        self._shared = {ref: shared[ref] for ref in self._shared_counts}
+        self._shared_ids = {_metadata_key(m): ref for ref, m in self._shared.items()}
+        self._next_ref = max(shared, default=-1) + 1
+
+    def _intern(self, metadata: dict[str, Any]) -> int:
+        key = _metadata_key(metadata)
+        ref = self._shared_ids.get(key)
+        if ref is None:
+            ref = self._next_ref
+            self._next_ref += 1
+            self._shared[ref] = metadata
+            self._shared_ids[key] = ref
+        self._shared_counts[ref] = self._shared_counts.get(ref, 0) + 1
+        return ref
+
+    def _release(self, ref: int) -> None:
+        self._shared_counts[ref] -= 1
+        if self._shared_counts[ref] == 0:
+            del self._shared_counts[ref]
+            metadata = self._shared.pop(ref)
+            self._shared_ids.pop(_metadata_key(metadata), None)
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = set(texts).intersection(self._chunks)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for id, doc in texts.items():
+            chunk_metadata, shared_metadata = _split_metadata(doc.metadata)
+            self._chunks[id] = (
+                doc.page_content,
+                chunk_metadata,
+                self._intern(shared_metadata),
+            )
+
+    def delete(self, ids: List) -> None:
+        overlapping = set(ids).intersection(self._chunks)
+        if not overlapping:
+            raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+        for id in ids:
+            chunk = self._chunks.pop(id, None)
+            if chunk is not None:
+                self._release(chunk[2])
+
+    def _expand(self, id: str) -> Document:
+        page_content, chunk_metadata, ref = self._chunks[id]
+        return Document(
+            page_content=page_content,
+            metadata={**self._shared[ref], **chunk_metadata},
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search not in self._chunks:
+            return f"ID {search} not found."
+        return self._expand(search)
+
+    def items(self) -> Iterator[tuple[str, Document]]:
+        """Iterate over the ids and expanded documents of the docstore."""
+        for id in self._chunks:
+            yield id, self._expand(id)
+
+    def metadatas(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Iterate over the ids and metadata of the chunks."""
+        for id, (_, chunk_metadata, ref) in self._chunks.items():
+            yield id, {**self._shared[ref], **chunk_metadata}
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """
+    Docstore of the FAISS vector store keeping the chunks in a SQLite file instead of Python objects.
+
+    Chunks are rows keyed by chunk id, with their text, their own metadata and a reference to the metadata
+    shared by the chunks of a file (interned as in `CompactDocstore`, and cached in memory). Searches only
+    read the rows of the requested ids, e.g. the top-k hits of a search, and chunks are added and deleted
+    in place. The shared metadata no longer referenced by a chunk is deleted with the chunks.
+
+    A new docstore writes to a temporary file, removed with the docstore. `save` copies the docstore to a
+    file, e.g. next to the FAISS index. A docstore opened read-only (see `open`) is copied to a temporary
+    file on its first modification, so that the saved file always matches the saved index.
+
+    Args:
+        path (Path | None): The SQLite file of the docstore. Defaults to a temporary file.
+        read_only (bool): Open the file read-only.
+    """
+
+    def __init__(self, path: Path | None = None, read_only: bool = False):
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self.path: Path | None = None
+        self.read_only = read_only
+        if path is None:
+            self._open_temporary()
+        else:
+            self.open(Path(path), read_only)
+
+    def _open_temporary(self) -> None:
+        fd, path = tempfile.mkstemp(prefix="quivr-docstore-", suffix=".sqlite")
+        os.close(fd)
+        self.open(Path(path), read_only=False)
+        weakref.finalize(self, _remove_file, path)
+
+    def open(self, path: Path, read_only: bool = True) -> None:
+        """Open the docstore saved in `path`."""
+        if self._conn is not None:
+            self._conn.close()
+        self.path = path
+        self.read_only = read_only
+        uri = f"file:{path}?mode=ro" if read_only else f"file:{path}"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        if not read_only:
+            self._create_tables()
+        self._load_shared()
+
+    def _create_tables(self) -> None:
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared (ref INTEGER PRIMARY KEY, metadata BLOB)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, page_content TEXT, metadata BLOB, ref INTEGER)"
+            )
+            # Looks up the chunks still referencing a shared metadata entry
+            self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_ref ON chunks (ref)")
+
+    def _load_shared(self) -> None:
+        self._shared: dict[int, dict[str, Any]] = {
+            ref: pickle.loads(metadata)
+            for ref, metadata in self.conn.execute("SELECT ref, metadata FROM shared")
+        }
+        self._shared_ids: dict[Hashable, int] = {
+            _metadata_key(m): ref for ref, m in self._shared.items()
+        }
+        self._next_ref = max(self._shared, default=-1) + 1
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            raise ValueError("the docstore is not opened")
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __getstate__(self):
+        # NOTE: the rows are saved by `save`, the pickle only keeps the location of the file
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.path = state["path"]
+        self.read_only = True
+
+    def _ensure_writable(self) -> None:
+        if not self.read_only:
+            return
+        source, self._conn = self.conn, None
+        self._open_temporary()
+        source.backup(self.conn)
+        source.close()
+        # NOTE: docstores saved before the shared metadata was reclaimed have no index on the refs
+        self._create_tables()
+        self._load_shared()
+
+    def save(self, path: Path) -> None:
+        """Copy the docstore to `path`."""
+        with self._lock:
+            if self.path is not None and path.exists() and path.samefile(self.path):
+                self.conn.commit()
+                return
+            if path.exists():
+                os.remove(path)
+            target = sqlite3.connect(path)
+            try:
+                self.conn.backup(target)
+            finally:
+                target.close()
+
+    def __len__(self) -> int:
+        (n,) = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return n
+
+    def _intern(self, metadata: dict[str, Any]) -> int:
+        key = _metadata_key(metadata)
+        ref = self._shared_ids.get(key)
+        if ref is None:
+            ref = self._next_ref
+            self._next_ref += 1
+            self.conn.execute(
+                "INSERT INTO shared VALUES (?, ?)",
+                (ref, pickle.dumps(metadata, protocol=pickle.HIGHEST_PROTOCOL)),
+            )
+            self._shared[ref] = metadata
+            self._shared_ids[key] = ref
+        return ref
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            self._ensure_writable()
+            with self.conn:
+                rows = []
+                for id, doc in texts.items():
+                    chunk_metadata, shared_metadata = _split_metadata(doc.metadata)
+                    rows.append(
+                        (
+                            id,
+                            doc.page_content,
+                            pickle.dumps(chunk_metadata),
+                            self._intern(shared_metadata),
+                        )
+                    )
+                try:
+                    self.conn.executemany(
+                        "INSERT INTO chunks VALUES (?, ?, ?, ?)", rows
+                    )
+                except sqlite3.IntegrityError as e:
+                    # The metadata interned by this batch was rolled back
+                    self.conn.rollback()
+                    self._load_shared()
+                    raise ValueError(f"Tried to add ids that already exist: {e}") from e
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._ensure_writable()
+            with self.conn:
+                refs = set()
+                for id in ids:
+                    row = self.conn.execute(
+                        "SELECT ref FROM chunks WHERE id = ?", (id,)
+                    ).fetchone()
+                    if row is not None:
+                        self.conn.execute("DELETE FROM chunks WHERE id = ?", (id,))
+                        refs.add(row[0])
+                if not refs:
+                    raise ValueError(f"Tried to delete ids that does not  exist: {ids}")
+                unused = [
+                    ref
+                    for ref in refs
+                    if self.conn.execute(
+                        "SELECT 1 FROM chunks WHERE ref = ? LIMIT 1", (ref,)
+                    ).fetchone()
+                    is None
+                ]
+                self.conn.executemany(
+                    "DELETE FROM shared WHERE ref = ?", [(ref,) for ref in unused]
+                )
+            for ref in unused:
+                metadata = self._shared.pop(ref)
+                self._shared_ids.pop(_metadata_key(metadata), None)
+
+    def _expand(self, page_content: str, metadata: bytes, ref: int) -> Document:
+        return Document(
+            page_content=page_content,
+            metadata={**self._shared[ref], **pickle.loads(metadata)},
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT page_content, metadata, ref FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._expand(*row)
+
+    def items(self) -> Iterator[tuple[str, Document]]:
+        """Iterate over the ids and documents of the docstore."""
+        rows = self.conn.execute("SELECT id, page_content, metadata, ref FROM chunks")
+        for id, page_content, metadata, ref in rows:
+            yield id, self._expand(page_content, metadata, ref)
+
+    def metadatas(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Iterate over the ids and metadata of the chunks, without reading their text."""
+        for id, metadata, ref in self.conn.execute(
+            "SELECT id, metadata, ref FROM chunks"
+        ):
+            yield id, {**self._shared[ref], **pickle.loads(metadata)}
+
+
+def iter_metadatas(docstore: Any) -> Iterator[tuple[str, dict[str, Any]]] | None:
+    """
+    Iterate over the ids and metadata of the chunks of a FAISS docstore.
+
+    Returns:
+        Iterator[tuple[str, dict[str, Any]]] | None: The ids and metadata, or None if the docstore can't be listed.
+    """
+    if isinstance(docstore, (CompactDocstore, SQLiteDocstore)):
+        return docstore.metadatas()
+    if hasattr(docstore, "_dict"):
+        # The default langchain docstore
+        return ((id, doc.metadata) for id, doc in docstore._dict.items())
+    return None
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
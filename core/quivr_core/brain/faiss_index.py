@@ -0,0 +1,778 @@
+import logging
+import operator
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from uuid import uuid4
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.runnables.config import run_in_executor
+
+from quivr_core.brain.docstore import SQLiteDocstore, iter_metadatas
+from quivr_core.brain.metadata_index import MetadataIndex
+from quivr_core.rag.entities.config import FAISSIndexConfig, FAISSIndexType
+
+logger = logging.getLogger("quivr_core")
+
+# Number of training points per IVF cell recommended by FAISS
+_MIN_POINTS_PER_CELL = 39
+# Fraction of deleted vectors an HNSW index keeps before it's rebuilt without them
+_MAX_DELETED_RATIO = 0.5
+
+
+def needs_training(config: FAISSIndexConfig) -> bool:
+    return config.index_type in (
+        FAISSIndexType.IVF_FLAT,
+        FAISSIndexType.IVF_PQ,
+        FAISSIndexType.SQ_INT8,
+    )
+
+
+def _factory_string(dim: int, config: FAISSIndexConfig, n_train: int) -> str:
+    index_type = config.index_type
+    if index_type == FAISSIndexType.IVF_PQ and n_train < 2**config.pq_nbits:
+        logger.warning(
+            f"{n_train} vectors are not enough to train a PQ index, falling back to an IVF-Flat index"
+        )
+        index_type = FAISSIndexType.IVF_FLAT
+
+    nlist = max(1, min(config.nlist, n_train // _MIN_POINTS_PER_CELL))
+    match index_type:
+        case FAISSIndexType.FLAT:
+            description = "Flat"
+        case FAISSIndexType.IVF_FLAT:
+            description = f"IVF{nlist},Flat"
+        case FAISSIndexType.IVF_PQ:
+            if dim % config.pq_m != 0:
+                raise ValueError(
+                    f"pq_m={config.pq_m} doesn't divide the embedding dimension {dim}"
+                )
+            description = f"IVF{nlist},PQ{config.pq_m}x{config.pq_nbits}"
+        case FAISSIndexType.HNSW:
+            description = f"HNSW{config.hnsw_m}"
+        case FAISSIndexType.SQ_FP16:
+            description = "SQfp16"
+        case FAISSIndexType.SQ_INT8:
+            description = "SQ8"
+
+    if config.rerank_factor > 0 and index_type != FAISSIndexType.FLAT:
+        description += ",RFlat"
+    return description
+
+
+def build_faiss_index(
+    dim: int, config: FAISSIndexConfig, train_vectors: np.ndarray | None = None
+) -> Any:
+    """
+    Build an empty FAISS index of the configured type, trained on a sample of `train_vectors` if needed.
+
+    Args:
+        dim (int): The dimension of the vectors.
+        config (FAISSIndexConfig): The type and parameters of the index.
+        train_vectors (np.ndarray | None): The vectors to sample the training set from.
+    Returns:
+        faiss.Index: The index, ready to add vectors to.
+    Raises:
+        ValueError: If the index needs training and there are no training vectors.
+    """
+    faiss = dependable_faiss_import()
+    n_train = len(train_vectors) if train_vectors is not None else 0
+    if needs_training(config) and n_train == 0:
+        raise ValueError(f"a {config.index_type.value} index needs training vectors")
+
+    index = faiss.index_factory(dim, _factory_string(dim, config, n_train))
+    if config.index_type == FAISSIndexType.HNSW:
+        _base_index(index).hnsw.efConstruction = config.ef_construction
+    if not index.is_trained:
+        assert train_vectors is not None
+        if n_train > config.train_size:
+            sample = np.random.default_rng(0).choice(
+                n_train, config.train_size, replace=False
+            )
+            train_vectors = train_vectors[np.sort(sample)]
+        index.train(train_vectors)
+
+    set_search_params(index, config)
+    return index
+
+
+def _base_index(index: Any) -> Any:
+    faiss = dependable_faiss_import()
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexRefine):
+        return faiss.downcast_index(index.base_index)
+    return index
+
+
+def set_search_params(index: Any, config: FAISSIndexConfig) -> None:
+    """Apply the query-time parameters of `config` (nprobe, efSearch, re-ranking factor) to the index."""
+    faiss = dependable_faiss_import()
+    refine = faiss.downcast_index(index)
+    if isinstance(refine, faiss.IndexRefine) and config.rerank_factor > 0:
+        refine.k_factor = config.rerank_factor
+
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        base.nprobe = config.nprobe
+    elif isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = config.ef_search
+
+
+def _search_parameters(index: Any, config: FAISSIndexConfig, selector: Any) -> Any:
+    """Search parameters of the index restricting the search to the vectors of `selector`."""
+    faiss = dependable_faiss_import()
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=config.nprobe)
+    elif isinstance(base, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=config.ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+
+    refine = faiss.downcast_index(index)
+    if isinstance(refine, faiss.IndexRefine):
+        base_params = params
+        params = faiss.IndexRefineSearchParameters(
+            sel=selector, k_factor=refine.k_factor, base_index_params=base_params
+        )
+        # NOTE: the base parameters are referenced by pointer, they must outlive the search
+        params._base_params = base_params
+    return params
+
+
+def reconstruct_vectors(index: Any, positions: np.ndarray) -> np.ndarray:
+    """Read back the (possibly quantized) vectors stored at `positions` in the index."""
+    faiss = dependable_faiss_import()
+    if len(positions) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(index)
+    # NOTE: IVF indexes can only reconstruct vectors through a direct map, built for the call
+    if ivf is None or ivf.direct_map.type != faiss.DirectMap.NoMap:
+        return index.reconstruct_batch(positions)
+    ivf.make_direct_map(True)
+    try:
+        return index.reconstruct_batch(positions)
+    finally:
+        ivf.make_direct_map(False)
+
+
+def supports_remove_ids(index: Any) -> bool:
+    """Whether vectors can be removed from the index, which HNSW graphs don't support."""
+    faiss = dependable_faiss_import()
+    return not isinstance(_base_index(index), faiss.IndexHNSW)
+
+
+def remove_vectors(index: Any, positions: np.ndarray) -> None:
+    """Remove the vectors at `positions` from the index, renumbering the remaining vectors from 0."""
+    faiss = dependable_faiss_import()
+    assert supports_remove_ids(index)
+    ntotal = index.ntotal
+    selector = faiss.IDSelectorBatch(positions)
+    base = _base_index(index)
+    ivf = faiss.try_extract_index_ivf(base)
+    if ivf is not None:
+        # NOTE: the direct map built for the filtered searches doesn't support removals
+        ivf.make_direct_map(False)
+    base.remove_ids(selector)
+    if ivf is not None:
+        # NOTE: IVF indexes keep the ids of the remaining vectors, unlike the flat ones
+        kept = np.ones(ntotal, dtype=bool)
+        kept[positions] = False
+        new_ids = np.cumsum(kept) - 1
+        invlists = ivf.invlists
+        for list_no in range(ivf.nlist):
+            size = invlists.list_size(list_no)
+            if size == 0:
+                continue
+            ptr = invlists.get_ids(list_no)
+            ids = faiss.rev_swig_ptr(ptr, size)
+            ids[:] = new_ids[ids]
+            invlists.release_ids(list_no, ptr)
+
+    refine = faiss.downcast_index(index)
+    if isinstance(refine, faiss.IndexRefine):
+        # The re-ranking index doesn't implement remove_ids, its two indexes do
+        faiss.downcast_index(refine.refine_index).remove_ids(selector)
+        refine.ntotal = base.ntotal
+
+
+class QuivrFAISS(FAISS):
+    """
+    FAISS vector store with a configurable index type (see `FAISSIndexConfig`).
+
+    Indexes that need training (IVF, scalar quantization) are built once `train_size` vectors were added:
+    until then, the vectors are buffered and the index is trained on them. `flush` builds the index from
+    the buffered vectors, and is called before any search, deletion or save.
+
+    Deleted chunks are removed from the index, except from HNSW graphs which don't support it: their vectors
+    stay in the graph, skipped by the searches, until `purge_deleted` rebuilds the index without them in O(n).
+    It is called on `save_local`, and once more than half of the vectors are deleted.
+
+    A store loaded with `load_local(..., mmap=True)` memory-maps its index read-only and is copied in memory
+    on its first modification. With `lazy_docstore=True`, the docstore is unpickled on first access.
+    A `SQLiteDocstore` is saved next to the index and only its rows are read on demand.
+
+    Searches filtered on the file-level metadata (e.g. `{"qfile_id": ...}`) are pre-filtered: the filter is
+    resolved to the matching chunks with a `MetadataIndex`, and the search only visits these chunks, exactly
+    if there are at most `filter_exact_max` of them, with a FAISS `IDSelector` otherwise. The other filters
+    are applied to the `fetch_k` nearest chunks. `similarity_search_with_score_by_vectors` searches several
+    queries with a single search of the index.
+
+    Args:
+        index_config (FAISSIndexConfig | None): The type and parameters of the index. Defaults to a flat index.
+    """
+
+    # Set by `load_local`
+    _index_path: Path | None = None
+    _mmapped: bool = False
+    _docstore_path: Path | None = None
+
+    def __init__(
+        self,
+        embedding_function: Any,
+        index: Any,
+        docstore: Any,
+        index_to_docstore_id: dict[int, str],
+        index_config: FAISSIndexConfig | None = None,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            embedding_function, index, docstore, index_to_docstore_id, **kwargs
+        )
+        self.index_config = index_config or FAISSIndexConfig()
+        # Batches of (texts, vectors, metadatas, ids) added before the index is trained
+        self._pending: list[tuple[list[str], np.ndarray, list[dict], list[str]]] = []
+        if index is not None:
+            set_search_params(index, self.index_config)
+        # Duration of the phases of `load_local` in seconds
+        self.load_timings: dict[str, float] = {}
+        # Built on the first filtered search
+        self._metadata_index: MetadataIndex | None = None
+        # Positions of the deleted chunks still in an HNSW index
+        self._deleted: set[int] = set()
+
+    @property  # type: ignore[override]
+    def docstore(self) -> Any:
+        if self._docstore is None and self._docstore_path is not None:
+            self._load_docstore()
+        return self._docstore
+
+    @docstore.setter
+    def docstore(self, docstore: Any) -> None:
+        self._docstore = docstore
+
+    @property  # type: ignore[override]
+    def index_to_docstore_id(self) -> dict[int, str]:
+        if self._index_to_docstore_id is None and self._docstore_path is not None:
+            self._load_docstore()
+        return self._index_to_docstore_id
+
+    @index_to_docstore_id.setter
+    def index_to_docstore_id(self, index_to_docstore_id: dict[int, str]) -> None:
+        self._index_to_docstore_id = index_to_docstore_id
+
+    def _load_docstore(self) -> None:
+        assert self._docstore_path is not None
+        start = time.perf_counter()
+        with open(self._docstore_path, "rb") as f:
+            self._docstore, self._index_to_docstore_id = pickle.load(f)
+        if isinstance(self._docstore, SQLiteDocstore):
+            # NOTE: opened read-only, the saved file is copied on the first modification
+            self._docstore.open(self._docstore_path.with_suffix(".sqlite"))
+        self._docstore_path = None
+        self.load_timings["docstore"] = time.perf_counter() - start
+        logger.debug(f"loaded docstore in {self.load_timings['docstore']:.3f}s")
+
+    @classmethod
+    def load_local(  # type: ignore[override]
+        cls,
+        folder_path: str,
+        embeddings: Any,
+        index_name: str = "index",
+        *,
+        allow_dangerous_deserialization: bool = False,
+        mmap: bool = False,
+        lazy_docstore: bool = False,
+        **kwargs: Any,
+    ) -> "QuivrFAISS":
+        """
+        Load a vector store saved with `save_local`.
+
+        Args:
+            folder_path (str): The folder of the vector store.
+            embeddings (Embeddings): The embeddings used for the queries.
+            index_name (str): The name of the index and docstore files.
+            allow_dangerous_deserialization (bool): Must be True: the docstore is a pickle file.
+            mmap (bool): Memory-map the index read-only instead of reading it, where the index type supports it.
+                         Processes loading the same index share the page cache.
+            lazy_docstore (bool): Unpickle the docstore on first access instead of now.
+            **kwargs: The arguments of the `QuivrFAISS` constructor, e.g. `index_config`.
+        Returns:
+            QuivrFAISS: The vector store, with the duration of the load phases in `load_timings`.
+        """
+        if not allow_dangerous_deserialization:
+            raise ValueError(
+                "The docstore is a pickle file: set `allow_dangerous_deserialization` to True "
+                "to load a vector store you trust."
+            )
+        faiss = dependable_faiss_import()
+        path = Path(folder_path)
+        index_path = path / f"{index_name}.faiss"
+        docstore_path = path / f"{index_name}.pkl"
+
+        start = time.perf_counter()
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(str(index_path), flags)
+        index_time = time.perf_counter() - start
+
+        vector_db = cls(embeddings, index, None, None, **kwargs)  # type: ignore[arg-type]
+        vector_db._index_path = index_path
+        vector_db._mmapped = mmap
+        vector_db.load_timings["index"] = index_time
+        vector_db._docstore_path = docstore_path
+        if not lazy_docstore:
+            vector_db._load_docstore()
+        return vector_db
+
+    def _ensure_writable(self) -> None:
+        if not self._mmapped:
+            return
+        faiss = dependable_faiss_import()
+        # NOTE: the mapped index is read-only, the modifications go to a private copy
+        assert self._index_path is not None
+        self.index = faiss.read_index(str(self._index_path))
+        set_search_params(self.index, self.index_config)
+        self._mmapped = False
+        logger.debug(f"copied the memory-mapped index {self._index_path} in memory")
+
+    def remap(self, folder_path: str, index_name: str = "index") -> None:
+        """
+        Read the files the store was loaded from in the copy saved in `folder_path` by `save_local`, e.g.
+        before the loaded files are removed.
+
+        The memory-mapped index, the docstore not yet loaded and the read-only SQLite docstore are reopened
+        from the copy. A store without loaded files is unchanged.
+        """
+        path = Path(folder_path)
+        if self._index_path is None:
+            return
+        self._index_path = path / f"{index_name}.faiss"
+        if self._mmapped:
+            faiss = dependable_faiss_import()
+            # NOTE: a mapped index is never modified, the saved copy is the same index
+            self.index = faiss.read_index(
+                str(self._index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+            set_search_params(self.index, self.index_config)
+        if self._docstore_path is not None:
+            self._docstore_path = path / f"{index_name}.pkl"
+        elif isinstance(self._docstore, SQLiteDocstore) and self._docstore.read_only:
+            self._docstore.open(path / f"{index_name}.sqlite")
+
+    @property
+    def n_pending(self) -> int:
+        return sum(len(vectors) for _, vectors, _, _ in self._pending)
+
+    def set_search_params(
+        self,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank_factor: int | None = None,
+    ) -> None:
+        """Tune the speed/recall trade-off of the searches."""
+        updates = {
+            k: v
+            for k, v in {
+                "nprobe": nprobe,
+                "ef_search": ef_search,
+                "rerank_factor": rerank_factor,
+            }.items()
+            if v is not None
+        }
+        self.index_config = self.index_config.model_copy(update=updates)
+        if self.index is not None:
+            set_search_params(self.index, self.index_config)
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        if self.index is not None:
+            self._ensure_writable()
+            metadatas = list(metadatas) if metadatas is not None else None
+            start = self.index.ntotal
+            # NOTE: FAISS numbers the added chunks from the number of chunks, less than the number of
+            # vectors once chunks are deleted from an HNSW index
+            index_to_docstore_id = self.index_to_docstore_id
+            self.index_to_docstore_id = {}
+            try:
+                ids = super().add_embeddings(text_embeddings, metadatas, ids, **kwargs)
+            finally:
+                added = self.index_to_docstore_id
+                self.index_to_docstore_id = index_to_docstore_id
+            index_to_docstore_id.update({start + j: id for j, id in added.items()})
+            if self._metadata_index is not None:
+                for j in range(len(ids)):
+                    self._metadata_index.add(
+                        start + j, metadatas[j] if metadatas is not None else {}
+                    )
+            return ids
+
+        text_embeddings = list(text_embeddings)
+        texts = [t for t, _ in text_embeddings]
+        vectors = [v for _, v in text_embeddings]
+        ids = ids or [str(uuid4()) for _ in texts]
+        self._pending.append(
+            (
+                list(texts),
+                np.asarray(vectors, dtype=np.float32),
+                list(metadatas) if metadatas is not None else [{} for _ in texts],
+                list(ids),
+            )
+        )
+        if self.n_pending >= self.index_config.train_size:
+            self.flush()
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas, ids)
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = await self._aembed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas, ids)
+
+    def flush(self) -> None:
+        """Train the index on the buffered vectors and add them to it."""
+        if not self._pending:
+            return
+        vectors = np.concatenate([v for _, v, _, _ in self._pending])
+        self.index = build_faiss_index(vectors.shape[1], self.index_config, vectors)
+        self._metadata_index = None
+        pending, self._pending = self._pending, []
+        for texts, batch_vectors, metadatas, ids in pending:
+            super().add_embeddings(
+                zip(texts, batch_vectors.tolist()), metadatas=metadatas, ids=ids
+            )
+
+    def _filter_positions(
+        self, filter: Optional[Union[Callable, Dict[str, Any]]]
+    ) -> np.ndarray | None:
+        """Positions in the index of the chunks matching the filter, None if it can't be pre-filtered."""
+        if not isinstance(filter, dict) or not self.build_metadata_index():
+            return None
+        assert self._metadata_index is not None
+        return self._metadata_index.resolve(filter)
+
+    def build_metadata_index(self) -> bool:
+        """
+        Build the `MetadataIndex` pre-filtering the searches, if not built yet. It is otherwise built on the
+        first filtered search.
+
+        Returns:
+            bool: False if the docstore doesn't support listing the chunk metadata.
+        """
+        if self._metadata_index is None:
+            metadatas = iter_metadatas(self.docstore)
+            if metadatas is None:
+                return False
+            positions = {id: i for i, id in self.index_to_docstore_id.items()}
+            self._metadata_index = MetadataIndex.from_metadatas(
+                (positions[id], metadata) for id, metadata in metadatas
+            )
+            faiss = dependable_faiss_import()
+            ivf = faiss.try_extract_index_ivf(self.index)
+            if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+                # NOTE: IVF indexes need a direct map to read back the filtered vectors
+                ivf.make_direct_map(True)
+        return True
+
+    def _search_positions(
+        self, vectors: np.ndarray, k: int, positions: np.ndarray
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Search the `k` nearest neighbors of each of `vectors` among the vectors at `positions` in the index."""
+        faiss = dependable_faiss_import()
+        if len(positions) > self.index_config.filter_exact_max:
+            selector = faiss.IDSelectorBatch(positions)
+            params = _search_parameters(self.index, self.index_config, selector)
+            scores, indices = self.index.search(vectors, k, params=params)
+            found = indices != -1
+            if (found.sum(axis=1) >= min(k, len(positions))).all():
+                return [(s[f], i[f]) for s, i, f in zip(scores, indices, found)]
+            # NOTE: graph searches (HNSW) can miss the selected vectors, fall back to an exact search
+
+        inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        block_size = max(self.index_config.filter_exact_max, 1)
+        scores = np.empty((len(vectors), len(positions)), dtype=np.float32)
+        for start in range(0, len(positions), block_size):
+            block = positions[start : start + block_size]
+            block_vectors = reconstruct_vectors(self.index, block)
+            if inner_product:
+                scores[:, start : start + len(block)] = vectors @ block_vectors.T
+                continue
+            # NOTE: one query at a time: the differences are exact, unlike the expanded product
+            for q, vector in enumerate(vectors):
+                scores[q, start : start + len(block)] = (
+                    (block_vectors - vector) ** 2
+                ).sum(axis=1)
+        order = np.argsort(-scores if inner_product else scores, axis=1, kind="stable")
+        return [
+            (scores[q, order[q, :k]], positions[order[q, :k]])
+            for q in range(len(vectors))
+        ]
+
+    def _read_hits(
+        self, results: list[tuple[np.ndarray, np.ndarray]]
+    ) -> list[list[Tuple[str, Document, float]]]:
+        """Read the ids and documents of the search results, once per chunk hit by several queries."""
+        docs: dict[int, Document] = {}
+        hits = []
+        for scores, indices in results:
+            row = []
+            for score, i in zip(scores, indices):
+                _id = self.index_to_docstore_id[int(i)]
+                doc = docs.get(int(i))
+                if doc is None:
+                    found = self.docstore.search(_id)
+                    if not isinstance(found, Document):
+                        raise ValueError(
+                            f"Could not find document for id {_id}, got {found}"
+                        )
+                    doc = docs[int(i)] = found
+                row.append((_id, doc, score))
+            hits.append(row)
+        return hits
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search the chunks most similar to each of the query vectors, with a single search of the index.
+
+        The chunks hit by several queries are read once from the docstore, and shared by their results.
+
+        Args:
+            embeddings (List[List[float]]): The query vectors.
+            k (int): The number of chunks returned per query.
+            filter (Callable | Dict[str, Any] | None): Filter by metadata, see `similarity_search_with_score_by_vector`.
+            fetch_k (int): The number of chunks fetched per query before applying the filters not pre-filtered.
+            **kwargs: `score_threshold` on the returned scores.
+        Returns:
+            List[List[Tuple[Document, float]]]: The chunks and their scores, for each query.
+        """
+        hits = self.similarity_search_with_ids_by_vectors(
+            embeddings, k, filter, fetch_k, **kwargs
+        )
+        return [[(d, s) for _, d, s in row] for row in hits]
+
+    def similarity_search_with_ids_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[str, Document, float]]]:
+        """Same as `similarity_search_with_score_by_vectors`, returning the chunk ids with the chunks."""
+        self.flush()
+        if self.index is None or not embeddings:
+            return [[] for _ in embeddings]
+
+        faiss = dependable_faiss_import()
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        positions = self._filter_positions(filter) if filter is not None else None
+        if positions is not None:
+            results = self._search_positions(vectors, k, positions)
+        elif self._deleted:
+            deleted = faiss.IDSelectorBatch(np.fromiter(self._deleted, dtype=np.int64))
+            selector = faiss.IDSelectorNot(deleted)
+            params = _search_parameters(self.index, self.index_config, selector)
+            scores, indices = self.index.search(
+                vectors, k if filter is None else fetch_k, params=params
+            )
+            results = [(s[i != -1], i[i != -1]) for s, i in zip(scores, indices)]
+        else:
+            scores, indices = self.index.search(
+                vectors, k if filter is None else fetch_k
+            )
+            # NOTE: -1 when not enough chunks are returned
+            results = [(s[i != -1], i[i != -1]) for s, i in zip(scores, indices)]
+        hits = self._read_hits(results)
+
+        if filter is not None and positions is None:
+            filter_func = self._create_filter_func(filter)
+            hits = [[h for h in row if filter_func(h[1].metadata)] for row in hits]
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy
+                in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            hits = [[h for h in row if cmp(h[2], score_threshold)] for row in hits]
+        return [row[:k] for row in hits]
+
+    async def asimilarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        return await run_in_executor(
+            None,
+            self.similarity_search_with_score_by_vectors,
+            embeddings,
+            k=k,
+            filter=filter,
+            fetch_k=fetch_k,
+            **kwargs,
+        )
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        (docs,) = self.similarity_search_with_score_by_vectors(
+            [embedding], k, filter=filter, fetch_k=fetch_k, **kwargs
+        )
+        return docs
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self, embedding: List[float], *args: Any, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        self.flush()
+        if self.index is None:
+            return []
+        # NOTE: the MMR search of FAISS can't skip the deleted chunks
+        self.purge_deleted()
+        return super().max_marginal_relevance_search_with_score_by_vector(
+            embedding, *args, **kwargs
+        )
+
+    def save_local(self, folder_path: str, index_name: str = "index") -> None:
+        self.flush()
+        self.purge_deleted()
+        index_path = Path(folder_path) / f"{index_name}.faiss"
+        if (
+            self._mmapped
+            and index_path.exists()
+            and index_path.samefile(self._index_path)  # type: ignore[arg-type]
+        ):
+            # Overwriting a mapped file would corrupt the mapping
+            self._ensure_writable()
+        if isinstance(self.docstore, SQLiteDocstore):
+            Path(folder_path).mkdir(exist_ok=True, parents=True)
+            self.docstore.save(Path(folder_path) / f"{index_name}.sqlite")
+        super().save_local(folder_path, index_name)
+
+    def merge_from(self, target: FAISS) -> None:
+        self.flush()
+        self.purge_deleted()
+        self._ensure_writable()
+        if isinstance(target, QuivrFAISS):
+            target.flush()
+            target.purge_deleted()
+        faiss = dependable_faiss_import()
+        if (ivf := faiss.try_extract_index_ivf(self.index)) is not None:
+            # IVF indexes with a direct map can't be merged
+            ivf.make_direct_map(False)
+        super().merge_from(target)
+        self._metadata_index = None
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        self.flush()
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        reversed_index = {id_: i for i, id_ in self.index_to_docstore_id.items()}
+        missing_ids = set(ids).difference(reversed_index)
+        if missing_ids:
+            raise ValueError(
+                f"Some specified ids do not exist in the current store. Ids not found: {missing_ids}"
+            )
+        positions = np.array(
+            sorted({reversed_index[id_] for id_ in ids}), dtype=np.int64
+        )
+        self._metadata_index = None
+
+        if not supports_remove_ids(self.index):
+            # NOTE: the vectors stay in the graph, the searches skip them until they're purged
+            self._deleted.update(positions.tolist())
+            for i in positions:
+                del self.index_to_docstore_id[int(i)]
+            self.docstore.delete(ids)
+            if len(self._deleted) > _MAX_DELETED_RATIO * self.index.ntotal:
+                self.purge_deleted()
+            return True
+
+        self._ensure_writable()
+        remove_vectors(self.index, positions)
+        self.docstore.delete(ids)
+        removed = set(positions.tolist())
+        remaining_ids = [
+            id_
+            for i, id_ in sorted(self.index_to_docstore_id.items())
+            if i not in removed
+        ]
+        self.index_to_docstore_id = dict(enumerate(remaining_ids))
+        return True
+
+    def purge_deleted(self) -> None:
+        """Rebuild an HNSW index without the vectors of its deleted chunks, in O(n)."""
+        if not self._deleted:
+            return
+        faiss = dependable_faiss_import()
+        self._ensure_writable()
+        kept = np.array(sorted(self.index_to_docstore_id), dtype=np.int64)
+        logger.debug(
+            f"rebuilding the {self.index_config.index_type.value} index without {len(self._deleted)} vectors"
+        )
+
+        index = faiss.clone_index(self.index)
+        index.reset()
+        if len(kept) > 0:
+            index.add(reconstruct_vectors(self.index, kept))
+        set_search_params(index, self.index_config)
+
+        self.index = index
+        self.index_to_docstore_id = {
+            i: self.index_to_docstore_id[int(old)] for i, old in enumerate(kept)
+        }
+        self._deleted = set()
+        self._metadata_index = None
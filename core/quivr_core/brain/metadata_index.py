@@ -0,0 +1,93 @@
+from array import array
+from typing import Any, Hashable, Iterable
+
+import numpy as np
+
+from quivr_core.brain.docstore import (
+    CHUNK_METADATA_KEYS,
+    _metadata_key,
+    _split_metadata,
+)
+
+
+class MetadataIndex:
+    """
+    Inverted index of the chunk metadata of a FAISS vector store, resolving metadata filters to the positions
+    of the matching chunks in the FAISS index.
+
+    Chunks are grouped by their shared metadata (see `CompactDocstore`): chunks of the same file carry the
+    same file id, name, sha1, additional metadata... The index maps each hashable (key, value) of the shared
+    metadata to its groups, and each group to the positions of its chunks. Its size is one integer per chunk
+    plus one entry per file and metadata key.
+
+    Filters follow the semantics of the FAISS vector store: a dict of metadata keys to a value, or to a list
+    of accepted values, all of which must match.
+    """
+
+    def __init__(self) -> None:
+        self._group_ids: dict[Hashable, int] = {}
+        self._positions: list[array] = []
+        self._postings: dict[str, dict[Hashable, list[int]]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(positions) for positions in self._positions)
+
+    @classmethod
+    def from_metadatas(
+        cls, metadatas: Iterable[tuple[int, dict[str, Any]]]
+    ) -> "MetadataIndex":
+        """Build the index of the (position, metadata) of the chunks."""
+        index = cls()
+        for position, metadata in metadatas:
+            index.add(position, metadata)
+        return index
+
+    def add(self, position: int, metadata: dict[str, Any]) -> None:
+        """Index the chunk at `position` in the FAISS index."""
+        _, shared_metadata = _split_metadata(metadata)
+        key = _metadata_key(shared_metadata)
+        group = self._group_ids.get(key)
+        if group is None:
+            group = len(self._positions)
+            self._group_ids[key] = group
+            self._positions.append(array("q"))
+            for k, v in shared_metadata.items():
+                try:
+                    self._postings.setdefault(k, {}).setdefault(v, []).append(group)
+                except TypeError:
+                    # NOTE: unhashable values (e.g. processor configs) are not indexed
+                    continue
+        self._positions[group].append(position)
+
+    def resolve(self, filter: dict[str, Any]) -> np.ndarray | None:
+        """
+        Resolve a filter to the sorted positions of the matching chunks.
+
+        Returns:
+            np.ndarray | None: The positions, or None if the filter can't be resolved by the index (filter on
+            chunk-level metadata, unhashable or None values, empty filter).
+        """
+        groups: set[int] | None = None
+        for key, value in filter.items():
+            values = value if isinstance(value, list) else [value]
+            if key in CHUNK_METADATA_KEYS or any(v is None for v in values):
+                # NOTE: None also matches the chunks without the key, which aren't indexed
+                return None
+            postings = self._postings.get(key, {})
+            matched: set[int] = set()
+            for v in values:
+                try:
+                    matched.update(postings.get(v, ()))
+                except TypeError:
+                    return None
+            groups = matched if groups is None else groups & matched
+
+        if groups is None:
+            return None
+        if not groups:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(
+            np.concatenate(
+                [np.frombuffer(self._positions[g], dtype=np.int64) for g in groups]
+            )
+        )
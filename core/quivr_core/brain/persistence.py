@@ -0,0 +1,297 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from quivr_core.brain.faiss_index import QuivrFAISS, reconstruct_vectors
+from quivr_core.brain.serialization import BrainManifest, SegmentInfo
+from quivr_core.rag.entities.config import FAISSIndexConfig
+from quivr_core.rag.entities.models import ChatMessage
+
+logger = logging.getLogger("quivr_core")
+
+MANIFEST_FILE = "manifest.json"
+SEGMENTS_DIR = "segments"
+# Number of segments from which a save compacts them into a single base segment
+MAX_SEGMENTS = 8
+# Fraction of deleted chunks from which a save compacts the segments
+MAX_DELETED_RATIO = 0.25
+
+_CHUNK_IDS_FILE = "chunk_ids.json"
+
+
+def read_manifest(brain_path: Path) -> BrainManifest | None:
+    try:
+        with open(brain_path / MANIFEST_FILE, "r") as f:
+            return BrainManifest.model_validate_json(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _fsync(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_tree(path: Path) -> None:
+    for child in path.iterdir():
+        if child.is_file():
+            _fsync(child)
+    _fsync(path)
+
+
+def publish_manifest(brain_path: Path, manifest: BrainManifest) -> None:
+    """Replace the manifest of the brain atomically: a crash leaves either the old or the new manifest."""
+    tmp_path = brain_path / f"{MANIFEST_FILE}.{uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(manifest.model_dump_json())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, brain_path / MANIFEST_FILE)
+    except BaseException:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+        raise
+    _fsync(brain_path)
+
+
+def _new_segment_path(brain_path: Path, generation: int, kind: str) -> Path:
+    segments_path = brain_path / SEGMENTS_DIR
+    if not segments_path.exists():
+        segments_path.mkdir(parents=True, exist_ok=True)
+        _fsync(brain_path)
+    path = segments_path / f"{generation:06d}-{kind}-{uuid4().hex[:8]}"
+    path.mkdir()
+    # NOTE: the entry of the segment must be durable before a manifest references it
+    _fsync(segments_path)
+    return path
+
+
+def saved_chunk_ids(brain_path: Path, manifest: BrainManifest) -> set[str]:
+    """Ids of the chunks of a saved brain, read without loading its vector store."""
+    ids: set[str] = set()
+    for segment in manifest.segments:
+        with open(brain_path / segment.path / _CHUNK_IDS_FILE, "r") as f:
+            ids.update(json.load(f))
+    ids.difference_update(manifest.deleted_chunk_ids)
+    return ids
+
+
+def _ordered_chunk_ids(vector_db: Any) -> list[str]:
+    return [id for _, id in sorted(vector_db.index_to_docstore_id.items())]
+
+
+def _write_base_segment(
+    brain_path: Path, generation: int, vector_db: Any
+) -> SegmentInfo:
+    path = _new_segment_path(brain_path, generation, "base")
+    vector_db.save_local(str(path))
+    chunk_ids = _ordered_chunk_ids(vector_db)
+    with open(path / _CHUNK_IDS_FILE, "w") as f:
+        json.dump(chunk_ids, f)
+    _fsync_tree(path)
+    if isinstance(vector_db, QuivrFAISS):
+        # NOTE: the previous base segment, which a loaded store may still map, is removed once replaced
+        vector_db.remap(str(path))
+    return SegmentInfo(
+        kind="base", path=str(path.relative_to(brain_path)), n_chunks=len(chunk_ids)
+    )
+
+
+def _write_delta_segment(
+    brain_path: Path, generation: int, vector_db: Any, chunk_ids: list[str]
+) -> SegmentInfo:
+    path = _new_segment_path(brain_path, generation, "delta")
+    positions = {id: i for i, id in vector_db.index_to_docstore_id.items()}
+    vectors = reconstruct_vectors(
+        vector_db.index, np.array([positions[id] for id in chunk_ids], dtype=np.int64)
+    )
+    chunks = []
+    for id in chunk_ids:
+        doc = vector_db.docstore.search(id)
+        assert isinstance(doc, Document), doc
+        chunks.append((id, doc.page_content, doc.metadata))
+
+    np.save(path / "vectors.npy", vectors)
+    with open(path / "chunks.pkl", "wb") as f:
+        pickle.dump(chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(path / _CHUNK_IDS_FILE, "w") as f:
+        json.dump(chunk_ids, f)
+    _fsync_tree(path)
+    return SegmentInfo(
+        kind="delta", path=str(path.relative_to(brain_path)), n_chunks=len(chunk_ids)
+    )
+
+
+def write_vector_segments(
+    brain_path: Path,
+    generation: int,
+    vector_db: Any,
+    previous: BrainManifest | None,
+    compact: bool | None = None,
+) -> tuple[list[SegmentInfo], list[str]]:
+    """
+    Write the chunks of a FAISS vector store changed since the `previous` save.
+
+    The chunks added since then are written to a new delta segment, and the deleted ones are recorded as
+    deleted. The segments are compacted into a new base segment if `compact` is True, or if it is None and
+    there are too many segments or deleted chunks.
+
+    Returns:
+        tuple[list[SegmentInfo], list[str]]: The segments of the vector store and the deleted chunk ids.
+    """
+    if isinstance(vector_db, QuivrFAISS):
+        vector_db.flush()
+
+    if previous is None or not previous.segments:
+        compact = True
+    if not compact:
+        assert previous is not None
+        chunk_ids = _ordered_chunk_ids(vector_db)
+        current = set(chunk_ids)
+        saved = saved_chunk_ids(brain_path, previous)
+        added = [id for id in chunk_ids if id not in saved]
+        deleted = sorted(saved - current)
+        segments = list(previous.segments)
+        deleted_chunk_ids = previous.deleted_chunk_ids + deleted
+
+        n_segments = len(segments) + (1 if added else 0)
+        if compact is None and (
+            n_segments > MAX_SEGMENTS
+            or len(deleted_chunk_ids) > MAX_DELETED_RATIO * max(len(current), 1)
+        ):
+            compact = True
+        else:
+            if added:
+                segments.append(
+                    _write_delta_segment(brain_path, generation, vector_db, added)
+                )
+            logger.debug(
+                f"saved {len(added)} new chunks and {len(deleted)} deleted chunks in {brain_path}"
+            )
+            return segments, deleted_chunk_ids
+
+    logger.debug(f"compacting the vector store segments of {brain_path}")
+    return [_write_base_segment(brain_path, generation, vector_db)], []
+
+
+def load_vector_segments(
+    brain_path: Path,
+    manifest: BrainManifest,
+    embedder: Embeddings,
+    index_config: FAISSIndexConfig,
+    mmap: bool = False,
+) -> QuivrFAISS:
+    """Load the FAISS vector store of a brain from its segments."""
+    base, *deltas = manifest.segments
+    assert base.kind == "base"
+    if mmap and (deltas or manifest.deleted_chunk_ids):
+        logger.info(
+            f"{brain_path} has unmerged segments: its index is copied in memory, save it with compact=True"
+        )
+    vector_db = QuivrFAISS.load_local(
+        str(brain_path / base.path),
+        embedder,
+        allow_dangerous_deserialization=True,
+        mmap=mmap,
+        lazy_docstore=mmap and not deltas and not manifest.deleted_chunk_ids,
+        index_config=index_config,
+    )
+    for delta in deltas:
+        vectors = np.load(brain_path / delta.path / "vectors.npy")
+        with open(brain_path / delta.path / "chunks.pkl", "rb") as f:
+            chunks = pickle.load(f)
+        vector_db.add_embeddings(
+            [
+                (text, v)
+                for (_, text, _), v in zip(chunks, vectors.tolist(), strict=True)
+            ],
+            metadatas=[metadata for _, _, metadata in chunks],
+            ids=[id for id, _, _ in chunks],
+        )
+    vector_db.flush()
+    if manifest.deleted_chunk_ids:
+        vector_db.delete(manifest.deleted_chunk_ids)
+    return vector_db
+
+
+def write_chat_journal(
+    brain_path: Path, messages: list[ChatMessage], previous: BrainManifest | None
+) -> tuple[str, int]:
+    """
+    Append the messages added since the `previous` save to the chat journal.
+
+    The messages are written past the published size of the journal, overwriting the leftovers of an
+    interrupted save: the published messages are never modified.
+
+    Returns:
+        tuple[str, int]: The path of the journal relative to the brain folder, and its published size.
+    """
+    if (
+        previous is not None
+        and previous.chat_path is not None
+        and len(messages) >= previous.n_chat_messages
+    ):
+        chat_path = previous.chat_path
+        new_messages = messages[previous.n_chat_messages :]
+        with open(brain_path / chat_path, "r+b") as f:
+            # NOTE: drops the messages of an interrupted save, never published
+            f.truncate(previous.chat_bytes)
+            f.seek(previous.chat_bytes)
+            for msg in new_messages:
+                f.write(msg.json().encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+            return chat_path, f.tell()
+
+    chat_path = f"chat-{uuid4().hex[:8]}.jsonl"
+    with open(brain_path / chat_path, "wb") as f:
+        for msg in messages:
+            f.write(msg.json().encode("utf-8") + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+        return chat_path, f.tell()
+
+
+def read_chat_journal(brain_path: Path, manifest: BrainManifest) -> list[ChatMessage]:
+    if manifest.chat_path is None:
+        return []
+    with open(brain_path / manifest.chat_path, "rb") as f:
+        data = f.read(manifest.chat_bytes)
+    return [ChatMessage.parse_raw(line) for line in data.splitlines() if line]
+
+
+def collect_garbage(brain_path: Path, manifest: BrainManifest) -> None:
+    """Remove the segments and journals not referenced by the manifest, e.g. compacted or left by a crash."""
+    referenced = {brain_path / s.path for s in manifest.segments}
+    segments_dir = brain_path / SEGMENTS_DIR
+    if segments_dir.exists():
+        for path in segments_dir.iterdir():
+            if path not in referenced:
+                shutil.rmtree(path, ignore_errors=True)
+    for path in brain_path.glob("chat-*.jsonl"):
+        if path.name != manifest.chat_path:
+            os.remove(path)
+    for path in brain_path.glob(f"{MANIFEST_FILE}.*.tmp"):
+        os.remove(path)
+
+
+def is_faiss(vector_db: VectorStore | None) -> bool:
+    try:
+        from langchain_community.vectorstores import FAISS
+    except ImportError:
+        return False
+    return isinstance(vector_db, FAISS)
@@ -4,7 +4,7 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field, SecretStr
 
-from quivr_core.rag.entities.config import LLMEndpointConfig
+from quivr_core.rag.entities.config import FAISSIndexConfig, LLMEndpointConfig
 from quivr_core.rag.entities.models import ChatMessage
 from quivr_core.files.file import QuivrFileSerialized
 
@@ -27,6 +27,14 @@ class PGVectorConfig(BaseModel):
 class FAISSConfig(BaseModel):
     vectordb_type: Literal["faiss"] = "faiss"
     vectordb_folder_path: str
+    index_config: FAISSIndexConfig = FAISSIndexConfig()
+
+
+class ExternalVectorStoreConfig(BaseModel):
+    """Vector store persisted by its own backend, passed back to `Brain.load`."""
+
+    vectordb_type: Literal["external"] = "external"
+    class_name: str
 
 
 class LocalStorageConfig(BaseModel):
@@ -43,13 +51,40 @@ class TransparentStorageConfig(BaseModel):
 class BrainSerialized(BaseModel):
     id: UUID
     name: str
-    chat_history: list[ChatMessage]
-    vectordb_config: Union[FAISSConfig, PGVectorConfig] = Field(
-        ..., discriminator="vectordb_type"
+    chat_history: list[ChatMessage] = []
+    vectordb_config: Union[FAISSConfig, PGVectorConfig, ExternalVectorStoreConfig] = (
+        Field(..., discriminator="vectordb_type")
     )
     storage_config: Union[TransparentStorageConfig, LocalStorageConfig] = Field(
         ..., discriminator="storage_type"
     )
 
     llm_config: LLMEndpointConfig
-    embedding_config: EmbedderConfig
+    # None if the embedder can't be serialized: it is passed back to `Brain.load`
+    embedding_config: EmbedderConfig | None
+
+
+class SegmentInfo(BaseModel):
+    # "base": a FAISS index saved with `save_local`, "delta": vectors and chunks added after the base
+    kind: Literal["base", "delta"]
+    path: str  # Relative to the brain folder
+    n_chunks: int
+
+
+class BrainManifest(BaseModel):
+    """
+    Published state of a saved brain. The published content of the files it references is never modified:
+    a save writes new segments, appends to the chat journal past its published `chat_bytes`, and replaces
+    the manifest atomically.
+    """
+
+    format_version: int = 1
+    generation: int
+    brain: BrainSerialized
+    segments: list[SegmentInfo] = []
+    # Chunks of the segments deleted since they were saved
+    deleted_chunk_ids: list[str] = []
+    # Journal of the chat messages, only its first `chat_bytes` bytes are published
+    chat_path: str | None = None
+    chat_bytes: int = 0
+    n_chat_messages: int = 0
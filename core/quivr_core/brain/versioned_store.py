@@ -0,0 +1,455 @@
+import heapq
+import logging
+import threading
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStore
+
+from quivr_core.brain.docstore import iter_metadatas
+from quivr_core.brain.faiss_index import (
+    QuivrFAISS,
+    build_faiss_index,
+    needs_training,
+    reconstruct_vectors,
+)
+from quivr_core.rag.entities.config import FAISSIndexType
+
+logger = logging.getLogger("quivr_core")
+
+
+def _seal(segment: QuivrFAISS) -> QuivrFAISS:
+    """Build the lazy structures of a segment before publishing it, so that searches never modify it."""
+    segment.flush()
+    segment.build_metadata_index()
+    if segment.index is not None:
+        faiss = dependable_faiss_import()
+        ivf = faiss.try_extract_index_ivf(segment.index)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            # NOTE: used by the filtered searches and the compaction to read back vectors
+            ivf.make_direct_map(True)
+    return segment
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Immutable version of a `VersionedFAISS` vector store.
+
+    A snapshot is a list of segments, FAISS stores never modified once published, and the ids of the chunks
+    deleted from each of them. A reader holding a snapshot searches the same chunks whatever the writers
+    publish meanwhile, and keeps its segments alive until it releases it.
+    """
+
+    version: int
+    segments: tuple[QuivrFAISS, ...]
+    # Ids of the chunks deleted from each segment
+    deleted: tuple[frozenset[str], ...]
+
+    def __len__(self) -> int:
+        return sum(
+            len(segment.index_to_docstore_id) - len(deleted)
+            for segment, deleted in zip(self.segments, self.deleted)
+        )
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        Search the chunks most similar to each of the query vectors in the segments of the snapshot.
+
+        Each segment is searched for `k` chunks plus the number of chunks deleted from it, and the results
+        of the segments are merged by score.
+        """
+        rows: list[list[Tuple[Document, float]]] = [[] for _ in embeddings]
+        for segment, deleted in zip(self.segments, self.deleted):
+            hits = segment.similarity_search_with_ids_by_vectors(
+                embeddings, k + len(deleted), filter, fetch_k + len(deleted), **kwargs
+            )
+            for row, segment_hits in zip(rows, hits):
+                row.extend((d, s) for id, d, s in segment_hits if id not in deleted)
+
+        select = (
+            heapq.nlargest
+            if self.segments[0].distance_strategy
+            in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+            else heapq.nsmallest
+        )
+        return [select(k, row, key=itemgetter(1)) for row in rows]
+
+    def metadatas(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Iterate over the ids and metadata of the chunks of the snapshot."""
+        for segment, deleted in zip(self.segments, self.deleted):
+            metadatas = iter_metadatas(segment.docstore)
+            if metadatas is None:
+                metadatas = (
+                    (id, segment.docstore.search(id).metadata)
+                    for id in segment.index_to_docstore_id.values()
+                )
+            for id, metadata in metadatas:
+                if id not in deleted:
+                    yield id, metadata
+
+
+class VersionedFAISS(VectorStore):
+    """
+    FAISS vector store whose readers never wait for, nor observe, a write in progress.
+
+    The store is a sequence of immutable `Snapshot`s. Each search pins the current snapshot and runs on it
+    without locks, while writers build the next version aside:
+
+    * `add_embeddings` adds the chunks to an open segment, a flat FAISS store private to the writers.
+      `publish` (or `flush`) seals it and atomically publishes a new snapshot including it.
+      `add_texts` adds and publishes the chunks.
+    * `delete` publishes a new snapshot recording the deleted chunks, filtered out of the search results.
+    * Once there are more than `max_segments` segments or `max_deleted` deleted chunks, the segments are
+      compacted into a single segment with the index type of the wrapped store, published as a new snapshot.
+
+    Writers are serialized by a lock. The segments replaced by a compaction are freed once no reader holds a
+    snapshot referencing them. Each snapshot has a `version`, incremented by every publication: callbacks
+    registered with `subscribe` are called with each new snapshot, e.g. to invalidate caches.
+
+    Args:
+        vector_db (QuivrFAISS): The initial content of the store, becoming its first segment.
+        max_segments (int): Number of segments from which the segments are compacted.
+        max_deleted (int): Number of deleted chunks from which the segments are compacted.
+    """
+
+    def __init__(
+        self, vector_db: QuivrFAISS, max_segments: int = 8, max_deleted: int = 1024
+    ):
+        if not isinstance(vector_db, QuivrFAISS):
+            raise TypeError(
+                f"VersionedFAISS wraps a QuivrFAISS store, got {type(vector_db).__name__}"
+            )
+        self.max_segments = max_segments
+        self.max_deleted = max_deleted
+        self._snapshot = Snapshot(0, (_seal(vector_db),), (frozenset(),))
+        self._write_lock = threading.Lock()
+        # Segment receiving the chunks added since the last publication
+        self._open_segment: QuivrFAISS | None = None
+        self._listeners: list[Callable[[Snapshot], None]] = []
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._snapshot.segments[0].embeddings
+
+    @property
+    def index_config(self):
+        return self._snapshot.segments[0].index_config
+
+    def snapshot(self) -> Snapshot:
+        """The current version of the store, unaffected by later writes."""
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[Snapshot], None]) -> None:
+        """Call `callback` with each snapshot published, from the publishing thread."""
+        self._listeners.append(callback)
+
+    def metadatas(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Iterate over the ids and metadata of the chunks of the current version."""
+        return self._snapshot.metadatas()
+
+    def _publish(self, snapshot: Snapshot) -> None:
+        # NOTE: replacing the reference is atomic, readers see either the previous or the new snapshot
+        self._snapshot = snapshot
+        logger.debug(
+            f"published version {snapshot.version} of the vector store: {len(snapshot.segments)} segments, "
+            f"{sum(len(d) for d in snapshot.deleted)} deleted chunks"
+        )
+        for callback in self._listeners:
+            callback(snapshot)
+
+    def _new_segment(self, dim: int) -> QuivrFAISS:
+        faiss = dependable_faiss_import()
+        like = self._snapshot.segments[0]
+        metric = (
+            faiss.METRIC_INNER_PRODUCT
+            if like.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+            else faiss.METRIC_L2
+        )
+        return QuivrFAISS(
+            like.embedding_function,
+            faiss.IndexFlat(dim, metric),
+            type(like.docstore)(),
+            {},
+            index_config=like.index_config.model_copy(
+                update={"index_type": FAISSIndexType.FLAT, "rerank_factor": 0}
+            ),
+            distance_strategy=like.distance_strategy,
+            normalize_L2=like._normalize_L2,
+        )
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Add chunks to the open segment, searched once `publish` is called."""
+        text_embeddings = list(text_embeddings)
+        if not text_embeddings:
+            return []
+        with self._write_lock:
+            if self._open_segment is None:
+                self._open_segment = self._new_segment(len(text_embeddings[0][1]))
+            return self._open_segment.add_embeddings(
+                text_embeddings, metadatas, ids, **kwargs
+            )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = self._snapshot.segments[0]._embed_documents(texts)
+        ids = self.add_embeddings(zip(texts, embeddings), metadatas, ids)
+        self.publish()
+        return ids
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = await self._snapshot.segments[0]._aembed_documents(texts)
+        ids = self.add_embeddings(zip(texts, embeddings), metadatas, ids)
+        await run_in_executor(None, self.publish)
+        return ids
+
+    def publish(self) -> int:
+        """
+        Publish the chunks added since the last publication as a new version, compacting the segments if needed.
+
+        Returns:
+            int: The version published.
+        """
+        with self._write_lock:
+            segment, self._open_segment = self._open_segment, None
+            if segment is not None and len(segment.index_to_docstore_id) > 0:
+                current = self._snapshot
+                self._publish(
+                    Snapshot(
+                        current.version + 1,
+                        current.segments + (_seal(segment),),
+                        current.deleted + (frozenset(),),
+                    )
+                )
+            if self._needs_compaction():
+                self._compact()
+            return self._snapshot.version
+
+    def flush(self) -> None:
+        """Same as `publish`, called at the end of an ingestion."""
+        self.publish()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id, publishing a new version without them."""
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        with self._write_lock:
+            remaining = set(ids)
+            open_ids: set[str] = set()
+            if self._open_segment is not None:
+                open_ids = remaining.intersection(
+                    self._open_segment.index_to_docstore_id.values()
+                )
+                remaining -= open_ids
+
+            current = self._snapshot
+            deleted = list(current.deleted)
+            for i, segment in enumerate(current.segments):
+                found = (
+                    remaining.intersection(segment.index_to_docstore_id.values())
+                    - deleted[i]
+                )
+                if found:
+                    deleted[i] = deleted[i] | found
+                    remaining -= found
+            if remaining:
+                raise ValueError(
+                    f"Some specified ids do not exist in the current store. Ids not found: {remaining}"
+                )
+
+            if open_ids:
+                assert self._open_segment is not None
+                self._open_segment.delete(list(open_ids))
+            if deleted != list(current.deleted):
+                self._publish(
+                    Snapshot(current.version + 1, current.segments, tuple(deleted))
+                )
+                if self._needs_compaction():
+                    self._compact()
+        return True
+
+    def _needs_compaction(self) -> bool:
+        snapshot = self._snapshot
+        return (
+            len(snapshot.segments) > self.max_segments
+            or sum(len(d) for d in snapshot.deleted) > self.max_deleted
+        )
+
+    def compact(self) -> QuivrFAISS:
+        """
+        Compact the current version into a single segment, published as a new version if it had several
+        segments or deleted chunks.
+
+        Returns:
+            QuivrFAISS: The segment of the compacted version. It must not be modified.
+        """
+        with self._write_lock:
+            self._compact()
+            return self._snapshot.segments[0]
+
+    def _compact(self) -> None:
+        current = self._snapshot
+        if len(current.segments) == 1 and not current.deleted[0]:
+            return
+        base = current.segments[0]
+        config = base.index_config
+        dims = [s.index.d for s in current.segments if s.index is not None]
+        index = (
+            build_faiss_index(dims[0], config)
+            if dims and not needs_training(config)
+            else None
+        )
+        # NOTE: indexes needing training are trained on the vectors of all the segments
+        merged = QuivrFAISS(
+            base.embedding_function,
+            index,
+            type(base.docstore)(),
+            {},
+            index_config=config,
+            distance_strategy=base.distance_strategy,
+            normalize_L2=base._normalize_L2,
+        )
+        for segment, deleted in zip(current.segments, current.deleted):
+            kept = [
+                (i, id)
+                for i, id in sorted(segment.index_to_docstore_id.items())
+                if id not in deleted
+            ]
+            if not kept:
+                continue
+            vectors = reconstruct_vectors(
+                segment.index, np.array([i for i, _ in kept], dtype=np.int64)
+            )
+            docs = [segment.docstore.search(id) for _, id in kept]
+            merged.add_embeddings(
+                zip([d.page_content for d in docs], vectors.tolist()),
+                metadatas=[d.metadata for d in docs],
+                ids=[id for _, id in kept],
+            )
+        self._publish(Snapshot(current.version + 1, (_seal(merged),), (frozenset(),)))
+
+    def similarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Search the chunks most similar to each of the query vectors, see `QuivrFAISS`."""
+        return self._snapshot.similarity_search_with_score_by_vectors(
+            embeddings, k, filter, fetch_k, **kwargs
+        )
+
+    async def asimilarity_search_with_score_by_vectors(
+        self,
+        embeddings: List[List[float]],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[List[Tuple[Document, float]]]:
+        return await run_in_executor(
+            None,
+            self.similarity_search_with_score_by_vectors,
+            embeddings,
+            k,
+            filter,
+            fetch_k,
+            **kwargs,
+        )
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        (docs,) = self.similarity_search_with_score_by_vectors(
+            [embedding], k, filter, fetch_k, **kwargs
+        )
+        return docs
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._snapshot.segments[0]._embed_query(query)
+        return self.similarity_search_with_score_by_vector(
+            embedding, k, filter, fetch_k, **kwargs
+        )
+
+    async def asimilarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        embedding = await self._snapshot.segments[0]._aembed_query(query)
+        (docs,) = await self.asimilarity_search_with_score_by_vectors(
+            [embedding], k, filter, fetch_k, **kwargs
+        )
+        return docs
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return self._snapshot.segments[0]._select_relevance_score_fn()
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        **kwargs: Any,
+    ) -> "VersionedFAISS":
+        return cls(QuivrFAISS.from_texts(texts, embedding, metadatas, **kwargs))
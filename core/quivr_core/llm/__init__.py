@@ -1,3 +1,4 @@
 from .llm_endpoint import LLMEndpoint
+from .registry import LLMRegistry, approximate_token_count, llm_registry
 
-__all__ = ["LLMEndpoint"]
+__all__ = ["LLMEndpoint", "LLMRegistry", "approximate_token_count", "llm_registry"]
@@ -1,15 +1,14 @@
 import logging
-import os
-from typing import Union
+from typing import Any, Callable, Union
 from urllib.parse import parse_qs, urlparse
 
-import tiktoken
 from langchain_anthropic import ChatAnthropic
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
 from pydantic.v1 import SecretStr
 
 from quivr_core.brain.info import LLMInfo
+from quivr_core.llm.registry import llm_registry
 from quivr_core.rag.entities.config import DefaultModelSuppliers, LLMEndpointConfig
 from quivr_core.rag.utils import model_supports_function_calling
 
@@ -17,43 +16,64 @@ logger = logging.getLogger("quivr_core")
 
 
 class LLMEndpoint:
-    def __init__(self, llm_config: LLMEndpointConfig, llm: BaseChatModel):
+    """
+    A chat model with its configuration.
+
+    The tokenizer of the model is loaded on the first token count, from the process-wide `llm_registry`.
+    `from_config` returns the endpoint registered for identical configurations, built on first use: the
+    endpoints are shared, and immutable once built.
+
+    Args:
+        llm_config (LLMEndpointConfig): The configuration of the model.
+        llm (BaseChatModel): The chat model.
+        token_counter (Callable[[str], int] | None): Counts the tokens of a text instead of the tokenizer,
+            e.g. `approximate_token_count`. Defaults to the `token_counter` of the registry, if any.
+    """
+
+    def __init__(
+        self,
+        llm_config: LLMEndpointConfig,
+        llm: BaseChatModel,
+        token_counter: Callable[[str], int] | None = None,
+    ):
         self._config = llm_config
         self._llm = llm
         self._supports_func_calling = model_supports_function_calling(
             self._config.model
         )
+        self._tokenizer: Any = None
+        self._token_counter = token_counter
 
-        if llm_config.tokenizer_hub:
-            # To prevent the warning
-            # huggingface/tokenizers: The current process just got forked, after parallelism has already been used. Disabling parallelism to avoid deadlocks...
-            os.environ["TOKENIZERS_PARALLELISM"] = (
-                "false"
-                if not os.environ.get("TOKENIZERS_PARALLELISM")
-                else os.environ["TOKENIZERS_PARALLELISM"]
-            )
-            try:
-                from transformers import AutoTokenizer
+    @property
+    def token_counter(self) -> Callable[[str], int] | None:
+        return self._token_counter
 
-                self.tokenizer = AutoTokenizer.from_pretrained(llm_config.tokenizer_hub)
-            except OSError:  # if we don't manage to connect to huggingface and/or no cached models are present
-                logger.warning(
-                    f"Cannot acces the configured tokenizer from {llm_config.tokenizer_hub}, using the default tokenizer {llm_config.fallback_tokenizer}"
-                )
-                self.tokenizer = tiktoken.get_encoding(llm_config.fallback_tokenizer)
-        else:
-            self.tokenizer = tiktoken.get_encoding(llm_config.fallback_tokenizer)
+    @property
+    def tokenizer(self) -> Any:
+        if self._tokenizer is None:
+            self._tokenizer = llm_registry.get_tokenizer(
+                self._config.tokenizer_hub, self._config.fallback_tokenizer
+            )
+        return self._tokenizer
 
     def count_tokens(self, text: str) -> int:
+        counter = self._token_counter or llm_registry.token_counter
+        if counter is not None:
+            return counter(text)
         # Tokenize the input text and return the token count
         encoding = self.tokenizer.encode(text)
         return len(encoding)
 
-    def get_config(self):
-        return self._config
+    def get_config(self) -> LLMEndpointConfig:
+        """A copy of the configuration: the endpoint is shared by the brains with the same configuration."""
+        return self._config.model_copy(deep=True)
 
     @classmethod
     def from_config(cls, config: LLMEndpointConfig = LLMEndpointConfig()):
+        return llm_registry.get_endpoint(cls, config, cls._build)
+
+    @classmethod
+    def _build(cls, config: LLMEndpointConfig):
         _llm: Union[AzureChatOpenAI, ChatOpenAI, ChatAnthropic]
         try:
             if config.supplier == DefaultModelSuppliers.AZURE:
@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable
+
+from quivr_core.processor.tokenizer import get_encoding
+from quivr_core.rag.entities.config import LLMEndpointConfig
+
+if TYPE_CHECKING:
+    from quivr_core.llm.llm_endpoint import LLMEndpoint
+
+logger = logging.getLogger("quivr_core")
+
+# Average number of characters per token of the BPE tokenizers on English text
+_CHARS_PER_TOKEN = 4
+
+
+def approximate_token_count(text: str) -> int:
+    """Fast estimate of the number of tokens of a text, without tokenizing it."""
+    return (len(text) + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
+
+
+class LLMRegistry:
+    """
+    Process-wide registry of the LLM endpoints and tokenizers, shared by all the brains.
+
+    * `get_endpoint` returns the same `LLMEndpoint`, and chat model client, for identical configurations
+      (see `QuivrBaseConfig.fingerprint`): answering with a custom `llm_config` doesn't build a new client per
+      request.
+    * `get_tokenizer` loads each tokenizer once, on the first token count. The Hugging Face tokenizers are
+      first looked up in the local cache, then downloaded unless `offline` is set (defaults to the
+      `HF_HUB_OFFLINE` environment variable). A tokenizer that can't be loaded is replaced by the tiktoken
+      fallback encoding, also cached: the lookup isn't retried.
+    * `token_counter` replaces the tokenizers of the endpoints without their own counter, e.g. with
+      `approximate_token_count` when exact counts aren't needed.
+
+    Args:
+        max_endpoints (int): Number of endpoints kept, least recently used first evicted.
+    """
+
+    def __init__(self, max_endpoints: int = 64):
+        self.max_endpoints = max_endpoints
+        self.offline = os.environ.get("HF_HUB_OFFLINE", "0") not in ("0", "")
+        self.token_counter: Callable[[str], int] | None = None
+        self._lock = threading.Lock()
+        self._endpoints: OrderedDict[tuple[type, str], "LLMEndpoint"] = OrderedDict()
+        self._tokenizers: dict[tuple[str | None, str], Any] = {}
+        # One lock per tokenizer, so that loading a tokenizer doesn't block the others
+        self._tokenizer_locks: dict[tuple[str | None, str], threading.Lock] = {}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+            self._tokenizers.clear()
+            self._tokenizer_locks.clear()
+
+    def get_endpoint(
+        self,
+        endpoint_class: type["LLMEndpoint"],
+        config: LLMEndpointConfig,
+        build: Callable[[LLMEndpointConfig], "LLMEndpoint"],
+    ) -> "LLMEndpoint":
+        """
+        The endpoint of `config`, built with `build` on first use.
+
+        Args:
+            endpoint_class (type[LLMEndpoint]): The class of the endpoint.
+            config (LLMEndpointConfig): The configuration of the endpoint.
+            build (Callable[[LLMEndpointConfig], LLMEndpoint]): Builds the endpoint, called with a copy of
+                `config` owned by the endpoint.
+        Returns:
+            LLMEndpoint: The shared endpoint.
+        """
+        key = (endpoint_class, config.fingerprint())
+        with self._lock:
+            endpoint = self._endpoints.get(key)
+            if endpoint is not None:
+                self._endpoints.move_to_end(key)
+                return endpoint
+
+        endpoint = build(config.model_copy(deep=True))
+        with self._lock:
+            endpoint = self._endpoints.setdefault(key, endpoint)
+            self._endpoints.move_to_end(key)
+            while len(self._endpoints) > self.max_endpoints:
+                self._endpoints.popitem(last=False)
+        return endpoint
+
+    def get_tokenizer(self, tokenizer_hub: str | None, fallback: str) -> Any:
+        """
+        The tokenizer of `tokenizer_hub`, or the `fallback` tiktoken encoding, loaded on first use.
+
+        Returns:
+            Any: A tokenizer with an `encode` method.
+        """
+        key = (tokenizer_hub, fallback)
+        tokenizer = self._tokenizers.get(key)
+        if tokenizer is not None:
+            return tokenizer
+        with self._lock:
+            lock = self._tokenizer_locks.setdefault(key, threading.Lock())
+        with lock:
+            tokenizer = self._tokenizers.get(key)
+            if tokenizer is None:
+                tokenizer = self._tokenizers[key] = self._load_tokenizer(
+                    tokenizer_hub, fallback
+                )
+        return tokenizer
+
+    def _load_tokenizer(self, tokenizer_hub: str | None, fallback: str) -> Any:
+        if not tokenizer_hub:
+            return get_encoding(fallback)
+
+        # To prevent the warning
+        # huggingface/tokenizers: The current process just got forked, after parallelism has already been used. Disabling parallelism to avoid deadlocks...
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        try:
+            from transformers import AutoTokenizer
+        except ImportError:
+            logger.warning(
+                f"transformers is not installed, using the default tokenizer {fallback} instead of {tokenizer_hub}"
+            )
+            return get_encoding(fallback)
+
+        try:
+            return AutoTokenizer.from_pretrained(tokenizer_hub, local_files_only=True)
+        except OSError:
+            pass
+        if not self.offline:
+            try:
+                return AutoTokenizer.from_pretrained(tokenizer_hub)
+            except OSError:  # if we don't manage to connect to huggingface
+                pass
+        logger.warning(
+            f"Cannot acces the configured tokenizer from {tokenizer_hub}, using the default tokenizer {fallback}"
+        )
+        return get_encoding(fallback)
+
+
+# Registry shared by the endpoints of the process
+llm_registry = LLMRegistry()
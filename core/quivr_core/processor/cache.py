@@ -0,0 +1,245 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from contextlib import aclosing, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncGenerator, Callable, Iterable, Iterator
+
+from langchain_core.documents import Document
+
+from quivr_core.files.file import QuivrFile
+from quivr_core.processor.processor_base import quivr_core_version
+
+if TYPE_CHECKING:
+    from quivr_core.processor.processor_base import ProcessorBase
+
+logger = logging.getLogger("quivr_core")
+
+_CACHE_SUFFIX = ".chunks"
+# Version of the layout of the entries, part of the key
+_CACHE_FORMAT = 2
+
+
+@dataclass
+class ParseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    def merge(self, other: "ParseCacheStats") -> None:
+        self.hits += other.hits
+        self.misses += other.misses
+        self.writes += other.writes
+        self.evictions += other.evictions
+
+
+class ParseCache:
+    """
+    Content-addressed on-disk cache of parsed chunks.
+
+    Entries are keyed by the file content (`file_sha1`), the processor class, its configuration
+    (`processor_metadata` and `cache_config`) and the quivr-core version, so that unchanged files
+    are never parsed twice by the same processor configuration. The files of a processor whose
+    configuration can't be fingerprinted (`cache_config` is None) are not cached.
+
+    The cache stores the raw chunks returned by the processor, before the file-level metadata is added:
+    a hit for a file uploaded under a different id or name yields correct metadata.
+
+    An entry is written as the chunks stream through the cache, one record per chunk.
+    Writes are atomic (temporary file + `os.replace`), so several processes can safely share the
+    same cache directory. When the cache grows over `max_size_bytes`, the least recently used entries are evicted.
+
+    Args:
+        cache_dir (Path | None): Directory of the cache. Defaults to the environment variable
+                                 `QUIVR_PARSE_CACHE` or `~/.cache/quivr/parse`.
+        max_size_bytes (int): Size cap of the cache. Defaults to 2GB.
+    """
+
+    def __init__(
+        self, cache_dir: Path | None = None, max_size_bytes: int = 2 * 1024**3
+    ):
+        if cache_dir is None:
+            cache_dir = Path(os.getenv("QUIVR_PARSE_CACHE", "~/.cache/quivr/parse"))
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_size_bytes = max_size_bytes
+        self.stats = ParseCacheStats()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size: int | None = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"ParseCache(cache_dir={self.cache_dir}, stats={self.stats})"
+
+    def __getstate__(self):
+        # NOTE: sent to worker processes without its lock and counters
+        return {"cache_dir": self.cache_dir, "max_size_bytes": self.max_size_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def key(self, file: QuivrFile, processor: "ProcessorBase") -> str | None:
+        """The key of the chunks of `file` parsed by `processor`, None if they can't be cached."""
+        cache_config = processor.cache_config
+        if cache_config is None:
+            return None
+        key_parts = {
+            "file_sha1": file.file_sha1,
+            "processor_cls": f"{type(processor).__module__}.{type(processor).__qualname__}",
+            "processor_metadata": processor.processor_metadata,
+            "cache_config": cache_config,
+            "quivr_core_version": quivr_core_version(),
+            "cache_format": _CACHE_FORMAT,
+        }
+        raw_key = json.dumps(key_parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}{_CACHE_SUFFIX}"
+
+    def get(self, key: str) -> list[Document] | None:
+        path = self._path(key)
+        try:
+            docs = []
+            with open(path, "rb") as f:
+                # The chunks, then None
+                while (entry := pickle.load(f)) is not None:
+                    page_content, metadata = entry
+                    docs.append(Document(page_content=page_content, metadata=metadata))
+            # Bump the entry for the LRU eviction
+            os.utime(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            # Missing, evicted by another process or truncated entry
+            self.stats.misses += 1
+            return None
+
+        self.stats.hits += 1
+        return docs
+
+    def put(self, key: str, docs: Iterable[Document]) -> None:
+        with self._writer(key) as write:
+            for doc in docs:
+                write(doc)
+
+    @contextmanager
+    def _writer(self, key: str) -> Iterator[Callable[[Document], None]]:
+        """
+        Write the entry of `key` chunk by chunk: the entry is published when the context exits without error.
+        """
+        path = self._path(key)
+        os.makedirs(path.parent, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+
+                def _write(doc: Document) -> None:
+                    pickle.dump(
+                        (doc.page_content, dict(doc.metadata)),
+                        f,
+                        protocol=pickle.HIGHEST_PROTOCOL,
+                    )
+
+                yield _write
+                pickle.dump(None, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self.stats.writes += 1
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_size()
+            else:
+                self._size += path.stat().st_size
+            if self._size > self.max_size_bytes:
+                self._evict()
+
+    async def aprocess(
+        self, processor: "ProcessorBase", file: QuivrFile
+    ) -> AsyncGenerator[Document, None]:
+        """
+        Yield the raw chunks of `file` from the cache, or from the processor on a miss.
+
+        On a miss, the chunks are written as they are yielded, and the entry is stored once the processor
+        went through the whole file.
+        """
+        key = self.key(file, processor)
+        if key is None:
+            logger.debug(f"{type(processor).__name__} can't be cached, parsing {file}")
+            async for doc in processor.process_file_inner_stream(file):
+                yield doc
+            return
+
+        cached_docs = self.get(key)
+        if cached_docs is not None:
+            logger.debug(f"parse cache hit for {file}")
+            for doc in cached_docs:
+                yield doc
+            return
+
+        stream = processor.process_file_inner_stream(file)
+        with self._writer(key) as write:
+            async with aclosing(stream):
+                async for doc in stream:
+                    # NOTE: the yielded doc is modified downstream, it is written first
+                    write(doc)
+                    yield doc
+
+    def _entries(self) -> list[os.DirEntry]:
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if shard.is_dir():
+                entries.extend(
+                    e for e in os.scandir(shard.path) if e.name.endswith(_CACHE_SUFFIX)
+                )
+        return entries
+
+    def _disk_size(self) -> int:
+        size = 0
+        for entry in self._entries():
+            try:
+                size += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+        return size
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        # Least recently used first
+        entries.sort()
+        size = sum(s for _, s, _ in entries)
+        for _, entry_size, entry_path in entries:
+            if size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                self.stats.evictions += 1
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            size -= entry_size
+        self._size = size
+
+    def clear(self) -> None:
+        for entry in self._entries():
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
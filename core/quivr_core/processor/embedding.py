@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from quivr_core.processor.tokenizer import count_tokens
+from quivr_core.rag.entities.config import IngestionConfig
+
+logger = logging.getLogger("quivr_core")
+
+
+class RateLimiter:
+    """
+    Token-bucket limiter of the requests and tokens sent to an embedding provider per minute.
+
+    Each bucket holds at most one minute of quota and refills continuously, so that short bursts are
+    allowed but the average throughput stays under the limits.
+
+    Args:
+        requests_per_minute (int | None): Maximum number of requests per minute, unlimited if None.
+        tokens_per_minute (int | None): Maximum number of tokens per minute, unlimited if None.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._last = time.monotonic()
+        self._lock: asyncio.Lock | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute,
+                self._requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute,
+                self._tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def _wait_time(self, n_tokens: int) -> float:
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = (1 - self._requests) * 60 / self.requests_per_minute
+        if self.tokens_per_minute and self._tokens < n_tokens:
+            wait = max(wait, (n_tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, n_tokens: int = 0) -> None:
+        """Wait until a request of `n_tokens` tokens can be sent."""
+        if not self.requests_per_minute and not self.tokens_per_minute:
+            return
+        if self.tokens_per_minute:
+            # NOTE: a request larger than the bucket would wait forever
+            n_tokens = min(n_tokens, self.tokens_per_minute)
+
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        # Requests are served in order: a large request isn't starved by small ones
+        async with self._lock:
+            self._refill()
+            while (wait := self._wait_time(n_tokens)) > 0:
+                await asyncio.sleep(wait)
+                self._refill()
+            self._requests -= 1
+            self._tokens -= n_tokens
+
+
+@dataclass
+class EmbeddingMetrics:
+    n_requests: int = 0
+    n_retries: int = 0
+    n_chunks: int = 0
+    n_tokens: int = 0
+
+
+class _BatchError:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+_DONE = object()
+
+
+class EmbeddingScheduler:
+    """
+    Embed a stream of chunks with concurrent, token-packed requests.
+
+    * Chunks are packed into requests of at most `max_batch_tokens` tokens and `max_batch_size` chunks.
+      The token count is read from the `chunk_size` metadata of the chunks when set by the processor.
+    * Up to `max_concurrency` requests run at the same time, under the `rate_limiter` limits.
+    * A failed request is retried on its own with an exponential backoff and full jitter, the other
+      batches are not sent again.
+    * Batches are yielded as soon as they are embedded, in completion order, so that they can be indexed
+      while the next ones are embedded.
+
+    Args:
+        embedder (Embeddings): The embeddings used to embed the chunks.
+        max_batch_tokens (int): Maximum number of tokens per request.
+        max_batch_size (int): Maximum number of chunks per request.
+        max_concurrency (int): Maximum number of concurrent requests.
+        max_retries (int): Maximum number of attempts per batch.
+        backoff_base (float): Base delay of the exponential backoff in seconds.
+        backoff_max (float): Maximum delay between two attempts in seconds.
+        rate_limiter (RateLimiter | None): Limits of the embedding provider.
+    """
+
+    def __init__(
+        self,
+        embedder: Embeddings,
+        max_batch_tokens: int = 16_000,
+        max_batch_size: int = 64,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        self.embedder = embedder
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = EmbeddingMetrics()
+
+    @classmethod
+    def from_config(
+        cls, embedder: Embeddings, config: IngestionConfig
+    ) -> "EmbeddingScheduler":
+        return cls(
+            embedder,
+            max_batch_tokens=config.embedding_batch_tokens,
+            max_batch_size=config.embedding_batch_size,
+            max_concurrency=config.max_concurrent_embeddings,
+            max_retries=config.embedding_max_retries,
+            rate_limiter=RateLimiter(
+                requests_per_minute=config.embedding_requests_per_minute,
+                tokens_per_minute=config.embedding_tokens_per_minute,
+            ),
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _pack(
+        self, chunks: AsyncIterable[Document]
+    ) -> AsyncIterator[tuple[list[Document], int]]:
+        batch: list[Document] = []
+        batch_tokens = 0
+        async for chunk in chunks:
+            n_tokens = chunk.metadata.get("chunk_size")
+            if not isinstance(n_tokens, int):
+                (n_tokens,) = count_tokens([chunk.page_content])
+            if batch and (
+                batch_tokens + n_tokens > self.max_batch_tokens
+                or len(batch) >= self.max_batch_size
+            ):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(chunk)
+            batch_tokens += n_tokens
+        if batch:
+            yield batch, batch_tokens
+
+    async def aembed_batch(
+        self, batch: list[Document], n_tokens: int = 0
+    ) -> list[list[float]]:
+        """
+        Embed a batch of chunks in a single request, retrying on failure.
+
+        Raises:
+            Exception: The error of the last attempt, if the batch can't be embedded after `max_retries` attempts.
+        """
+        texts = [d.page_content for d in batch]
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.metrics.n_retries += 1
+                await asyncio.sleep(self._backoff(attempt - 1))
+            await self.rate_limiter.acquire(n_tokens)
+            self.metrics.n_requests += 1
+            try:
+                vectors = await self.embedder.aembed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                logger.debug(
+                    f"embedding request of {len(batch)} chunks failed: {e}. retrying for the {attempt + 1} time..."
+                )
+                continue
+            self.metrics.n_chunks += len(batch)
+            self.metrics.n_tokens += n_tokens
+            return vectors
+        raise AssertionError("unreachable")
+
+    async def astream(
+        self, chunks: AsyncIterable[Document]
+    ) -> AsyncIterator[tuple[list[Document], list[list[float]]]]:
+        """
+        Embed the chunks and yield the batches of chunks with their vectors as they complete.
+
+        Raises:
+            Exception: If a batch can't be embedded after `max_retries` attempts. The pending requests are cancelled.
+        """
+        # Completed batches waiting for the consumer, bounded to apply backpressure
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.max_concurrency)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks: set[asyncio.Task] = set()
+
+        async def _embed(batch: list[Document], n_tokens: int):
+            try:
+                vectors = await self.aembed_batch(batch, n_tokens)
+                await results.put((batch, vectors))
+            except Exception as e:
+                await results.put(_BatchError(e))
+            finally:
+                semaphore.release()
+
+        async def _produce():
+            try:
+                async for batch, n_tokens in self._pack(chunks):
+                    await semaphore.acquire()
+                    task = asyncio.create_task(_embed(batch, n_tokens))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+            except Exception as e:
+                await results.put(_BatchError(e))
+            await results.put(_DONE)
+
+        producer = asyncio.create_task(_produce())
+        try:
+            while (item := await results.get()) is not _DONE:
+                if isinstance(item, _BatchError):
+                    raise item.error
+                yield item
+        finally:
+            for task in [producer, *tasks]:
+                task.cancel()
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
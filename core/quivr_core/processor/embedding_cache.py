@@ -0,0 +1,420 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from quivr_core.rag.entities.config import IngestionConfig
+
+logger = logging.getLogger("quivr_core")
+
+# Attributes identifying the model of the usual langchain embeddings
+_MODEL_ATTRIBUTES = (
+    "model",
+    "model_name",
+    "model_id",
+    "deployment",
+    "dimensions",
+    "size",
+)
+
+
+def embedder_model_id(embedder: Embeddings) -> str:
+    """Identity of the model of an embedder: its class and model configuration, without credentials."""
+    parts: dict[str, object] = {
+        "cls": f"{type(embedder).__module__}.{type(embedder).__qualname__}"
+    }
+    for attr in _MODEL_ATTRIBUTES:
+        value = getattr(embedder, attr, None)
+        if value is not None:
+            parts[attr] = value
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def _text_key(text: str, kind: str) -> bytes:
+    # NOTE: some models embed queries and documents differently
+    return hashlib.blake2b(f"{kind}:{text}".encode("utf-8"), digest_size=16).digest()
+
+
+@dataclass
+class EmbeddingCacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    query_hits: int = 0
+
+
+class EmbeddingStore:
+    """
+    On-disk store of embedding vectors of a single model.
+
+    Vectors are appended as float32 rows to fixed-size block files read through memory maps, and indexed by
+    the hash of their text in a SQLite database. A lookup of a whole batch is a single SQL query followed by
+    a gather of the rows in the mapped blocks.
+
+    The store is bounded by `max_size_bytes`: when it grows over it, the least recently used blocks are
+    evicted with all their vectors. Several processes can share the same directory, writes are serialized
+    by SQLite transactions.
+
+    Args:
+        store_dir (Path): Directory of the store.
+        max_size_bytes (int): Size cap of the vector blocks.
+        block_rows (int): Number of vectors per block file, the unit of eviction.
+    """
+
+    def __init__(self, store_dir: Path, max_size_bytes: int, block_rows: int = 16_384):
+        self.store_dir = Path(store_dir)
+        self.max_size_bytes = max_size_bytes
+        self.block_rows = block_rows
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self.store_dir / "index.sqlite", check_same_thread=False, timeout=30
+        )
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blocks ("
+                "id INTEGER PRIMARY KEY, n_rows INTEGER, last_access REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key BLOB PRIMARY KEY, block INTEGER, row INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_block ON entries (block)"
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @property
+    def dim(self) -> int | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _block_path(self, block: int) -> Path:
+        return self.store_dir / f"block-{block:06d}.f32"
+
+    def get(self, keys: Sequence[bytes]) -> list[np.ndarray | None]:
+        """Vectors of the `keys`, None for the missing ones."""
+        results: list[np.ndarray | None] = [None] * len(keys)
+        if not keys:
+            return results
+
+        with self._lock:
+            dim = self.dim
+            if dim is None:
+                return results
+            # A single probe for the whole batch
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS probe (key BLOB)")
+            self._conn.execute("DELETE FROM probe")
+            self._conn.executemany("INSERT INTO probe VALUES (?)", [(k,) for k in keys])
+            found = self._conn.execute(
+                "SELECT e.key, e.block, e.row, b.n_rows FROM probe p "
+                "JOIN entries e ON e.key = p.key JOIN blocks b ON b.id = e.block"
+            ).fetchall()
+            self._conn.execute("DELETE FROM probe")
+            self._conn.commit()
+
+            by_block: dict[int, list[tuple[bytes, int]]] = {}
+            n_rows: dict[int, int] = {}
+            for key, block, row, block_rows in found:
+                by_block.setdefault(block, []).append((key, row))
+                n_rows[block] = block_rows
+
+            vectors: dict[bytes, np.ndarray] = {}
+            for block, rows in by_block.items():
+                try:
+                    mmap = np.memmap(
+                        self._block_path(block),
+                        dtype=np.float32,
+                        mode="r",
+                        shape=(n_rows[block], dim),
+                    )
+                except (FileNotFoundError, ValueError):
+                    # Evicted by another process
+                    continue
+                block_vectors = np.array(mmap[[row for _, row in rows]])
+                for (key, _), vector in zip(rows, block_vectors, strict=True):
+                    vectors[key] = vector
+                del mmap
+
+            if by_block:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE blocks SET last_access = ? WHERE id = ?",
+                        [(now, block) for block in by_block],
+                    )
+
+        for i, key in enumerate(keys):
+            results[i] = vectors.get(key)
+        return results
+
+    def put(self, keys: Sequence[bytes], vectors: Sequence[Sequence[float]]) -> int:
+        """Store the vectors of the `keys` and return the number of evicted blocks."""
+        if not keys:
+            return 0
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            # NOTE: BEGIN IMMEDIATE takes the write lock, the block files are only written under it. The
+            # eviction runs in the same transaction, so that it sees the blocks refreshed by other processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._put(keys, array)
+                evicted = (
+                    self._evict() if self._disk_size() > self.max_size_bytes else []
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        # The files of the evicted blocks are removed once no entry references them
+        for block in evicted:
+            try:
+                os.remove(self._block_path(block))
+            except FileNotFoundError:
+                pass
+        return len(evicted)
+
+    def _stored_keys(self, keys: Sequence[bytes]) -> set[bytes]:
+        stored: set[bytes] = set()
+        # NOTE: batches below the SQLite limit of variables per statement
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            stored.update(
+                key
+                for (key,) in self._conn.execute(
+                    f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+            )
+        return stored
+
+    def _put(self, keys: Sequence[bytes], array: np.ndarray) -> None:
+        dim = self.dim
+        if dim is None:
+            dim = array.shape[1]
+            self._conn.execute("INSERT INTO meta VALUES ('dim', ?)", (str(dim),))
+        if array.shape[1] != dim:
+            raise ValueError(f"vectors of dimension {array.shape[1]} != {dim}")
+
+        # Keys already stored, e.g. by another process, or repeated in the batch aren't written again: a
+        # replaced entry would leave a dead row in its block, counted in the size of the store
+        stored = self._stored_keys(keys)
+        new_rows = []
+        for i, key in enumerate(keys):
+            if key not in stored:
+                stored.add(key)
+                new_rows.append(i)
+        keys = [keys[i] for i in new_rows]
+        array = array[new_rows]
+
+        now = time.time()
+        offset = 0
+        while offset < len(keys):
+            block, n_rows = self._conn.execute(
+                "SELECT id, n_rows FROM blocks ORDER BY id DESC LIMIT 1"
+            ).fetchone() or (0, self.block_rows)
+            if n_rows >= self.block_rows:
+                block, n_rows = block + 1, 0
+                self._conn.execute("INSERT INTO blocks VALUES (?, 0, ?)", (block, now))
+            rows = array[offset : offset + self.block_rows - n_rows]
+            # Rows are written past the committed ones: leftovers of an interrupted write are overwritten
+            with open(self._block_path(block), "ab+") as f:
+                f.seek(n_rows * dim * 4)
+                f.truncate()
+                f.write(rows.tobytes())
+            self._conn.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?)",
+                [
+                    (key, block, n_rows + i)
+                    for i, key in enumerate(keys[offset : offset + len(rows)])
+                ],
+            )
+            self._conn.execute(
+                "UPDATE blocks SET n_rows = ?, last_access = ? WHERE id = ?",
+                (n_rows + len(rows), now, block),
+            )
+            offset += len(rows)
+
+    def _disk_size(self) -> int:
+        (n_rows,) = self._conn.execute(
+            "SELECT COALESCE(SUM(n_rows), 0) FROM blocks"
+        ).fetchone()
+        return n_rows * (self.dim or 0) * 4
+
+    def _evict(self) -> list[int]:
+        """Delete the entries of the least recently used blocks, in the transaction of the caller."""
+        dim = self.dim or 0
+        blocks = self._conn.execute(
+            "SELECT id, n_rows FROM blocks ORDER BY last_access"
+        ).fetchall()
+        size = sum(n_rows for _, n_rows in blocks) * dim * 4
+        (last_block,) = self._conn.execute("SELECT MAX(id) FROM blocks").fetchone()
+        evicted = []
+        for block, n_rows in blocks:
+            if size <= self.max_size_bytes:
+                break
+            if block == last_block:
+                # NOTE: the block being filled is kept, the next writes append to it
+                continue
+            self._conn.execute("DELETE FROM entries WHERE block = ?", (block,))
+            self._conn.execute("DELETE FROM blocks WHERE id = ?", (block,))
+            size -= n_rows * dim * 4
+            evicted.append(block)
+        return evicted
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings caching the vectors of another `Embeddings` on disk.
+
+    Vectors are keyed by the model identity (see `embedder_model_id`) and the hash of the text, so that the
+    same chunk is embedded once across brains and rebuilds. A batch of texts is looked up in a single probe of
+    the `EmbeddingStore` and only the misses are sent to the underlying embedder.
+    Query embeddings are also kept in an in-memory LRU of `query_cache_size` entries.
+
+    Args:
+        underlying (Embeddings): The embedder computing the missing vectors.
+        cache_dir (Path | None): Directory of the cache. Defaults to the environment variable
+                                 `QUIVR_EMBEDDING_CACHE` or `~/.cache/quivr/embeddings`.
+        max_size_bytes (int): Size cap of the cache of each model. Defaults to 2GB.
+        query_cache_size (int): Number of query embeddings kept in memory.
+        model_id (str | None): Identity of the model, defaults to `embedder_model_id(underlying)`.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        cache_dir: Path | None = None,
+        max_size_bytes: int = 2 * 1024**3,
+        query_cache_size: int = 1024,
+        model_id: str | None = None,
+    ):
+        if cache_dir is None:
+            cache_dir = Path(
+                os.getenv("QUIVR_EMBEDDING_CACHE", "~/.cache/quivr/embeddings")
+            )
+        self.underlying = underlying
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.model_id = model_id or embedder_model_id(underlying)
+        self.query_cache_size = query_cache_size
+        self.stats = EmbeddingCacheStats()
+
+        model_hash = hashlib.sha256(self.model_id.encode("utf-8")).hexdigest()[:16]
+        self.store = EmbeddingStore(self.cache_dir / model_hash, max_size_bytes)
+        self._queries: OrderedDict[str, list[float]] = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"CachedEmbeddings(underlying={self.underlying!r}, stats={self.stats})"
+
+    def _lookup(
+        self, texts: list[str], kind: str
+    ) -> tuple[list[list[float] | None], list[str]]:
+        keys = [_text_key(t, kind) for t in texts]
+        cached = self.store.get(keys)
+        vectors = [v.tolist() if v is not None else None for v in cached]
+        # Duplicated texts are embedded once
+        misses = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        self.stats.hits += len(texts) - sum(v is None for v in vectors)
+        self.stats.misses += len(misses)
+        return vectors, misses
+
+    def _store(
+        self,
+        texts: list[str],
+        vectors: list[list[float] | None],
+        misses: list[str],
+        missing_vectors: list[list[float]],
+        kind: str,
+    ) -> list[list[float]]:
+        self.stats.evictions += self.store.put(
+            [_text_key(t, kind) for t in misses], missing_vectors
+        )
+        self.stats.writes += len(misses)
+        # NOTE: vectors are stored as float32, misses are rounded the same way as hits
+        rounded = np.asarray(missing_vectors, dtype=np.float32).tolist()
+        computed = dict(zip(misses, rounded, strict=True))
+        return [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, misses = self._lookup(texts, "document")
+        missing_vectors = self.underlying.embed_documents(misses) if misses else []
+        return self._store(texts, vectors, misses, missing_vectors, "document")
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, misses = await asyncio.to_thread(self._lookup, texts, "document")
+        missing_vectors = (
+            await self.underlying.aembed_documents(misses) if misses else []
+        )
+        return await asyncio.to_thread(
+            self._store, texts, vectors, misses, missing_vectors, "document"
+        )
+
+    def _cached_query(self, text: str) -> list[float] | None:
+        vector = self._queries.get(text)
+        if vector is not None:
+            self._queries.move_to_end(text)
+            self.stats.query_hits += 1
+        return vector
+
+    def _remember_query(self, text: str, vector: list[float]) -> list[float]:
+        self._queries[text] = vector
+        if len(self._queries) > self.query_cache_size:
+            self._queries.popitem(last=False)
+        return vector
+
+    def embed_query(self, text: str) -> list[float]:
+        if (vector := self._cached_query(text)) is not None:
+            return vector
+        (vector,), misses = self._lookup([text], "query")
+        if vector is None:
+            (vector,) = self._store(
+                [text], [None], misses, [self.underlying.embed_query(text)], "query"
+            )
+        return self._remember_query(text, vector)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        if (vector := self._cached_query(text)) is not None:
+            return vector
+        (vector,), misses = await asyncio.to_thread(self._lookup, [text], "query")
+        if vector is None:
+            vector = await self.underlying.aembed_query(text)
+            (vector,) = await asyncio.to_thread(
+                self._store, [text], [None], misses, [vector], "query"
+            )
+        return self._remember_query(text, vector)
+
+
+def with_embedding_cache(
+    embedder: Embeddings, config: IngestionConfig | None
+) -> Embeddings:
+    """Wrap `embedder` in a `CachedEmbeddings` if the ingestion configuration enables the embedding cache."""
+    if (
+        config is None
+        or config.embedding_cache_dir is None
+        or isinstance(embedder, CachedEmbeddings)
+    ):
+        return embedder
+    return CachedEmbeddings(
+        embedder,
+        cache_dir=config.embedding_cache_dir,
+        max_size_bytes=config.embedding_cache_max_bytes,
+    )
@@ -1,7 +1,7 @@
+import json
 import logging
 from typing import Any, List, Type, TypeVar
 
-import tiktoken
 from langchain_community.document_loaders import (
     BibtexLoader,
     CSVLoader,
@@ -24,6 +24,7 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitte
 from quivr_core.files.file import FileExtension, QuivrFile
 from quivr_core.processor.processor_base import ProcessorBase
 from quivr_core.processor.splitter import SplitterConfig
+from quivr_core.processor.tokenizer import count_tokens
 
 logger = logging.getLogger("quivr_core")
 
@@ -39,12 +40,16 @@ class ProcessorInit(ProcessorBase):
 # dynamically creates Processor classes. Maybe redo this for finer control over instanciation
 # processor classes are opaque as we don't know what params they would have -> not easy to have lsp completion
 def _build_processor(
-    cls_name: str, load_cls: Type[P], cls_extensions: List[FileExtension | str]
+    cls_name: str,
+    load_cls: Type[P],
+    cls_extensions: List[FileExtension | str],
+    cpu_bound: bool = False,
 ) -> Type[ProcessorInit]:
-    enc = tiktoken.get_encoding("cl100k_base")
+    _cpu_bound = cpu_bound
 
     class _Processor(ProcessorBase):
         supported_extensions = cls_extensions
+        cpu_bound = _cpu_bound
 
         def __init__(
             self,
@@ -56,6 +61,7 @@ def _build_processor(
             self.loader_kwargs = loader_kwargs
 
             self.splitter_config = splitter_config
+            self.splitter = splitter
 
             if splitter:
                 self.text_splitter = splitter
@@ -74,6 +80,19 @@ def _build_processor(
                 "splitter": self.splitter_config.model_dump(),
             }
 
+        @property
+        def cache_config(self) -> dict[str, Any] | None:
+            # NOTE: the class is rebuilt by `type` below, super() can't be used
+            config = ProcessorBase.cache_config.fget(self)  # type: ignore[attr-defined]
+            if config is None:
+                return None
+            try:
+                json.dumps(self.loader_kwargs)
+            except TypeError:
+                # Loader arguments that aren't plain values can't be fingerprinted
+                return None
+            return {**config, "loader_kwargs": self.loader_kwargs}
+
         async def process_file_inner(self, file: QuivrFile) -> list[Document]:
             if hasattr(self.loader_cls, "__init__"):
                 # NOTE: mypy can't correctly type this as BaseLoader doesn't have a constructor method
@@ -84,8 +103,9 @@ def _build_processor(
             documents = await loader.aload()
             docs = self.text_splitter.split_documents(documents)
 
-            for doc in docs:
-                doc.metadata = {"chunk_size": len(enc.encode(doc.page_content))}
+            chunk_sizes = count_tokens([d.page_content for d in docs])
+            for doc, chunk_size in zip(docs, chunk_sizes, strict=True):
+                doc.metadata = {"chunk_size": chunk_size}
 
             return docs
 
@@ -100,30 +120,37 @@ DOCXProcessor = _build_processor(
     "DOCXProcessor", Docx2txtLoader, [FileExtension.docx, FileExtension.doc]
 )
 XLSXProcessor = _build_processor(
-    "XLSXProcessor", UnstructuredExcelLoader, [FileExtension.xlsx, FileExtension.xls]
+    "XLSXProcessor",
+    UnstructuredExcelLoader,
+    [FileExtension.xlsx, FileExtension.xls],
+    cpu_bound=True,
 )
 PPTProcessor = _build_processor(
-    "PPTProcessor", UnstructuredPowerPointLoader, [FileExtension.pptx]
+    "PPTProcessor", UnstructuredPowerPointLoader, [FileExtension.pptx], cpu_bound=True
 )
 MarkdownProcessor = _build_processor(
     "MarkdownProcessor",
     UnstructuredMarkdownLoader,
     [FileExtension.md, FileExtension.mdx, FileExtension.markdown],
+    cpu_bound=True,
 )
 EpubProcessor = _build_processor(
-    "EpubProcessor", UnstructuredEPubLoader, [FileExtension.epub]
+    "EpubProcessor", UnstructuredEPubLoader, [FileExtension.epub], cpu_bound=True
 )
 BibTexProcessor = _build_processor("BibTexProcessor", BibtexLoader, [FileExtension.bib])
 ODTProcessor = _build_processor(
-    "ODTProcessor", UnstructuredODTLoader, [FileExtension.odt]
+    "ODTProcessor", UnstructuredODTLoader, [FileExtension.odt], cpu_bound=True
 )
 HTMLProcessor = _build_processor(
-    "HTMLProcessor", UnstructuredHTMLLoader, [FileExtension.html]
+    "HTMLProcessor", UnstructuredHTMLLoader, [FileExtension.html], cpu_bound=True
 )
 PythonProcessor = _build_processor("PythonProcessor", PythonLoader, [FileExtension.py])
 NotebookProcessor = _build_processor(
     "NotebookProcessor", NotebookLoader, [FileExtension.ipynb]
 )
 UnstructuredPDFProcessor = _build_processor(
-    "UnstructuredPDFProcessor", UnstructuredPDFLoader, [FileExtension.pdf]
+    "UnstructuredPDFProcessor",
+    UnstructuredPDFLoader,
+    [FileExtension.pdf],
+    cpu_bound=True,
 )
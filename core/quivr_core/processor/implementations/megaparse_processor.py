@@ -1,7 +1,7 @@
 import logging
 import os
+from typing import Any
 
-import tiktoken
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 from megaparse_sdk import MegaParseSDK
@@ -11,6 +11,7 @@ from quivr_core.files.file import QuivrFile
 from quivr_core.processor.processor_base import ProcessorBase
 from quivr_core.processor.registry import FileExtension
 from quivr_core.processor.splitter import SplitterConfig
+from quivr_core.processor.tokenizer import count_tokens
 
 logger = logging.getLogger("quivr_core")
 
@@ -55,8 +56,8 @@ class MegaparseProcessor(ProcessorBase):
         splitter_config: SplitterConfig = SplitterConfig(),
         megaparse_config: MegaparseConfig = MegaparseConfig(),
     ) -> None:
-        self.enc = tiktoken.get_encoding("cl100k_base")
         self.splitter_config = splitter_config
+        self.splitter = splitter
         self.megaparse_config = megaparse_config
 
         if splitter:
@@ -73,6 +74,13 @@ class MegaparseProcessor(ProcessorBase):
             "chunk_overlap": self.splitter_config.chunk_overlap,
         }
 
+    @property
+    def cache_config(self) -> dict[str, Any] | None:
+        config = super().cache_config
+        if config is None:
+            return None
+        return {**config, "megaparse_config": self.megaparse_config.model_dump()}
+
     async def process_file_inner(self, file: QuivrFile) -> list[Document]:
         api_key = str(os.getenv("MEGAPARSE_API_KEY"))
         megaparse = MegaParseSDK(api_key)
@@ -93,7 +101,8 @@ class MegaparseProcessor(ProcessorBase):
         )
         if len(response) > self.splitter_config.chunk_size:
             docs = self.text_splitter.split_documents([document])
-            for doc in docs:
-                doc.metadata = {"chunk_size": len(self.enc.encode(doc.page_content))}
+            chunk_sizes = count_tokens([d.page_content for d in docs])
+            for doc, chunk_size in zip(docs, chunk_sizes, strict=True):
+                doc.metadata = {"chunk_size": chunk_size}
             return docs
         return [document]
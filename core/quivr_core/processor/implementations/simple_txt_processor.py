@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, AsyncGenerator, Iterator
 
 import aiofiles
 from langchain_core.documents import Document
@@ -8,22 +8,31 @@ from quivr_core.processor.processor_base import ProcessorBase
 from quivr_core.processor.registry import FileExtension
 from quivr_core.processor.splitter import SplitterConfig
 
+READ_BLOCK_SIZE = 1024 * 1024
 
-def recursive_character_splitter(
-    doc: Document, chunk_size: int, chunk_overlap: int
-) -> list[Document]:
+
+def split_text(text: str, chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """
+    Lazily split `text` in chunks of `chunk_size` characters, each chunk overlapping the previous one
+    by `chunk_overlap` characters. Runs in linear time: chunks are sliced by index from the text.
+    """
     assert chunk_overlap < chunk_size, "chunk_overlap is greater than chunk_size"
 
-    if len(doc.page_content) <= chunk_size:
-        return [doc]
+    stride = chunk_size - chunk_overlap
+    start = 0
+    while len(text) - start > chunk_size:
+        yield text[start : start + chunk_size]
+        start += stride
+    yield text[start:]
 
-    chunk = Document(page_content=doc.page_content[:chunk_size], metadata=doc.metadata)
-    remaining = Document(
-        page_content=doc.page_content[chunk_size - chunk_overlap :],
-        metadata=doc.metadata,
-    )
 
-    return [chunk] + recursive_character_splitter(remaining, chunk_size, chunk_overlap)
+def recursive_character_splitter(
+    doc: Document, chunk_size: int, chunk_overlap: int
+) -> list[Document]:
+    return [
+        Document(page_content=chunk, metadata=doc.metadata)
+        for chunk in split_text(doc.page_content, chunk_size, chunk_overlap)
+    ]
 
 
 class SimpleTxtProcessor(ProcessorBase):
@@ -47,14 +56,27 @@ class SimpleTxtProcessor(ProcessorBase):
             "splitter": self.splitter_config.model_dump(),
         }
 
-    async def process_file_inner(self, file: QuivrFile) -> list[Document]:
+    async def process_file_inner_stream(
+        self, file: QuivrFile
+    ) -> AsyncGenerator[Document, None]:
+        chunk_size = self.splitter_config.chunk_size
+        chunk_overlap = self.splitter_config.chunk_overlap
+        assert chunk_overlap < chunk_size, "chunk_overlap is greater than chunk_size"
+        stride = chunk_size - chunk_overlap
+
+        # Only the current block and the unsplit end of the previous one are kept in memory
+        buffer = ""
+        start = 0
         async with aiofiles.open(file.path, mode="r") as f:
-            content = await f.read()
-
-        doc = Document(page_content=content)
+            while block := await f.read(READ_BLOCK_SIZE):
+                buffer = buffer[start:] + block
+                start = 0
+                # The chunk is not the last one while more than chunk_size characters remain
+                while len(buffer) - start > chunk_size:
+                    yield Document(page_content=buffer[start : start + chunk_size])
+                    start += stride
 
-        docs = recursive_character_splitter(
-            doc, self.splitter_config.chunk_size, self.splitter_config.chunk_overlap
-        )
+        yield Document(page_content=buffer[start:])
 
-        return docs
+    async def process_file_inner(self, file: QuivrFile) -> list[Document]:
+        return [doc async for doc in self.process_file_inner_stream(file)]
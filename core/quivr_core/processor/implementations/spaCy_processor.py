@@ -1,5 +1,6 @@
 import logging
 import os
+from typing import Any
 import spacy
 import aiofiles
 import pandas as pd
@@ -35,6 +36,7 @@ class SpaCyProcessor(ProcessorBase):
         FileExtension.txt,
         FileExtension.csv,
     ]
+    cpu_bound = True
 
     def __init__(
         self,
@@ -43,6 +45,7 @@ class SpaCyProcessor(ProcessorBase):
         spacy_model: str = "en_core_web_sm"
     ) -> None:
         # Load spaCy model
+        self.spacy_model = spacy_model
         try:
             self.nlp = spacy.load(spacy_model)
         except Exception as e:
@@ -50,6 +53,7 @@ class SpaCyProcessor(ProcessorBase):
             raise
 
         self.splitter_config = splitter_config
+        self.splitter = splitter
 
         if splitter:
             self.text_splitter = splitter
@@ -66,6 +70,13 @@ class SpaCyProcessor(ProcessorBase):
             "chunk_overlap": self.splitter_config.chunk_overlap,
         }
 
+    @property
+    def cache_config(self) -> dict[str, Any] | None:
+        config = super().cache_config
+        if config is None:
+            return None
+        return {**config, "spacy_model": self.spacy_model}
+
     async def process_file_inner(self, file: QuivrFile) -> list[Document]:
         # Extract text based on file type
         try:
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Hashable
+
+import aiofiles
+import httpx
+
+from quivr_core.files.file import QuivrFile
+
+logger = logging.getLogger("quivr_core")
+
+_READ_BLOCK_SIZE = 64 * 1024
+# Server errors worth retrying, other error statuses are returned to the caller
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class TikaMetrics:
+    n_files: int = 0
+    n_retries: int = 0
+    n_failures: int = 0
+    bytes_sent: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.n_files if self.n_files else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_sent / self.total_latency if self.total_latency else 0.0
+
+
+class TikaClient:
+    """
+    Client of a Tika server, shared by all the TikaProcessor instances sending files to the same server.
+
+    * Requests reuse a pool of keep-alive connections. Connections are bound to an event loop: the client
+      keeps a connection pool per event loop, and closes the pools of the loops that were closed.
+    * At most `max_concurrency` files are parsed at the same time per event loop, to avoid overloading the
+      server.
+    * Failed requests (connection errors, timeouts, 429 and 5xx responses) are retried with an exponential
+      backoff and full jitter. The file is read again from disk at every attempt.
+    * Bytes sent and per-file latencies, of the successful request, are recorded in `metrics`.
+
+    Args:
+        tika_url (str): The URL of the Tika parse endpoint.
+        timeout (float): Timeout of a request in seconds. Large files can take a while to parse.
+        max_concurrency (int): Maximum number of files parsed concurrently.
+        max_retries (int): Maximum number of attempts per file.
+        backoff_base (float): Base delay of the exponential backoff in seconds.
+        backoff_max (float): Maximum delay between two attempts in seconds.
+        keepalive_expiry (float | None): Time in seconds idle connections are kept open.
+    """
+
+    def __init__(
+        self,
+        tika_url: str,
+        timeout: float = 60.0,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        keepalive_expiry: float | None = 5.0,
+    ):
+        self.tika_url = tika_url
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.keepalive_expiry = keepalive_expiry
+        self.metrics = TikaMetrics()
+
+        # Connection pool and concurrency limit of each event loop
+        self._clients: dict[
+            asyncio.AbstractEventLoop, tuple[httpx.AsyncClient, asyncio.Semaphore]
+        ] = {}
+
+    def __repr__(self) -> str:
+        return f"TikaClient(tika_url={self.tika_url}, metrics={self.metrics})"
+
+    async def _connect(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        # NOTE: connections and semaphore are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if loop not in self._clients:
+            for stale_loop in [lp for lp in self._clients if lp.is_closed()]:
+                stale_client, _ = self._clients.pop(stale_loop)
+                await _close_client(stale_client)
+            self._clients[loop] = (
+                httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                ),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+        return self._clients[loop]
+
+    async def aclose(self) -> None:
+        """Close the connection pool of the running event loop, and those of the closed loops."""
+        loop = asyncio.get_running_loop()
+        for client_loop in [lp for lp in self._clients if lp is loop or lp.is_closed()]:
+            client, _ = self._clients.pop(client_loop)
+            await _close_client(client)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def parse(self, file: QuivrFile) -> str:
+        """
+        Send the file to the Tika server and return the extracted text.
+
+        Raises:
+            RuntimeError: If the file can't be parsed after `max_retries` attempts, or the server answered
+                with a client error.
+        """
+        client, semaphore = await self._connect()
+        file_size = os.stat(file.path).st_size
+        headers = {"Accept": "text/plain", "Content-Length": str(file_size)}
+
+        error = ""
+        for attempt in range(self.max_retries):
+            if attempt > 0:
+                self.metrics.n_retries += 1
+                # NOTE: the backoff is spent outside of the semaphore, so that the other files are sent meanwhile
+                await asyncio.sleep(self._backoff(attempt - 1))
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    resp = await client.put(
+                        self.tika_url, headers=headers, content=_read_file(file)
+                    )
+                except httpx.TransportError as e:
+                    error = f"tika url error: {e}"
+                    logger.debug(f"{error}. retrying for the {attempt + 1} time...")
+                    continue
+                latency = time.perf_counter() - start
+
+            if resp.status_code in _RETRY_STATUS:
+                error = f"tika server error {resp.status_code}"
+                logger.debug(f"{error}. retrying for the {attempt + 1} time...")
+                continue
+            if resp.is_error:
+                self.metrics.n_failures += 1
+                raise RuntimeError(
+                    f"can't send parse request to tika server: tika server error {resp.status_code}"
+                )
+
+            self.metrics.n_files += 1
+            self.metrics.bytes_sent += file_size
+            self.metrics.total_latency += latency
+            self.metrics.max_latency = max(self.metrics.max_latency, latency)
+            logger.debug(f"tika parsed {file} ({file_size} bytes) in {latency:.2f}s")
+            return resp.content.decode("utf-8")
+
+        self.metrics.n_failures += 1
+        raise RuntimeError(f"can't send parse request to tika server: {error}")
+
+
+async def _close_client(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except RuntimeError as e:
+        # NOTE: the connections of a closed event loop can't be closed from another loop, their sockets are
+        # closed when garbage collected
+        logger.debug(f"can't close the connections of a closed event loop: {e}")
+
+
+async def _read_file(file: QuivrFile) -> AsyncIterator[bytes]:
+    # NOTE: a new iterator is created for every attempt, so that retries send the whole file
+    async with aiofiles.open(file.path, mode="rb") as f:
+        while block := await f.read(_READ_BLOCK_SIZE):
+            yield block
+
+
+_tika_clients: dict[Hashable, TikaClient] = {}
+# Number of holders of each shared client
+_tika_client_refs: dict[Hashable, int] = {}
+
+
+def get_tika_client(tika_url: str, **client_kwargs) -> TikaClient:
+    """
+    Process-wide Tika client for the server `tika_url` and client configuration.
+
+    Each call takes a reference to the client, returned with `release_tika_client`: the client is closed
+    once all its holders released it.
+    """
+    key = (tika_url, tuple(sorted(client_kwargs.items())))
+    if key not in _tika_clients:
+        _tika_clients[key] = TikaClient(tika_url, **client_kwargs)
+    _tika_client_refs[key] = _tika_client_refs.get(key, 0) + 1
+    return _tika_clients[key]
+
+
+async def release_tika_client(client: TikaClient) -> None:
+    """Release a client returned by `get_tika_client`, closing it if it has no other holder."""
+    key = next((k for k, c in _tika_clients.items() if c is client), None)
+    if key is None:
+        return
+    _tika_client_refs[key] -= 1
+    if _tika_client_refs[key] == 0:
+        del _tika_clients[key], _tika_client_refs[key]
+        await client.aclose()
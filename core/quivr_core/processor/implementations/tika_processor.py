@@ -1,16 +1,19 @@
-import tiktoken
 import logging
 import os
-from typing import AsyncIterable
 
-import httpx
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
 
 from quivr_core.files.file import QuivrFile
+from quivr_core.processor.implementations.tika_client import (
+    TikaClient,
+    get_tika_client,
+    release_tika_client,
+)
 from quivr_core.processor.processor_base import ProcessorBase
 from quivr_core.processor.registry import FileExtension
 from quivr_core.processor.splitter import SplitterConfig
+from quivr_core.processor.tokenizer import count_tokens
 
 logger = logging.getLogger("quivr_core")
 
@@ -33,15 +36,24 @@ class TikaProcessor(ProcessorBase):
         tika_url: str = os.getenv("TIKA_SERVER_URL", "http://localhost:9998/tika"),
         splitter: TextSplitter | None = None,
         splitter_config: SplitterConfig = SplitterConfig(),
-        timeout: float = 5.0,
+        timeout: float = 60.0,
         max_retries: int = 3,
+        max_concurrency: int = 4,
+        client: TikaClient | None = None,
     ) -> None:
         self.tika_url = tika_url
         self.max_retries = max_retries
-        self._client = httpx.AsyncClient(timeout=timeout)
+        # Processors sending files to the same server share their connections and concurrency limit
+        self._shared_client = client is None
+        self.client = client or get_tika_client(
+            tika_url,
+            timeout=timeout,
+            max_retries=max_retries,
+            max_concurrency=max_concurrency,
+        )
 
-        self.enc = tiktoken.get_encoding("cl100k_base")
         self.splitter_config = splitter_config
+        self.splitter = splitter
 
         if splitter:
             self.text_splitter = splitter
@@ -51,18 +63,11 @@ class TikaProcessor(ProcessorBase):
                 chunk_overlap=splitter_config.chunk_overlap,
             )
 
-    async def _send_parse_tika(self, f: AsyncIterable[bytes]) -> str:
-        retry = 0
-        headers = {"Accept": "text/plain"}
-        while retry < self.max_retries:
-            try:
-                resp = await self._client.put(self.tika_url, headers=headers, content=f)
-                resp.raise_for_status()
-                return resp.content.decode("utf-8")
-            except Exception as e:
-                retry += 1
-                logger.debug(f"tika url error :{e}. retrying for the {retry} time...")
-        raise RuntimeError("can't send parse request to tika server")
+    async def aclose(self) -> None:
+        # NOTE: a client passed to the processor is closed by its owner
+        if self._shared_client:
+            self._shared_client = False
+            await release_tika_client(self.client)
 
     @property
     def processor_metadata(self):
@@ -71,11 +76,11 @@ class TikaProcessor(ProcessorBase):
         }
 
     async def process_file_inner(self, file: QuivrFile) -> list[Document]:
-        async with file.open() as f:
-            txt = await self._send_parse_tika(f)
+        txt = await self.client.parse(file)
         document = Document(page_content=txt)
         docs = self.text_splitter.split_documents([document])
-        for doc in docs:
-            doc.metadata = {"chunk_size": len(self.enc.encode(doc.page_content))}
+        chunk_sizes = count_tokens([d.page_content for d in docs])
+        for doc, chunk_size in zip(docs, chunk_sizes, strict=True):
+            doc.metadata = {"chunk_size": chunk_size}
 
         return docs
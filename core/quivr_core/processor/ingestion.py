@@ -0,0 +1,564 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Sequence, Type
+from uuid import UUID, uuid4
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from quivr_core.brain.faiss_index import QuivrFAISS
+from quivr_core.brain.versioned_store import VersionedFAISS
+from quivr_core.files.file import QuivrFile, load_qfile
+from quivr_core.processor.cache import ParseCache, ParseCacheStats
+from quivr_core.processor.embedding import EmbeddingScheduler
+from quivr_core.processor.pool import ProcessorPool, get_processor_pool
+from quivr_core.processor.processor_base import ProcessorBase
+from quivr_core.processor.registry import get_processor_class
+from quivr_core.processor.sandbox import SandboxError, SandboxErrorKind, SandboxPool
+from quivr_core.rag.entities.config import FAISSIndexConfig, IngestionConfig
+from quivr_core.storage.storage_base import StorageBase
+
+logger = logging.getLogger("quivr_core")
+
+
+def _process_file_in_worker(
+    processor_cls: Type[ProcessorBase],
+    processor_kwargs: dict[str, Any],
+    file: QuivrFile,
+    parse_cache: ParseCache | None,
+) -> tuple[list[Document], ParseCacheStats | None]:
+    """Entrypoint of the process pool: parse a single file in a worker process."""
+    # NOTE: each worker process has its own processor pool
+    processor = get_processor_pool().get(processor_cls, **processor_kwargs)
+    docs = asyncio.run(processor.process_file(file, parse_cache))
+    return docs, parse_cache.stats if parse_cache is not None else None
+
+
+_executors_lock = threading.Lock()
+_executors: dict[int, ProcessPoolExecutor] = {}
+
+
+def get_process_executor(max_workers: int) -> Executor:
+    """
+    Process-wide pool of the worker processes parsing the files of CPU-bound processors, created on first
+    use and shut down at exit. The workers outlive the ingestion runs, so that each of them builds its
+    processors (spaCy models, ...) once.
+    """
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        # NOTE: a pool whose worker died can't run tasks anymore, it is replaced
+        if executor is None or getattr(executor, "_broken", False):
+            # NOTE: spawn to avoid forking a process with running threads (tokenizers, event loop)
+            executor = _executors[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return executor
+
+
+@atexit.register
+def _shutdown_process_executors() -> None:
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+class FileParseError(Exception):
+    """
+    Structured error of a file that couldn't be parsed.
+
+    Attributes:
+        file (QuivrFile): The file.
+        kind (SandboxErrorKind): Timeout, memory limit, worker crash or error raised by the processor.
+    """
+
+    def __init__(self, file: QuivrFile, kind: SandboxErrorKind, message: str):
+        super().__init__(f"can't parse {file} ({kind.value}): {message}")
+        self.file = file
+        self.kind = kind
+
+
+class IngestionScheduler:
+    """
+    Schedules the upload and parsing of files with bounded concurrency.
+
+    I/O-bound processors (Tika, Megaparse, ...) run as concurrent tasks on the event loop.
+    CPU-bound processors (Unstructured, spaCy, ...) are offloaded to the process-wide process pool
+    (see `get_process_executor`) so that parsing uses all the cores of the machine.
+    Results are always returned in the order of the input files, whatever the order of completion.
+
+    With `sandbox_parsing`, every file is parsed in a sandboxed worker process with a time and memory limit
+    (see `SandboxPool`), so that a pathological file can't hang or exhaust the ingestion process.
+    Its failure is raised as a `FileParseError`, or recorded in `file_errors` if `skip_file_error` is set.
+
+    Parsed chunks are looked up in `parse_cache` first, so that unchanged files are not parsed again.
+
+    Args:
+        ingestion_config (IngestionConfig | None): Concurrency configuration. Defaults to `IngestionConfig()`.
+        parse_cache (ParseCache | None): Cache of parsed chunks. Defaults to a `ParseCache` in
+                                         `ingestion_config.parse_cache_dir` if set, else no cache.
+        processor_pool (ProcessorPool | None): Pool of the processor instances. Defaults to the process-wide pool.
+    """
+
+    def __init__(
+        self,
+        ingestion_config: IngestionConfig | None = None,
+        parse_cache: ParseCache | None = None,
+        processor_pool: ProcessorPool | None = None,
+    ):
+        self.config = ingestion_config or IngestionConfig()
+        self._sandbox: SandboxPool | None = None
+        self.processor_pool = processor_pool or get_processor_pool()
+        self.file_errors: list[FileParseError] = []
+
+        if parse_cache is None and self.config.parse_cache_dir is not None:
+            parse_cache = ParseCache(
+                cache_dir=self.config.parse_cache_dir,
+                max_size_bytes=self.config.parse_cache_max_bytes,
+            )
+        self.parse_cache = parse_cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._sandbox is not None:
+            self._sandbox.shutdown()
+            self._sandbox = None
+        if self.parse_cache is not None:
+            logger.info(f"parse cache stats: {self.parse_cache.stats}")
+
+    @property
+    def executor(self) -> Executor:
+        return get_process_executor(self.config.max_cpu_workers or os.cpu_count() or 1)
+
+    @property
+    def sandbox(self) -> SandboxPool:
+        if self._sandbox is None:
+            max_rss_mb = self.config.worker_max_rss_mb
+            self._sandbox = SandboxPool(
+                max_workers=self.config.max_cpu_workers or os.cpu_count() or 1,
+                timeout=self.config.parse_timeout,
+                max_rss_bytes=max_rss_mb * 1024**2 if max_rss_mb else None,
+                max_tasks_per_worker=self.config.worker_max_files,
+            )
+        return self._sandbox
+
+    async def aupload_files(
+        self,
+        brain_id: UUID,
+        file_paths: Sequence[str | Path],
+        storage: StorageBase,
+    ) -> list[QuivrFile]:
+        """
+        Load and upload files to the storage, `max_concurrent_uploads` at a time.
+
+        Returns:
+            list[QuivrFile]: The uploaded files, in the order of `file_paths`.
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_uploads)
+
+        async def _upload(path: str | Path) -> QuivrFile:
+            async with semaphore:
+                file = await load_qfile(brain_id, path)
+                await storage.upload_file(file)
+                return file
+
+        return await _gather_or_cancel([_upload(path) for path in file_paths])
+
+    async def aprocess_files(
+        self,
+        files: Sequence[QuivrFile],
+        skip_file_error: bool,
+        **processor_kwargs: Any,
+    ) -> list[Document]:
+        """
+        Parse files concurrently, `max_concurrent_files` at a time.
+
+        Args:
+            files (Sequence[QuivrFile]): The files to parse.
+            skip_file_error (bool): Whether to skip files that cannot be processed.
+            processor_kwargs (dict[str, Any]): Additional arguments for the processor.
+        Returns:
+            list[Document]: The chunks of all files, in the order of `files`.
+        Raises:
+            ValueError: If a file has no extension and skip_file_error is False.
+            Exception: If a file cannot be processed and skip_file_error is False.
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_files)
+
+        async def _process(file: QuivrFile) -> list[Document]:
+            async with semaphore:
+                return await self.aprocess_file(
+                    file, skip_file_error, **processor_kwargs
+                )
+
+        results = await _gather_or_cancel([_process(file) for file in files])
+
+        knowledge: list[Document] = []
+        for docs in results:
+            knowledge.extend(docs)
+        return knowledge
+
+    async def aprocess_file(
+        self,
+        file: QuivrFile,
+        skip_file_error: bool,
+        **processor_kwargs: Any,
+    ) -> list[Document]:
+        if not file.file_extension:
+            logger.error(f"can't find processor for {file}")
+            if skip_file_error:
+                return []
+            raise ValueError(f"can't parse {file}. can't find file extension")
+
+        try:
+            processor_cls = get_processor_class(file.file_extension)
+        except (KeyError, ValueError, ImportError) as e:
+            if skip_file_error:
+                logger.error(f"can't find processor for {file}: {e}")
+                return []
+            raise Exception(f"Can't parse {file}. No available processor") from e
+
+        logger.debug(f"processing {file} using class {processor_cls.__name__}")
+        try:
+            if self.config.sandbox_parsing:
+                return await self._aprocess_file_sandboxed(
+                    processor_cls, processor_kwargs, file
+                )
+            if processor_cls.cpu_bound:
+                loop = asyncio.get_running_loop()
+                docs, cache_stats = await loop.run_in_executor(
+                    self.executor,
+                    _process_file_in_worker,
+                    processor_cls,
+                    processor_kwargs,
+                    file,
+                    self.parse_cache,
+                )
+                if self.parse_cache is not None and cache_stats is not None:
+                    self.parse_cache.stats.merge(cache_stats)
+                return docs
+            processor = self.processor_pool.get(processor_cls, **processor_kwargs)
+            return await processor.process_file(file, self.parse_cache)
+        except Exception as e:
+            if skip_file_error:
+                logger.exception(f"error processing {file}, skipping it: {e}")
+                self.file_errors.append(
+                    e
+                    if isinstance(e, FileParseError)
+                    else FileParseError(file, SandboxErrorKind.ERROR, str(e))
+                )
+                return []
+            raise
+
+    async def _aprocess_file_sandboxed(
+        self,
+        processor_cls: Type[ProcessorBase],
+        processor_kwargs: dict[str, Any],
+        file: QuivrFile,
+    ) -> list[Document]:
+        try:
+            docs, cache_stats = await self.sandbox.arun(
+                _process_file_in_worker,
+                processor_cls,
+                processor_kwargs,
+                file,
+                self.parse_cache,
+            )
+        except SandboxError as e:
+            raise FileParseError(file, e.kind, str(e)) from e
+        if self.parse_cache is not None and cache_stats is not None:
+            self.parse_cache.stats.merge(cache_stats)
+        return docs
+
+    async def astream_files(
+        self,
+        files: Sequence[QuivrFile],
+        skip_file_error: bool,
+        **processor_kwargs: Any,
+    ) -> AsyncGenerator[Document, None]:
+        """
+        Parse files concurrently and yield their chunks as soon as they are produced.
+
+        Each file being parsed buffers at most `chunk_queue_size` chunks: parsing is paused
+        until the downstream stages catch up (backpressure). Chunks are yielded in the order of `files`.
+        With `skip_file_error`, a file failing after some of its chunks were yielded is recorded in
+        `file_errors`, and its chunks are deleted from the vector store by `aindex_documents`.
+
+        Args:
+            files (Sequence[QuivrFile]): The files to parse.
+            skip_file_error (bool): Whether to skip files that cannot be processed.
+            processor_kwargs (dict[str, Any]): Additional arguments for the processor.
+        Yields:
+            Document: The chunks of the files.
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_files)
+        # The chunk queues of the started files, in the order of `files`, then None
+        started: asyncio.Queue = asyncio.Queue()
+        producers: set[asyncio.Task] = set()
+
+        async def _produce(file: QuivrFile, queue: asyncio.Queue):
+            try:
+                try:
+                    async for doc in self.astream_file(
+                        file, skip_file_error, **processor_kwargs
+                    ):
+                        await queue.put(doc)
+                except Exception as e:
+                    await queue.put(_FileError(e))
+                    return
+                await queue.put(_END_OF_FILE)
+            finally:
+                semaphore.release()
+
+        async def _start():
+            # NOTE: the task and queue of a file are created once a parsing slot is free
+            for file in files:
+                await semaphore.acquire()
+                queue: asyncio.Queue = asyncio.Queue(
+                    maxsize=self.config.chunk_queue_size
+                )
+                task = asyncio.create_task(_produce(file, queue))
+                producers.add(task)
+                task.add_done_callback(producers.discard)
+                await started.put(queue)
+            await started.put(None)
+
+        starter = asyncio.create_task(_start())
+        try:
+            while (queue := await started.get()) is not None:
+                while (item := await queue.get()) is not _END_OF_FILE:
+                    if isinstance(item, _FileError):
+                        raise item.error
+                    yield item
+        finally:
+            starter.cancel()
+            tasks = [starter, *producers]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def astream_file(
+        self,
+        file: QuivrFile,
+        skip_file_error: bool,
+        **processor_kwargs: Any,
+    ) -> AsyncGenerator[Document, None]:
+        if (
+            not file.file_extension
+            or self.config.sandbox_parsing
+            or _is_cpu_bound(file)
+        ):
+            # NOTE: files parsed in a worker process are sent back all at once
+            for doc in await self.aprocess_file(
+                file, skip_file_error, **processor_kwargs
+            ):
+                yield doc
+            return
+
+        n_chunks = 0
+        try:
+            processor = self.processor_pool.get(
+                get_processor_class(file.file_extension), **processor_kwargs
+            )
+            async for doc in processor.process_file_stream(file, self.parse_cache):
+                n_chunks += 1
+                yield doc
+        except Exception as e:
+            if not skip_file_error:
+                raise
+            logger.exception(
+                f"error processing {file} after {n_chunks} chunks, skipping the rest of it: {e}"
+            )
+            self.file_errors.append(
+                FileParseError(file, SandboxErrorKind.ERROR, str(e))
+            )
+
+    async def aindex_documents(
+        self,
+        chunks: AsyncIterable[Document],
+        embedder: Embeddings,
+        vector_db: VectorStore | None = None,
+        on_indexed: Callable[[list[Document]], None] | None = None,
+    ) -> VectorStore:
+        """
+        Embed a stream of chunks with an `EmbeddingScheduler` and add them to the vector store.
+
+        Chunks are packed into requests of at most `embedding_batch_tokens` tokens and `embedding_batch_size`
+        chunks, sent concurrently under the configured rate limits. Embedding and indexing run as two stages
+        connected by a bounded queue, so that parsing, embedding and indexing overlap. Chunks without an id are assigned a random one. If `vector_db` is None, a FAISS vector store is created from the first batch.
+        If the vector store is not a FAISS store, the batches are added with `aadd_documents`.
+
+        Args:
+            chunks (AsyncIterable[Document]): The chunks to index.
+            embedder (Embeddings): The embeddings used to create the index.
+            vector_db (VectorStore | None): The vector store to add the chunks to.
+            on_indexed (Callable[[list[Document]], None] | None): Called with each batch of chunks once it was
+                added to the vector store, e.g. to track the chunks to delete if the ingestion fails.
+        Returns:
+            VectorStore: The vector store containing the chunks.
+        Raises:
+            ValueError: If `vector_db` is None and there are no chunks.
+        """
+        try:
+            from langchain_community.vectorstores import FAISS
+
+            add_embeddings = vector_db is None or isinstance(
+                vector_db, (FAISS, VersionedFAISS)
+            )
+        except ImportError as e:
+            if vector_db is None:
+                raise ImportError(
+                    "Please provide a valid vector store or install quivr-core['base'] package for using the default one."
+                ) from e
+            add_embeddings = False
+
+        batches: asyncio.Queue = asyncio.Queue(maxsize=self.config.embedding_queue_size)
+        n_errors = len(self.file_errors)
+        # Chunk ids of each file, to delete the chunks of a file failing partway
+        file_chunk_ids: dict[Any, list[str]] = {}
+
+        async def _with_ids():
+            async for chunk in chunks:
+                # NOTE: chunk ids are used to delete the chunks of a file from the vector store
+                if chunk.id is None:
+                    chunk.id = str(uuid4())
+                yield chunk
+
+        async def _embed():
+            if add_embeddings:
+                scheduler = EmbeddingScheduler.from_config(embedder, self.config)
+                async for batch, vectors in scheduler.astream(_with_ids()):
+                    await batches.put((batch, vectors))
+            else:
+                # The vector store embeds the documents itself
+                batch: list[Document] = []
+                async for chunk in _with_ids():
+                    batch.append(chunk)
+                    if len(batch) >= self.config.embedding_batch_size:
+                        await batches.put((batch, None))
+                        batch = []
+                if batch:
+                    await batches.put((batch, None))
+            await batches.put(None)
+
+        def _indexed(batch: list[Document]) -> None:
+            for chunk in batch:
+                if (file_id := chunk.metadata.get("qfile_id")) is not None:
+                    file_chunk_ids.setdefault(file_id, []).append(chunk.id)
+            if on_indexed is not None:
+                on_indexed(batch)
+
+        async def _index():
+            nonlocal vector_db
+            n_chunks = 0
+            while (item := await batches.get()) is not None:
+                batch, vectors = item
+                if vectors is None:
+                    assert vector_db is not None
+                    await vector_db.aadd_documents(batch)
+                else:
+                    adding = asyncio.ensure_future(
+                        asyncio.to_thread(
+                            _add_faiss_embeddings,
+                            vector_db,
+                            embedder,
+                            batch,
+                            vectors,
+                            self.config.faiss_index_config,
+                        )
+                    )
+                    try:
+                        vector_db = await asyncio.shield(adding)
+                    except asyncio.CancelledError:
+                        # NOTE: the thread adding the batch can't be interrupted, the batch is reported as
+                        # indexed before the cancellation propagates
+                        vector_db = await adding
+                        _indexed(batch)
+                        raise
+                n_chunks += len(batch)
+                _indexed(batch)
+            logger.debug(f"added {n_chunks} chunks to vectordb")
+
+        await _gather_or_cancel([_embed(), _index()])
+
+        if vector_db is None:
+            raise ValueError("can't initialize brain without documents")
+        if isinstance(vector_db, (QuivrFAISS, VersionedFAISS)):
+            # Trains the index if fewer than `train_size` vectors were added, publishes the chunks of a
+            # versioned store
+            await asyncio.to_thread(vector_db.flush)
+
+        failed_ids = [
+            chunk_id
+            for error in self.file_errors[n_errors:]
+            for chunk_id in file_chunk_ids.get(error.file.id, [])
+        ]
+        if failed_ids:
+            await vector_db.adelete(failed_ids)
+            logger.info(f"deleted {len(failed_ids)} chunks of the skipped files")
+        return vector_db
+
+
+class _FileError:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+_END_OF_FILE = object()
+
+
+def _is_cpu_bound(file: QuivrFile) -> bool:
+    try:
+        return get_processor_class(file.file_extension).cpu_bound
+    except (KeyError, ValueError, ImportError):
+        # aprocess_file handles the missing processor
+        return True
+
+
+def _add_faiss_embeddings(
+    vector_db: VectorStore | None,
+    embedder: Embeddings,
+    batch: list[Document],
+    vectors: list[list[float]],
+    index_config: FAISSIndexConfig,
+) -> VectorStore:
+    from langchain_community.vectorstores import FAISS
+
+    text_embeddings = list(zip([d.page_content for d in batch], vectors, strict=True))
+    metadatas = [d.metadata for d in batch]
+    ids = [d.id or str(uuid4()) for d in batch]
+
+    if vector_db is None:
+        from quivr_core.brain.brain_defaults import build_faiss_vectordb
+
+        vector_db = build_faiss_vectordb(embedder, len(vectors[0]), index_config)
+    assert isinstance(vector_db, (FAISS, VersionedFAISS))
+    vector_db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return vector_db
+
+
+async def _gather_or_cancel(coros: list) -> list:
+    """Gather coroutines, cancelling the pending ones as soon as one of them fails."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,78 @@
+import logging
+from typing import Any, Hashable, Type, TypeVar
+
+from pydantic import BaseModel
+
+from quivr_core.processor.processor_base import ProcessorBase
+
+logger = logging.getLogger("quivr_core")
+
+P = TypeVar("P", bound=ProcessorBase)
+
+
+def _freeze(value: Any) -> Hashable:
+    """Hashable representation of processor kwargs, used as a key of the pool."""
+    if isinstance(value, BaseModel):
+        return (type(value), _freeze(value.model_dump()))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        # Unhashable objects (e.g. a text splitter) are shared by identity
+        return ("__id__", id(value))
+
+
+class ProcessorPool:
+    """
+    Pool of processor instances, keyed by processor class and constructor kwargs.
+
+    Building some processors is expensive (loading a spaCy model, opening an HTTP connection pool, ...):
+    the pool builds each configuration once and hands the same instance to every file using it.
+    Processors are shared by concurrent tasks, so they must not keep per-file state.
+
+    Processors are released with `aclose`, e.g. when the application shuts down.
+    """
+
+    def __init__(self) -> None:
+        self._processors: dict[Hashable, tuple[ProcessorBase, dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._processors)
+
+    def get(self, processor_cls: Type[P], **processor_kwargs: Any) -> P:
+        """
+        Get the processor of class `processor_cls` built with `processor_kwargs`, building it on first use.
+        """
+        key = (processor_cls, _freeze(processor_kwargs))
+        if key not in self._processors:
+            logger.debug(f"building processor {processor_cls.__name__}")
+            # NOTE: the kwargs are kept alive with the processor, as unhashable kwargs are keyed by id
+            self._processors[key] = (
+                processor_cls(**processor_kwargs),
+                processor_kwargs,
+            )
+        return self._processors[key][0]  # type: ignore
+
+    async def aclose(self) -> None:
+        """Close all the processors of the pool and empty it."""
+        processors = [processor for processor, _ in self._processors.values()]
+        self._processors.clear()
+        for processor in processors:
+            try:
+                await processor.aclose()
+            except Exception as e:
+                logger.warning(f"error closing processor {processor}: {e}")
+
+
+_processor_pool = ProcessorPool()
+
+
+def get_processor_pool() -> ProcessorPool:
+    """Process-wide processor pool, reused across ingestion runs."""
+    return _processor_pool
@@ -1,20 +1,33 @@
 import logging
 from abc import ABC, abstractmethod
+from contextlib import aclosing
+from functools import lru_cache
 from importlib.metadata import PackageNotFoundError, version
-from typing import Any
+from typing import TYPE_CHECKING, Any, AsyncGenerator
 
 from langchain_core.documents import Document
 
 from quivr_core.files.file import FileExtension, QuivrFile
 
+if TYPE_CHECKING:
+    from quivr_core.processor.cache import ParseCache
+
 logger = logging.getLogger("quivr_core")
 
 
-# TODO: processors should be cached somewhere ?
-# The processor should be cached by processor type
-# The cache should use a single
+@lru_cache(maxsize=None)
+def quivr_core_version() -> str:
+    try:
+        return version("quivr-core")
+    except PackageNotFoundError:
+        return "dev"
+
+
+# NOTE: processors are cached by class and kwargs in the ProcessorPool (see processor/pool.py)
 class ProcessorBase(ABC):
     supported_extensions: list[FileExtension | str]
+    # CPU-bound processors are run in a process pool during ingestion
+    cpu_bound: bool = False
 
     def check_supported(self, file: QuivrFile):
         if file.file_extension not in self.supported_extensions:
@@ -25,30 +38,79 @@ class ProcessorBase(ABC):
     def processor_metadata(self) -> dict[str, Any]:
         raise NotImplementedError
 
-    async def process_file(self, file: QuivrFile) -> list[Document]:
+    @property
+    def cache_config(self) -> dict[str, Any] | None:
+        """
+        The settings changing the chunks of the processor besides `processor_metadata`, part of the key of
+        the parse cache. None if they can't be fingerprinted, e.g. a custom text splitter: the files of the
+        processor are then not cached.
+        """
+        if getattr(self, "splitter", None) is not None:
+            return None
+        splitter_config = getattr(self, "splitter_config", None)
+        return {
+            "splitter_config": splitter_config.model_dump()
+            if splitter_config is not None
+            else None
+        }
+
+    async def aclose(self) -> None:
+        """Release the resources of the processor (HTTP clients, models, ...)."""
+        pass
+
+    async def process_file(
+        self, file: QuivrFile, parse_cache: "ParseCache | None" = None
+    ) -> list[Document]:
+        return [doc async for doc in self.process_file_stream(file, parse_cache)]
+
+    async def process_file_stream(
+        self, file: QuivrFile, parse_cache: "ParseCache | None" = None
+    ) -> AsyncGenerator[Document, None]:
+        """
+        Async-generator variant of `process_file`: chunks are yielded as soon as they are produced.
+        If a `parse_cache` is provided, the file is only parsed if its chunks are not already cached.
+
+        File and processor metadata are computed once per file: all the chunks of the file share
+        the same metadata values instead of holding their own copies.
+        """
         logger.debug(f"Processing file {file}")
         self.check_supported(file)
-        docs = await self.process_file_inner(file)
-        try:
-            qvr_version = version("quivr-core")
-        except PackageNotFoundError:
-            qvr_version = "dev"
-
-        for idx, doc in enumerate(docs, start=1):
-            if "original_file_name" in doc.metadata:
-                doc.page_content = f"Filename: {doc.metadata['original_file_name']} Content: {doc.page_content}"
-            doc.page_content = doc.page_content.replace("\u0000", "")
-            doc.page_content = doc.page_content.encode("utf-8", "replace").decode(
-                "utf-8"
-            )
-            doc.metadata = {
-                "chunk_index": idx,
-                "quivr_core_version": qvr_version,
-                **file.metadata,
-                **doc.metadata,
-                **self.processor_metadata,
-            }
-        return docs
+        qvr_version = quivr_core_version()
+        file_metadata = file.metadata
+        processor_metadata = self.processor_metadata
+
+        inner_stream = (
+            parse_cache.aprocess(self, file)
+            if parse_cache is not None
+            else self.process_file_inner_stream(file)
+        )
+
+        idx = 0
+        # NOTE: closed with the stream, so that an interrupted parse cache entry is discarded
+        async with aclosing(inner_stream):
+            async for doc in inner_stream:
+                idx += 1
+                if "original_file_name" in doc.metadata:
+                    doc.page_content = f"Filename: {doc.metadata['original_file_name']} Content: {doc.page_content}"
+                doc.page_content = doc.page_content.replace("\u0000", "")
+                doc.page_content = doc.page_content.encode("utf-8", "replace").decode(
+                    "utf-8"
+                )
+                doc.metadata = {
+                    "chunk_index": idx,
+                    "quivr_core_version": qvr_version,
+                    **file_metadata,
+                    **doc.metadata,
+                    **processor_metadata,
+                }
+                yield doc
+
+    async def process_file_inner_stream(
+        self, file: QuivrFile
+    ) -> AsyncGenerator[Document, None]:
+        # NOTE: processors able to produce chunks incrementally should override this method
+        for doc in await self.process_file_inner(file):
+            yield doc
 
     @abstractmethod
     async def process_file_inner(self, file: QuivrFile) -> list[Document]:
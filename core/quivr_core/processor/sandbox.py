@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from enum import Enum
+from multiprocessing.connection import Connection
+from typing import Any, Callable
+
+logger = logging.getLogger("quivr_core")
+
+# Exit code of a worker killed by its memory watchdog
+_MEMORY_EXIT_CODE = 75
+_WATCHDOG_INTERVAL = 0.05
+
+
+class SandboxErrorKind(str, Enum):
+    TIMEOUT = "timeout"
+    MEMORY = "memory"
+    CRASH = "crash"
+    ERROR = "error"
+
+
+class SandboxError(Exception):
+    """
+    Failure of a task run in a sandboxed worker.
+
+    Attributes:
+        kind (SandboxErrorKind): Timeout, memory limit, worker crash, or exception raised by the task.
+        error_type (str | None): Name of the exception raised by the task, for `SandboxErrorKind.ERROR`.
+    """
+
+    def __init__(
+        self, kind: SandboxErrorKind, message: str, error_type: str | None = None
+    ):
+        super().__init__(message)
+        self.kind = kind
+        self.error_type = error_type
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        # NOTE: peak RSS on platforms without procfs, in bytes on macOS and KB elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _memory_watchdog(max_rss_bytes: int) -> None:
+    while True:
+        if _rss_bytes() > max_rss_bytes:
+            # Can't raise in the thread running the task: kill the worker, the pool reports the error
+            os._exit(_MEMORY_EXIT_CODE)
+        time.sleep(_WATCHDOG_INTERVAL)
+
+
+def _worker_main(conn: Connection, max_rss_bytes: int | None) -> None:
+    if max_rss_bytes is not None:
+        threading.Thread(
+            target=_memory_watchdog, args=(max_rss_bytes,), daemon=True
+        ).start()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        except Exception as e:
+            # The task can't be unpickled
+            conn.send(("started",))
+            conn.send(("error", type(e).__name__, str(e)))
+            continue
+        if task is None:
+            return
+
+        # NOTE: the task is unpickled, its modules are imported: the time limit starts now
+        conn.send(("started",))
+        fn, args = task
+        try:
+            result = ("ok", fn(*args))
+        except Exception as e:
+            result = ("error", type(e).__name__, f"{e}\n{traceback.format_exc()}")
+        conn.send(result)
+
+
+class _Worker:
+    def __init__(self, max_rss_bytes: int | None):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, max_rss_bytes), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.n_tasks = 0
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pool of worker processes running tasks in isolation from the caller's process.
+
+    Unlike a `ProcessPoolExecutor`, a single misbehaving task can be killed without breaking the other ones:
+    * a task running longer than `timeout` seconds is killed with its worker. The time spent starting the
+      worker and importing the modules of the task doesn't count,
+    * a worker using more than `max_rss_bytes` of memory is killed by a watchdog thread,
+    * a worker is replaced by a fresh process after `max_tasks_per_worker` tasks, releasing leaked memory.
+
+    Failures are raised as `SandboxError`, and the killed workers are replaced on the next task.
+
+    Args:
+        max_workers (int): Number of worker processes.
+        timeout (float | None): Wall-clock time limit of a task in seconds.
+        max_rss_bytes (int | None): Memory limit of a worker process.
+        max_tasks_per_worker (int | None): Number of tasks after which a worker is recycled.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        timeout: float | None = None,
+        max_rss_bytes: int | None = None,
+        max_tasks_per_worker: int | None = None,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_rss_bytes = max_rss_bytes
+        self.max_tasks_per_worker = max_tasks_per_worker
+
+        self._idle: list[_Worker] = []
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+            self._loop = loop
+        return self._semaphore
+
+    async def arun(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run `fn(*args)` in a worker process and return its result.
+        `fn`, its arguments and its result must be picklable.
+
+        Raises:
+            SandboxError: If the task timed out, its worker ran out of memory or crashed, or `fn` raised.
+        """
+        async with self._get_semaphore():
+            worker = self._idle.pop() if self._idle else _Worker(self.max_rss_bytes)
+            try:
+                result = await self._arun(worker, fn, args)
+            except BaseException:
+                # Timeout, crash or cancellation: the state of the worker is unknown
+                worker.kill()
+                raise
+
+            worker.n_tasks += 1
+            if (
+                self.max_tasks_per_worker is not None
+                and worker.n_tasks >= self.max_tasks_per_worker
+            ):
+                await asyncio.to_thread(worker.stop)
+            else:
+                self._idle.append(worker)
+
+        if result[0] == "error":
+            _, error_type, message = result
+            raise SandboxError(SandboxErrorKind.ERROR, message, error_type=error_type)
+        return result[1]
+
+    async def _arun(self, worker: _Worker, fn: Callable[..., Any], args: tuple):
+        try:
+            worker.conn.send((fn, args))
+            started = await asyncio.to_thread(worker.conn.recv)
+            assert started == ("started",)
+            # NOTE: poll returns as soon as the worker answers or dies
+            ready = await asyncio.to_thread(worker.conn.poll, self.timeout)
+            if not ready:
+                raise SandboxError(
+                    SandboxErrorKind.TIMEOUT, f"task timed out after {self.timeout}s"
+                )
+            return await asyncio.to_thread(worker.conn.recv)
+        except (EOFError, OSError):
+            worker.process.join(timeout=1)
+            if worker.process.exitcode == _MEMORY_EXIT_CODE:
+                raise SandboxError(
+                    SandboxErrorKind.MEMORY,
+                    f"worker exceeded the memory limit of {self.max_rss_bytes} bytes",
+                )
+            raise SandboxError(
+                SandboxErrorKind.CRASH,
+                f"worker crashed with exit code {worker.process.exitcode}",
+            )
+
+    def shutdown(self) -> None:
+        for worker in self._idle:
+            worker.stop()
+        self._idle = []
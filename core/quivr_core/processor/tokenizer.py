@@ -0,0 +1,35 @@
+import os
+from functools import lru_cache
+
+import tiktoken
+
+DEFAULT_ENCODING = "cl100k_base"
+
+# Below this number of texts, spawning encoding threads costs more than it saves
+_MIN_BATCH_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING) -> tiktoken.Encoding:
+    """Process-wide cache of the tiktoken encodings, loaded on first use."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(texts: list[str], encoding_name: str = DEFAULT_ENCODING) -> list[int]:
+    """
+    Count the tokens of each text, e.g. for the `chunk_size` metadata of chunks.
+
+    Large batches are encoded in parallel with tiktoken `encode_ordinary_batch`, which releases the GIL.
+    Special tokens are counted as plain text.
+
+    Args:
+        texts (list[str]): The texts to count the tokens of.
+        encoding_name (str): The name of the tiktoken encoding. Defaults to `cl100k_base`.
+    Returns:
+        list[int]: The number of tokens of each text.
+    """
+    enc = get_encoding(encoding_name)
+    if len(texts) < _MIN_BATCH_SIZE:
+        return [len(enc.encode_ordinary(t)) for t in texts]
+    tokens = enc.encode_ordinary_batch(texts, num_threads=min(8, os.cpu_count() or 1))
+    return [len(t) for t in tokens]
@@ -0,0 +1,202 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.prompts import format_document
+from langchain_core.prompts.base import BasePromptTemplate
+
+from quivr_core.rag.entities.config import ContextPackingPolicy
+from quivr_core.rag.prompts import custom_prompts
+from quivr_core.rag.utils import combine_documents
+
+logger = logging.getLogger("quivr_core")
+
+# Fraction of `max_context_tokens` filled, a margin for the role and formatting tokens
+SAFETY_FACTOR = 0.85
+
+# A packing order: ("doc", i) or ("history", i) items, by decreasing priority
+PackingOrder = List[Tuple[str, int]]
+
+
+def relevance_first(n_pairs: int, n_docs: int) -> PackingOrder:
+    """The chunks in relevance order, then the chat history from the most recent pair."""
+    return [("doc", i) for i in range(n_docs)] + [
+        ("history", i) for i in reversed(range(n_pairs))
+    ]
+
+
+def recency_first(n_pairs: int, n_docs: int) -> PackingOrder:
+    """The chat history from the most recent pair, then the chunks in relevance order."""
+    return [("history", i) for i in reversed(range(n_pairs))] + [
+        ("doc", i) for i in range(n_docs)
+    ]
+
+
+_POLICIES: Dict[ContextPackingPolicy, Callable[[int, int], PackingOrder]] = {
+    ContextPackingPolicy.RELEVANCE: relevance_first,
+    ContextPackingPolicy.RECENCY: recency_first,
+}
+
+
+class ContextPacker:
+    """
+    Selects the chat history and chunks of a prompt fitting its token budget, in a single pass.
+
+    Each component of the prompt is tokenized once: the fixed part of the prompt (instructions, question...),
+    each pair of chat messages and each formatted chunk. The counts of the history pairs and chunks are
+    cached, so that the following requests of a conversation, or the retrieval loops, don't tokenize them
+    again. The components are then kept in the order of the packing policy while they fit in
+    `max_context_tokens * SAFETY_FACTOR`: the history is cut at its first pair that doesn't fit and the
+    chunks at their first chunk that doesn't fit, so that the most recent pairs and the most relevant chunks
+    are kept. The most relevant chunk is always kept.
+
+    Args:
+        count_tokens (Callable[[str], int]): Counts the tokens of a text, e.g. `LLMEndpoint.count_tokens`.
+        policy (ContextPackingPolicy | Callable[[int, int], PackingOrder]): The priority of the history pairs
+            and chunks, given their numbers. Defaults to the chunks first, see `ContextPackingPolicy`.
+        max_cached (int): Number of token counts cached, least recently used first evicted. The cache is
+            shared by the requests of the pipeline, across threads.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        policy: Union[
+            ContextPackingPolicy, Callable[[int, int], PackingOrder]
+        ] = ContextPackingPolicy.RELEVANCE,
+        max_cached: int = 4096,
+    ):
+        self._count_tokens = count_tokens
+        self.policy = _POLICIES[policy] if isinstance(policy, str) else policy
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._counts: OrderedDict[str, int] = OrderedDict()
+
+    def count(self, text: str) -> int:
+        """The number of tokens of `text`, cached."""
+        with self._lock:
+            n = self._counts.get(text)
+            if n is not None:
+                self._counts.move_to_end(text)
+                return n
+
+        # NOTE: tokenized outside of the lock, the other requests aren't blocked
+        n = self._count_tokens(text)
+        with self._lock:
+            self._counts[text] = n
+            self._counts.move_to_end(text)
+            while len(self._counts) > self.max_cached:
+                self._counts.popitem(last=False)
+        return n
+
+    def _history_pairs(
+        self, chat_history: Sequence[BaseMessage]
+    ) -> List[Sequence[BaseMessage]]:
+        return [chat_history[i : i + 2] for i in range(0, len(chat_history), 2)]
+
+    def _pair_tokens(self, pair: Sequence[BaseMessage]) -> int:
+        return self.count(get_buffer_string(pair) + "\n")
+
+    def _doc_tokens(self, doc: Document) -> int:
+        # NOTE: counted with a constant source index, the chunks are numbered when combined
+        text = format_document(
+            Document(
+                page_content=doc.page_content, metadata={**doc.metadata, "index": 0}
+            ),
+            custom_prompts.DEFAULT_DOCUMENT_PROMPT,
+        )
+        return self.count(text + "\n\n")
+
+    def _base_tokens(
+        self, inputs: Dict[str, Any], prompt: BasePromptTemplate, has_docs: bool
+    ) -> int:
+        base_inputs = {**inputs}
+        if "chat_history" in inputs:
+            base_inputs["chat_history"] = []
+        if has_docs and "context" in inputs:
+            base_inputs["context"] = ""
+        return self._count_tokens(prompt.format(**base_inputs))
+
+    def context_length(
+        self,
+        inputs: Dict[str, Any],
+        prompt: BasePromptTemplate,
+        docs: List[Document] | None = None,
+    ) -> int:
+        """The number of tokens of the prompt formatted with `inputs`, with the `docs` as context."""
+        pairs = self._history_pairs(inputs.get("chat_history", []))
+        return (
+            self._base_tokens(inputs, prompt, bool(docs))
+            + sum(self._pair_tokens(p) for p in pairs)
+            + sum(self._doc_tokens(d) for d in docs or [])
+        )
+
+    def pack(
+        self,
+        inputs: Dict[str, Any],
+        prompt: BasePromptTemplate,
+        docs: List[Document] | None = None,
+        max_context_tokens: int = 2000,
+    ) -> Tuple[Dict[str, Any], List[Document] | None]:
+        """
+        Select the chat history and chunks fitting in the token budget of the prompt.
+
+        Args:
+            inputs (Dict[str, Any]): The inputs of the prompt, with the chat messages in `chat_history` and
+                the chunks in `context`.
+            prompt (BasePromptTemplate): The prompt.
+            docs (List[Document] | None): The chunks, by decreasing relevance.
+            max_context_tokens (int): The token budget of the prompt.
+        Returns:
+            Tuple[Dict[str, Any], List[Document] | None]: The inputs with the kept chat messages and chunks,
+            and the kept chunks.
+        """
+        chat_history = inputs.get("chat_history", [])
+        pairs = self._history_pairs(chat_history)
+        pair_tokens = [self._pair_tokens(p) for p in pairs]
+        doc_tokens = [self._doc_tokens(d) for d in docs or []]
+        base = self._base_tokens(inputs, prompt, bool(docs))
+        budget = max_context_tokens * SAFETY_FACTOR
+        if base + sum(pair_tokens) + sum(doc_tokens) <= budget:
+            return inputs, docs
+
+        remaining = budget - base
+        kept_docs: set[int] = set()
+        kept_pairs: set[int] = set()
+        if doc_tokens:
+            # The most relevant chunk is always kept
+            kept_docs.add(0)
+            remaining -= doc_tokens[0]
+        docs_full = history_full = False
+        for kind, i in self.policy(len(pairs), len(doc_tokens)):
+            if kind == "doc" and i not in kept_docs and not docs_full:
+                if doc_tokens[i] <= remaining:
+                    kept_docs.add(i)
+                    remaining -= doc_tokens[i]
+                else:
+                    docs_full = True
+            elif kind == "history" and not history_full:
+                if pair_tokens[i] <= remaining:
+                    kept_pairs.add(i)
+                    remaining -= pair_tokens[i]
+                else:
+                    history_full = True
+        if remaining < 0:
+            logger.warning(
+                f"Not enough context to reduce. The context length is {budget - remaining:.0f} "
+                f"which is greater than the max context tokens of {max_context_tokens}"
+            )
+
+        inputs = {**inputs}
+        if "chat_history" in inputs:
+            inputs["chat_history"] = [
+                message for i in sorted(kept_pairs) for message in pairs[i]
+            ]
+        if docs and len(kept_docs) < len(docs):
+            docs = [docs[i] for i in sorted(kept_docs)]
+            if "context" in inputs:
+                inputs["context"] = combine_documents(docs)
+        return inputs, docs
@@ -1,10 +1,11 @@
 import os
 import re
+from pathlib import Path
 import logging
 from enum import Enum
 from typing import Dict, Hashable, List, Optional, Union, Any, Type
 from uuid import UUID
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from langgraph.graph import START, END
 from langchain_core.tools import BaseTool
 from quivr_core.config import MegaparseConfig
@@ -383,8 +384,8 @@ class WorkflowConfig(QuivrBaseConfig):
     name: str | None = None
     nodes: List[NodeConfig] = []
     available_tools: List[str] | None = None
-    validated_tools: List[BaseTool | Type] = []
-    activated_tools: List[BaseTool | Type] = []
+    validated_tools: List[BaseTool | Type] = Field(default_factory=list)
+    activated_tools: List[BaseTool | Type] = Field(default_factory=list)
 
     def __init__(self, **data):
         super().__init__(**data)
@@ -424,6 +425,13 @@ class WorkflowConfig(QuivrBaseConfig):
                         )
 
 
+class ContextPackingPolicy(str, Enum):
+    # The most relevant chunks first, then the most recent chat history
+    RELEVANCE = "relevance"
+    # The most recent chat history first, then the most relevant chunks
+    RECENCY = "recency"
+
+
 class RetrievalConfig(QuivrBaseConfig):
     reranker_config: RerankerConfig = RerankerConfig()
     llm_config: LLMEndpointConfig = LLMEndpointConfig()
@@ -431,6 +439,8 @@ class RetrievalConfig(QuivrBaseConfig):
     max_files: int = 20
     k: int = 40  # Number of chunks returned by the retriever
     prompt: str | None = None
+    # What is kept in the prompt when the chunks and chat history exceed `max_context_tokens`
+    context_packing: ContextPackingPolicy = ContextPackingPolicy.RELEVANCE
     workflow_config: WorkflowConfig = WorkflowConfig(nodes=DefaultWorkflow.RAG.nodes)
 
     def __init__(self, **data):
@@ -443,8 +453,84 @@ class ParserConfig(QuivrBaseConfig):
     megaparse_config: MegaparseConfig = MegaparseConfig()
 
 
+class FAISSIndexType(str, Enum):
+    FLAT = "flat"  # Exact search
+    IVF_FLAT = "ivf_flat"
+    IVF_PQ = "ivf_pq"
+    HNSW = "hnsw"
+    SQ_FP16 = "sq_fp16"  # Scalar quantization, 2 bytes per dimension
+    SQ_INT8 = "sq_int8"  # Scalar quantization, 1 byte per dimension
+
+
+class FAISSDocstoreType(str, Enum):
+    MEMORY = "memory"  # Chunks kept in memory, pickled with the index
+    SQLITE = "sqlite"  # Chunks kept in a SQLite file, read on demand
+
+
+class FAISSIndexConfig(QuivrBaseConfig):
+    index_type: FAISSIndexType = FAISSIndexType.FLAT
+    # Number of IVF cells, capped by the training sample size
+    nlist: int = 1024
+    # Number of IVF cells visited per query
+    nprobe: int = 16
+    # Number of PQ sub-vectors, must divide the embedding dimension
+    pq_m: int = 16
+    # Bits per PQ code
+    pq_nbits: int = 8
+    # Number of HNSW neighbors per node
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    # HNSW candidates list size per query
+    ef_search: int = 64
+    # Number of vectors buffered and sampled to train the index
+    train_size: int = 50_000
+    # Re-rank k * rerank_factor candidates exactly (keeps full vectors), 0 disables
+    rerank_factor: int = 0
+    # Storage of the chunks text and metadata
+    docstore_type: FAISSDocstoreType = FAISSDocstoreType.MEMORY
+    # Filters matching at most N chunks are searched exactly among them
+    filter_exact_max: int = 20_000
+
+
 class IngestionConfig(QuivrBaseConfig):
     parser_config: ParserConfig = ParserConfig()
+    # Number of files loaded/uploaded concurrently
+    max_concurrent_uploads: int = 8
+    # Number of files parsed concurrently
+    max_concurrent_files: int = 4
+    # Process pool size for CPU-bound processors
+    max_cpu_workers: int | None = None
+    # Max chunks buffered per file waiting to be embedded
+    chunk_queue_size: int = 256
+    # Max chunks embedded per request
+    embedding_batch_size: int = 64
+    # Max tokens embedded per request
+    embedding_batch_tokens: int = 16_000
+    # Number of concurrent embedding requests
+    max_concurrent_embeddings: int = 4
+    # Rate limit of the embedding provider
+    embedding_requests_per_minute: int | None = None
+    embedding_tokens_per_minute: int | None = None
+    # Attempts per embedding request
+    embedding_max_retries: int = 3
+    # Enables the embedding cache in this directory
+    embedding_cache_dir: Path | None = None
+    embedding_cache_max_bytes: int = 2 * 1024**3
+    # Index of the default FAISS vector store
+    faiss_index_config: FAISSIndexConfig = FAISSIndexConfig()
+    # Max embedded batches waiting to be indexed
+    embedding_queue_size: int = 4
+    # Enables the parse cache in this directory
+    parse_cache_dir: Path | None = None
+    parse_cache_max_bytes: int = 2 * 1024**3
+    # Parse every file in sandboxed worker processes
+    sandbox_parsing: bool = False
+    # Wall-clock limit per file in sandboxed workers (s)
+    parse_timeout: float | None = None
+    # Memory limit of a sandboxed worker
+    worker_max_rss_mb: int | None = None
+    # Sandboxed workers are recycled after N files
+    worker_max_files: int | None = 100
 
 
 class AssistantConfig(QuivrBaseConfig):
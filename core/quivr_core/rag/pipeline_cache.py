@@ -0,0 +1,97 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Type
+
+from langchain_core.vectorstores import VectorStore
+
+from quivr_core.llm import LLMEndpoint
+from quivr_core.rag.entities.config import RetrievalConfig
+
+logger = logging.getLogger("quivr_core")
+
+
+@dataclass
+class PipelineCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Pipelines dropped because their configuration was modified after they were built
+    discarded: int = 0
+
+
+class PipelineCache:
+    """
+    Cache of the RAG pipelines of a brain, reused across questions.
+
+    Building a pipeline compiles its LangGraph workflow: pipelines are cached, keyed by the fingerprint of
+    their configuration (see `QuivrBaseConfig.fingerprint`), their LLM endpoint and vector store.
+
+    A pipeline is shared by all the concurrent requests with the same configuration: the edits of a
+    request, e.g. the system prompt and tools of the `edit_system_prompt` node, are carried by its graph
+    state and never modify the configuration of the pipeline. Each cached pipeline owns a copy of the
+    configuration it was built with; a pipeline whose configuration was nonetheless modified is rebuilt.
+
+    Args:
+        max_configs (int): Number of configurations cached, least recently used first evicted.
+    """
+
+    def __init__(self, max_configs: int = 32):
+        self.max_configs = max_configs
+        self._lock = threading.Lock()
+        self._pipelines: OrderedDict[tuple, Any] = OrderedDict()
+        self.stats = PipelineCacheStats()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pipelines)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pipelines.clear()
+
+    def get(
+        self,
+        pipeline_class: Type[Any],
+        retrieval_config: RetrievalConfig,
+        llm: LLMEndpoint,
+        vector_store: VectorStore | None,
+    ) -> Any:
+        """
+        The pipeline of `pipeline_class` for a request, built on first use.
+
+        Args:
+            pipeline_class (Type[QuivrQARAG | QuivrQARAGLangGraph]): The RAG pipeline.
+            retrieval_config (RetrievalConfig): The configuration of the request, copied by new pipelines.
+            llm (LLMEndpoint): The LLM of the pipeline.
+            vector_store (VectorStore | None): The vector store of the pipeline.
+        Returns:
+            QuivrQARAG | QuivrQARAGLangGraph: The pipeline, shared with the other requests.
+        """
+        fingerprint = retrieval_config.fingerprint()
+        # NOTE: the cached pipelines keep their LLM and vector store alive, so their ids aren't reused
+        key = (pipeline_class, fingerprint, id(llm), id(vector_store))
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is not None:
+                self._pipelines.move_to_end(key)
+
+        if pipeline is not None:
+            if pipeline.retrieval_config.fingerprint() == fingerprint:
+                self.stats.hits += 1
+                return pipeline
+            self.stats.discarded += 1
+            logger.debug("discarding a RAG pipeline whose configuration was modified")
+
+        self.stats.misses += 1
+        pipeline = pipeline_class(
+            retrieval_config=retrieval_config.model_copy(deep=True),
+            llm=llm,
+            vector_store=vector_store,
+        )
+        with self._lock:
+            self._pipelines[key] = pipeline
+            self._pipelines.move_to_end(key)
+            while len(self._pipelines) > self.max_configs:
+                self._pipelines.popitem(last=False)
+        return pipeline
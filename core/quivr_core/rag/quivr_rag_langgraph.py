@@ -4,6 +4,7 @@ from typing import (
     Annotated,
     Any,
     AsyncGenerator,
+    Callable,
     Dict,
     List,
     Optional,
@@ -15,7 +16,6 @@ from typing import (
 from uuid import uuid4
 
 import openai
-from langchain.retrievers import ContextualCompressionRetriever
 from langchain_cohere import CohereRerank
 from langchain_community.document_compressors import JinaRerank
 from langchain_core.callbacks import Callbacks
@@ -23,6 +23,7 @@ from langchain_core.documents import BaseDocumentCompressor, Document
 from langchain_core.messages import BaseMessage
 from langchain_core.messages.ai import AIMessageChunk
 from langchain_core.prompts.base import BasePromptTemplate
+from langchain_core.tools import BaseTool
 from langchain_core.vectorstores import VectorStore
 from langgraph.graph import END, START, StateGraph
 from langgraph.graph.message import add_messages
@@ -31,6 +32,7 @@ from pydantic import BaseModel, Field
 
 from quivr_core.llm import LLMEndpoint
 from quivr_core.llm_tools.llm_tools import LLMToolFactory
+from quivr_core.rag.context_packer import ContextPacker
 from quivr_core.rag.entities.chat import ChatHistory
 from quivr_core.rag.entities.config import DefaultRerankers, NodeConfig, RetrievalConfig
 from quivr_core.rag.entities.models import (
@@ -39,8 +41,10 @@ from quivr_core.rag.entities.models import (
 )
 from quivr_core.rag.prompts import custom_prompts
 from quivr_core.rag.utils import (
+    asearch_many,
     collect_tools,
     combine_documents,
+    dedupe_documents,
     format_file_list,
     get_chunk_metadata,
     parse_chunk_response,
@@ -140,6 +144,10 @@ class AgentState(TypedDict):
     tasks: List[str]
     instructions: str
     tool: str
+    # Per-request overlays of the retrieval config, set by `edit_system_prompt`: the system prompt and
+    # the names of the activated tools. See `get_prompt` and `get_activated_tools`.
+    prompt: Optional[str]
+    activated_tools: List[str]
 
 
 class IdempotentCompressor(BaseDocumentCompressor):
@@ -180,6 +188,12 @@ class QuivrQARAGLangGraph:
         self.llm_endpoint = llm
 
         self.graph = None
+        # Re-rankers by top_n, reused by the requests answered by this pipeline
+        self._rerankers: Dict[int, BaseDocumentCompressor] = {}
+        # Caches the token counts of the chunks and chat messages across requests
+        self.context_packer = ContextPacker(
+            llm.count_tokens, policy=retrieval_config.context_packing
+        )
 
     def get_reranker(self, **kwargs):
         # Extract the reranker configuration from self
@@ -218,7 +232,7 @@ class QuivrQARAGLangGraph:
 
         return retriever
 
-    def routing(self, state: AgentState) -> List[Send]:
+    async def arouting(self, state: AgentState) -> List[Send]:
         """
         The routing function for the RAG model.
 
@@ -228,31 +242,27 @@ class QuivrQARAGLangGraph:
         Returns:
             dict: The next state of the agent.
         """
-
         msg = custom_prompts.SPLIT_PROMPT.format(
             user_input=state["messages"][0].content,
         )
+        response: SplittedInput = await self.ainvoke_structured_output(
+            msg, SplittedInput
+        )
+        return self._routing_sends(state, response)
 
-        response: SplittedInput
-
-        try:
-            structured_llm = self.llm_endpoint._llm.with_structured_output(
-                SplittedInput, method="json_schema"
-            )
-            response = structured_llm.invoke(msg)
-
-        except openai.BadRequestError:
-            structured_llm = self.llm_endpoint._llm.with_structured_output(
-                SplittedInput
-            )
-            response = structured_llm.invoke(msg)
+    def routing(self, state: AgentState) -> List[Send]:
+        """Synchronous version of `arouting`, kept for backwards compatibility."""
+        msg = custom_prompts.SPLIT_PROMPT.format(
+            user_input=state["messages"][0].content,
+        )
+        response: SplittedInput = self.invoke_structured_output(msg, SplittedInput)
+        return self._routing_sends(state, response)
 
+    def _routing_sends(self, state: AgentState, response: SplittedInput) -> List[Send]:
         send_list: List[Send] = []
 
         instructions = (
-            response.instructions
-            if response.instructions
-            else self.retrieval_config.prompt
+            response.instructions if response.instructions else self.get_prompt(state)
         )
 
         if instructions:
@@ -268,16 +278,27 @@ class QuivrQARAGLangGraph:
 
         return send_list
 
-    def routing_split(self, state: AgentState):
+    async def arouting_split(self, state: AgentState) -> List[Send]:
+        response = await self.ainvoke_structured_output(
+            self._split_prompt(state), SplittedInput
+        )
+        return self._split_sends(state, response)
+
+    def routing_split(self, state: AgentState) -> List[Send]:
+        """Synchronous version of `arouting_split`, kept for backwards compatibility."""
         response = self.invoke_structured_output(
-            custom_prompts.SPLIT_PROMPT.format(
-                chat_history=state["chat_history"].to_list(),
-                user_input=state["messages"][0].content,
-            ),
-            SplittedInput,
+            self._split_prompt(state), SplittedInput
+        )
+        return self._split_sends(state, response)
+
+    def _split_prompt(self, state: AgentState) -> str:
+        return custom_prompts.SPLIT_PROMPT.format(
+            chat_history=state["chat_history"].to_list(),
+            user_input=state["messages"][0].content,
         )
 
-        instructions = response.instructions or self.retrieval_config.prompt
+    def _split_sends(self, state: AgentState, response: SplittedInput) -> List[Send]:
+        instructions = response.instructions or self.get_prompt(state)
         tasks = response.tasks or []
 
         if instructions:
@@ -292,32 +313,71 @@ class QuivrQARAGLangGraph:
 
         return []
 
-    def update_active_tools(self, updated_prompt_and_tools: UpdatedPromptAndTools):
-        if updated_prompt_and_tools.tools_to_activate:
-            for tool in updated_prompt_and_tools.tools_to_activate:
-                for (
-                    validated_tool
-                ) in self.retrieval_config.workflow_config.validated_tools:
-                    if tool == validated_tool.name:
-                        self.retrieval_config.workflow_config.activated_tools.append(
-                            validated_tool
-                        )
-
-        if updated_prompt_and_tools.tools_to_deactivate:
-            for tool in updated_prompt_and_tools.tools_to_deactivate:
-                for (
-                    activated_tool
-                ) in self.retrieval_config.workflow_config.activated_tools:
-                    if tool == activated_tool.name:
-                        self.retrieval_config.workflow_config.activated_tools.remove(
-                            activated_tool
-                        )
+    def get_prompt(self, state: AgentState) -> str | None:
+        """The system prompt of the request: edited by the request, or the configured one."""
+        if "prompt" in state:
+            return state["prompt"]
+        return self.retrieval_config.prompt
+
+    def get_activated_tools(self, state: AgentState) -> List[BaseTool | Type]:
+        """The tools activated for the request: edited by the request, or the configured ones."""
+        workflow_config = self.retrieval_config.workflow_config
+        if "activated_tools" not in state:
+            return workflow_config.activated_tools
+        tools = [*workflow_config.validated_tools, *workflow_config.activated_tools]
+        tools_by_name = {tool.name: tool for tool in tools}
+        return [
+            tools_by_name[name]
+            for name in state["activated_tools"]
+            if name in tools_by_name
+        ]
+
+    def update_active_tools(
+        self,
+        updated_prompt_and_tools: UpdatedPromptAndTools,
+        activated_tools: List[str],
+    ) -> List[str]:
+        """
+        Apply the tool (de)activations of an `UpdatedPromptAndTools` response.
+
+        The configured tools aren't modified: the activations only apply to the request.
+
+        Args:
+            updated_prompt_and_tools (UpdatedPromptAndTools): The response of the LLM.
+            activated_tools (List[str]): The names of the tools activated for the request.
+
+        Returns:
+            List[str]: The names of the tools activated for the request after the update.
+        """
+        validated_tools = [
+            tool.name for tool in self.retrieval_config.workflow_config.validated_tools
+        ]
+        activated_tools = list(activated_tools)
+        for tool in updated_prompt_and_tools.tools_to_activate or []:
+            if tool in validated_tools and tool not in activated_tools:
+                activated_tools.append(tool)
+
+        tools_to_deactivate = updated_prompt_and_tools.tools_to_deactivate or []
+        return [tool for tool in activated_tools if tool not in tools_to_deactivate]
+
+    async def aedit_system_prompt(self, state: AgentState) -> AgentState:
+        response: UpdatedPromptAndTools = await self.ainvoke_structured_output(
+            self._update_prompt(state), UpdatedPromptAndTools
+        )
+        return self._apply_prompt_update(state, response)
 
     def edit_system_prompt(self, state: AgentState) -> AgentState:
+        """Synchronous version of `aedit_system_prompt`, kept for backwards compatibility."""
+        response: UpdatedPromptAndTools = self.invoke_structured_output(
+            self._update_prompt(state), UpdatedPromptAndTools
+        )
+        return self._apply_prompt_update(state, response)
+
+    def _update_prompt(self, state: AgentState) -> str:
         user_instruction = state["instructions"]
-        prompt = self.retrieval_config.prompt
+        prompt = self.get_prompt(state)
         available_tools, activated_tools = collect_tools(
-            self.retrieval_config.workflow_config
+            self.retrieval_config.workflow_config, self.get_activated_tools(state)
         )
         inputs = {
             "instruction": user_instruction,
@@ -326,19 +386,26 @@ class QuivrQARAGLangGraph:
             "activated_tools": activated_tools,
         }
 
-        msg = custom_prompts.UPDATE_PROMPT.format(**inputs)
+        return custom_prompts.UPDATE_PROMPT.format(**inputs)
 
-        response: UpdatedPromptAndTools = self.invoke_structured_output(
-            msg, UpdatedPromptAndTools
+    def _apply_prompt_update(
+        self, state: AgentState, response: UpdatedPromptAndTools
+    ) -> AgentState:
+        activated_tools = self.update_active_tools(
+            response, [tool.name for tool in self.get_activated_tools(state)]
         )
 
-        self.update_active_tools(response)
-        self.retrieval_config.prompt = response.prompt
-
         reasoning = [response.prompt_reasoning] if response.prompt_reasoning else []
         reasoning += [response.tools_reasoning] if response.tools_reasoning else []
 
-        return {**state, "messages": [], "reasoning": reasoning}
+        # NOTE: the edits are carried by the state of the request, the shared retrieval config isn't modified
+        return {
+            **state,
+            "messages": [],
+            "reasoning": reasoning,
+            "prompt": response.prompt,
+            "activated_tools": activated_tools,
+        }
 
     def filter_history(self, state: AgentState) -> AgentState:
         """
@@ -360,10 +427,9 @@ class QuivrQARAGLangGraph:
         _chat_id = uuid4()
         _chat_history = ChatHistory(chat_id=_chat_id, brain_id=chat_history.brain_id)
         for human_message, ai_message in reversed(list(chat_history.iter_pairs())):
-            # TODO: replace with tiktoken
-            message_tokens = self.llm_endpoint.count_tokens(
+            message_tokens = self.context_packer.count(
                 human_message.content
-            ) + self.llm_endpoint.count_tokens(ai_message.content)
+            ) + self.context_packer.count(ai_message.content)
             if (
                 total_tokens + message_tokens
                 > self.retrieval_config.llm_config.max_context_tokens
@@ -440,14 +506,31 @@ class QuivrQARAGLangGraph:
 
         return filtered_chunks
 
-    def tool_routing(self, state: AgentState):
-        tasks = state["tasks"]
-        if not tasks:
+    async def atool_routing(self, state: AgentState) -> List[Send]:
+        if not state["tasks"]:
             return [Send("generate_rag", state)]
 
+        response: TasksCompletion = await self.ainvoke_structured_output(
+            self._tool_routing_prompt(state), TasksCompletion
+        )
+        return self._tool_routing_sends(state, response)
+
+    def tool_routing(self, state: AgentState) -> List[Send]:
+        """Synchronous version of `atool_routing`, kept for backwards compatibility."""
+        if not state["tasks"]:
+            return [Send("generate_rag", state)]
+
+        response: TasksCompletion = self.invoke_structured_output(
+            self._tool_routing_prompt(state), TasksCompletion
+        )
+        return self._tool_routing_sends(state, response)
+
+    def _tool_routing_prompt(self, state: AgentState) -> str:
         docs = state["docs"]
 
-        _, activated_tools = collect_tools(self.retrieval_config.workflow_config)
+        _, activated_tools = collect_tools(
+            self.retrieval_config.workflow_config, self.get_activated_tools(state)
+        )
 
         input = {
             "chat_history": state["chat_history"].to_list(),
@@ -463,10 +546,11 @@ class QuivrQARAGLangGraph:
             # max_context_tokens=2000,
         )
 
-        msg = custom_prompts.TOOL_ROUTING_PROMPT.format(**input)
-
-        response: TasksCompletion = self.invoke_structured_output(msg, TasksCompletion)
+        return custom_prompts.TOOL_ROUTING_PROMPT.format(**input)
 
+    def _tool_routing_sends(
+        self, state: AgentState, response: TasksCompletion
+    ) -> List[Send]:
         send_list: List[Send] = []
 
         if response.non_completable_tasks and response.tool:
@@ -483,9 +567,7 @@ class QuivrQARAGLangGraph:
 
     async def run_tool(self, state: AgentState) -> AgentState:
         tool = state["tool"]
-        if tool not in [
-            t.name for t in self.retrieval_config.workflow_config.activated_tools
-        ]:
+        if tool not in [t.name for t in self.get_activated_tools(state)]:
             raise ValueError(f"Tool {tool} not activated")
 
         tasks = state["tasks"]
@@ -510,6 +592,38 @@ class QuivrQARAGLangGraph:
 
         return {**state, "docs": state["docs"] + docs}
 
+    async def aretrieve_tasks(
+        self, tasks: List[str], k: int, top_n: int
+    ) -> List[List[Document]]:
+        """
+        Retrieve and re-rank the relevant chunks of each task.
+
+        All the tasks are searched with a single embedding request and a single vector store search (see
+        `asearch_many`), then each task is re-ranked against its own chunks.
+
+        Args:
+            tasks (List[str]): The tasks to retrieve chunks for.
+            k (int): The number of chunks retrieved per task.
+            top_n (int): The number of chunks kept by the re-ranker per task.
+
+        Returns:
+            List[List[Document]]: The relevant chunks of each task.
+        """
+        if self.vector_store is None:
+            raise ValueError("No vector store provided")
+
+        results = await asearch_many(self.vector_store, tasks, k=k)
+        reranker = self._rerankers.get(top_n)
+        if reranker is None:
+            reranker = self._rerankers[top_n] = self.get_reranker(top_n=top_n)
+        reranked = await asyncio.gather(
+            *(
+                reranker.acompress_documents([doc for doc, _ in docs], task)
+                for task, docs in zip(tasks, results, strict=True)
+            )
+        )
+        return [self.filter_chunks_by_relevance(list(docs)) for docs in reranked]
+
     async def retrieve(self, state: AgentState) -> AgentState:
         """
         Retrieve relevent chunks
@@ -525,34 +639,13 @@ class QuivrQARAGLangGraph:
         if not tasks:
             return {**state, "docs": []}
 
-        kwargs = {
-            "search_kwargs": {
-                "k": self.retrieval_config.k,
-            }
-        }  # type: ignore
-        base_retriever = self.get_retriever(**kwargs)
-
-        kwargs = {"top_n": self.retrieval_config.reranker_config.top_n}  # type: ignore
-        reranker = self.get_reranker(**kwargs)
-
-        compression_retriever = ContextualCompressionRetriever(
-            base_compressor=reranker, base_retriever=base_retriever
+        responses = await self.aretrieve_tasks(
+            tasks,
+            k=self.retrieval_config.k,
+            top_n=self.retrieval_config.reranker_config.top_n,
         )
 
-        # Prepare the async tasks for all questions
-        async_tasks = []
-        for task in tasks:
-            # Asynchronously invoke the model for each question
-            async_tasks.append(compression_retriever.ainvoke(task))
-
-        # Gather all the responses asynchronously
-        responses = await asyncio.gather(*async_tasks) if async_tasks else []
-
-        docs = []
-        for response in responses:
-            _docs = self.filter_chunks_by_relevance(response)
-            docs += _docs
-
+        docs = dedupe_documents([doc for _docs in responses for doc in _docs])
         return {**state, "docs": docs}
 
     async def dynamic_retrieve(self, state: AgentState) -> AgentState:
@@ -577,37 +670,17 @@ class QuivrQARAGLangGraph:
 
         while number_of_relevant_chunks == top_n:
             top_n = self.retrieval_config.reranker_config.top_n * i
-            kwargs = {"top_n": top_n}
-            reranker = self.get_reranker(**kwargs)
-
             k = max([top_n * 2, self.retrieval_config.k])
-            kwargs = {"search_kwargs": {"k": k}}  # type: ignore
-            base_retriever = self.get_retriever(**kwargs)
 
             if i > 1:
                 logging.info(
                     f"Increasing top_n to {top_n} and k to {k} to retrieve more relevant chunks"
                 )
 
-            compression_retriever = ContextualCompressionRetriever(
-                base_compressor=reranker, base_retriever=base_retriever
-            )
-
-            # Prepare the async tasks for all questions
-            async_tasks = []
-            for task in tasks:
-                # Asynchronously invoke the model for each question
-                async_tasks.append(compression_retriever.ainvoke(task))
-
-            # Gather all the responses asynchronously
-            responses = await asyncio.gather(*async_tasks) if async_tasks else []
+            responses = await self.aretrieve_tasks(tasks, k=k, top_n=top_n)
 
-            docs = []
-            _n = []
-            for response in responses:
-                _docs = self.filter_chunks_by_relevance(response)
-                _n.append(len(_docs))
-                docs += _docs
+            _n = [len(_docs) for _docs in responses]
+            docs = dedupe_documents([doc for _docs in responses for doc in _docs])
 
             if not docs:
                 break
@@ -627,8 +700,9 @@ class QuivrQARAGLangGraph:
 
     def get_rag_context_length(self, state: AgentState, docs: List[Document]) -> int:
         final_inputs = self._build_rag_prompt_inputs(state, docs)
-        msg = custom_prompts.RAG_ANSWER_PROMPT.format(**final_inputs)
-        return self.llm_endpoint.count_tokens(msg)
+        return self.context_packer.context_length(
+            final_inputs, custom_prompts.RAG_ANSWER_PROMPT, docs
+        )
 
     def reduce_rag_context(
         self,
@@ -637,48 +711,26 @@ class QuivrQARAGLangGraph:
         docs: List[Document] | None = None,
         max_context_tokens: int | None = None,
     ) -> Tuple[Dict[str, Any], List[Document] | None]:
-        MAX_ITERATION = 100
-        SECURITY_FACTOR = 0.85
-        iteration = 0
+        """
+        Keep the chat history and chunks fitting in the context of the LLM, see `ContextPacker`.
 
-        msg = prompt.format(**inputs)
-        n = self.llm_endpoint.count_tokens(msg)
+        Args:
+            inputs (Dict[str, Any]): The inputs of the prompt.
+            prompt (BasePromptTemplate): The prompt.
+            docs (List[Document] | None): The chunks, by decreasing relevance.
+            max_context_tokens (int | None): The token budget. Defaults to the `max_context_tokens` of the LLM.
 
-        max_context_tokens = (
-            max_context_tokens
-            if max_context_tokens
-            else self.retrieval_config.llm_config.max_context_tokens
+        Returns:
+            Tuple[Dict[str, Any], List[Document] | None]: The reduced inputs and chunks.
+        """
+        return self.context_packer.pack(
+            inputs,
+            prompt,
+            docs,
+            max_context_tokens=max_context_tokens
+            or self.retrieval_config.llm_config.max_context_tokens,
         )
 
-        while n > max_context_tokens * SECURITY_FACTOR:
-            chat_history = inputs["chat_history"] if "chat_history" in inputs else []
-
-            if len(chat_history) > 0:
-                inputs["chat_history"] = chat_history[2:]
-            elif docs and len(docs) > 1:
-                docs = docs[:-1]
-            else:
-                logging.warning(
-                    f"Not enough context to reduce. The context length is {n} "
-                    f"which is greater than the max context tokens of {max_context_tokens}"
-                )
-                break
-
-            if docs and "context" in inputs:
-                inputs["context"] = combine_documents(docs)
-
-            msg = prompt.format(**inputs)
-            n = self.llm_endpoint.count_tokens(msg)
-
-            iteration += 1
-            if iteration > MAX_ITERATION:
-                logging.warning(
-                    f"Attained the maximum number of iterations ({MAX_ITERATION})"
-                )
-                break
-
-        return inputs, docs
-
     def bind_tools_to_llm(self, node_name: str):
         if self.llm_endpoint.supports_func_calling():
             tools = self.retrieval_config.workflow_config.get_node_tools(node_name)
@@ -686,7 +738,24 @@ class QuivrQARAGLangGraph:
                 return self.llm_endpoint._llm.bind_tools(tools, tool_choice="any")
         return self.llm_endpoint._llm
 
+    async def agenerate_rag(self, state: AgentState) -> AgentState:
+        msg, docs = self._rag_answer_prompt(state)
+        llm = self.bind_tools_to_llm(self.generate_rag.__name__)
+        response = await llm.ainvoke(msg)
+
+        return {**state, "messages": [response], "docs": docs if docs else []}
+
     def generate_rag(self, state: AgentState) -> AgentState:
+        """Synchronous version of `agenerate_rag`, kept for backwards compatibility."""
+        msg, docs = self._rag_answer_prompt(state)
+        llm = self.bind_tools_to_llm(self.generate_rag.__name__)
+        response = llm.invoke(msg)
+
+        return {**state, "messages": [response], "docs": docs if docs else []}
+
+    def _rag_answer_prompt(
+        self, state: AgentState
+    ) -> Tuple[str, List[Document] | None]:
         docs: List[Document] | None = state["docs"]
         final_inputs = self._build_rag_prompt_inputs(state, docs)
 
@@ -694,13 +763,9 @@ class QuivrQARAGLangGraph:
             final_inputs, custom_prompts.RAG_ANSWER_PROMPT, docs
         )
 
-        msg = custom_prompts.RAG_ANSWER_PROMPT.format(**reduced_inputs)
-        llm = self.bind_tools_to_llm(self.generate_rag.__name__)
-        response = llm.invoke(msg)
+        return custom_prompts.RAG_ANSWER_PROMPT.format(**reduced_inputs), docs
 
-        return {**state, "messages": [response], "docs": docs if docs else []}
-
-    def generate_chat_llm(self, state: AgentState) -> AgentState:
+    async def agenerate_chat_llm(self, state: AgentState) -> AgentState:
         """
         Generate answer
 
@@ -710,29 +775,31 @@ class QuivrQARAGLangGraph:
         Returns:
             dict: The updated state with re-phrased question
         """
+        response = await self.llm_endpoint._llm.ainvoke(self._chat_llm_prompt(state))
+        return {**state, "messages": [response]}
+
+    def generate_chat_llm(self, state: AgentState) -> AgentState:
+        """Synchronous version of `agenerate_chat_llm`, kept for backwards compatibility."""
+        response = self.llm_endpoint._llm.invoke(self._chat_llm_prompt(state))
+        return {**state, "messages": [response]}
+
+    def _chat_llm_prompt(self, state: AgentState) -> str:
         messages = state["messages"]
         user_question = messages[0].content
 
         # Prompt
-        prompt = self.retrieval_config.prompt
+        prompt = self.get_prompt(state)
 
         final_inputs = {}
         final_inputs["question"] = user_question
         final_inputs["custom_instructions"] = prompt if prompt else "None"
         final_inputs["chat_history"] = state["chat_history"].to_list()
 
-        # LLM
-        llm = self.llm_endpoint._llm
-
         reduced_inputs, _ = self.reduce_rag_context(
             final_inputs, custom_prompts.CHAT_LLM_PROMPT, None
         )
 
-        msg = custom_prompts.CHAT_LLM_PROMPT.format(**reduced_inputs)
-
-        # Run
-        response = llm.invoke(msg)
-        return {**state, "messages": [response]}
+        return custom_prompts.CHAT_LLM_PROMPT.format(**reduced_inputs)
 
     def build_chain(self):
         """
@@ -757,11 +824,19 @@ class QuivrQARAGLangGraph:
     def _build_workflow(self, workflow: StateGraph):
         for node in self.retrieval_config.workflow_config.nodes:
             if node.name not in [START, END]:
-                workflow.add_node(node.name, getattr(self, node.name))
+                workflow.add_node(node.name, self._get_node_function(node.name))
 
         for node in self.retrieval_config.workflow_config.nodes:
             self._add_node_edges(workflow, node)
 
+    def _get_node_function(self, name: str) -> Callable:
+        # NOTE: the async version `a<name>` of a node or routing function is used when defined, so that
+        # the LLM calls of a request don't block the event loop
+        async_function = getattr(self, f"a{name}", None)
+        if async_function is not None and asyncio.iscoroutinefunction(async_function):
+            return async_function
+        return getattr(self, name)
+
     def _add_node_edges(self, workflow: StateGraph, node: NodeConfig):
         if node.edges:
             for edge in node.edges:
@@ -769,7 +844,9 @@ class QuivrQARAGLangGraph:
                 if edge == END:
                     self.final_nodes.append(node.name)
         elif node.conditional_edge:
-            routing_function = getattr(self, node.conditional_edge.routing_function)
+            routing_function = self._get_node_function(
+                node.conditional_edge.routing_function
+            )
             workflow.add_conditional_edges(
                 node.name, routing_function, node.conditional_edge.conditions
             )
@@ -846,6 +923,18 @@ class QuivrQARAGLangGraph:
             and event["metadata"]["langgraph_node"] in self.final_nodes
         )
 
+    async def ainvoke_structured_output(
+        self, prompt: str, output_class: Type[BaseModel]
+    ) -> Any:
+        try:
+            structured_llm = self.llm_endpoint._llm.with_structured_output(
+                output_class, method="json_schema"
+            )
+            return await structured_llm.ainvoke(prompt)
+        except openai.BadRequestError:
+            structured_llm = self.llm_endpoint._llm.with_structured_output(output_class)
+            return await structured_llm.ainvoke(prompt)
+
     def invoke_structured_output(
         self, prompt: str, output_class: Type[BaseModel]
     ) -> Any:
@@ -873,8 +962,10 @@ class QuivrQARAGLangGraph:
         messages = state["messages"]
         user_question = messages[0].content
         files = state["files"]
-        prompt = self.retrieval_config.prompt
-        available_tools, _ = collect_tools(self.retrieval_config.workflow_config)
+        prompt = self.get_prompt(state)
+        available_tools, _ = collect_tools(
+            self.retrieval_config.workflow_config, self.get_activated_tools(state)
+        )
 
         return {
             "context": combine_documents(docs) if docs else "None",
@@ -1,9 +1,13 @@
+import asyncio
 import logging
-from typing import Any, List, Tuple, no_type_check
+from typing import Any, Callable, Dict, List, Tuple, Type, no_type_check
 
+from langchain_core.documents import Document
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_core.messages.ai import AIMessageChunk
 from langchain_core.prompts import format_document
+from langchain_core.tools import BaseTool
+from langchain_core.vectorstores import VectorStore
 
 from quivr_core.rag.entities.config import WorkflowConfig
 from quivr_core.rag.entities.models import (
@@ -163,6 +167,67 @@ def combine_documents(
     return document_separator.join(doc_strings)
 
 
+async def asearch_many(
+    vector_store: VectorStore,
+    queries: List[str],
+    k: int = 4,
+    filter: Callable | Dict[str, Any] | None = None,
+    fetch_k: int = 20,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Search the chunks most similar to each query.
+
+    The queries are embedded concurrently. Vector stores with a batched search
+    (`similarity_search_with_score_by_vectors`, e.g. the default FAISS store) search all of them at once,
+    the others are searched concurrently, one query at a time. Vector stores embedding the queries
+    themselves (`asimilarity_search_many_with_score`, e.g. a `BrainGroup`) get all the queries at once.
+
+    Returns:
+        List[List[Tuple[Document, float]]]: The chunks and their scores, for each query.
+    """
+    if not queries:
+        return []
+    if hasattr(vector_store, "asimilarity_search_many_with_score"):
+        return await vector_store.asimilarity_search_many_with_score(
+            queries, k=k, filter=filter, fetch_k=fetch_k
+        )
+    if vector_store.embeddings is not None and hasattr(
+        vector_store, "asimilarity_search_with_score_by_vectors"
+    ):
+        # NOTE: embedded as queries, asymmetric models (e.g. E5, Cohere) embed documents differently
+        embeddings = vector_store.embeddings
+        vectors = await asyncio.gather(*(embeddings.aembed_query(q) for q in queries))
+        return await vector_store.asimilarity_search_with_score_by_vectors(
+            vectors, k=k, filter=filter, fetch_k=fetch_k
+        )
+    return list(
+        await asyncio.gather(
+            *(
+                vector_store.asimilarity_search_with_score(
+                    query, k=k, filter=filter, fetch_k=fetch_k
+                )
+                for query in queries
+            )
+        )
+    )
+
+
+def dedupe_documents(docs: List[Document]) -> List[Document]:
+    """Remove the chunks retrieved several times, e.g. by several tasks, keeping their first occurrence."""
+    seen = set()
+    deduped = []
+    for doc in docs:
+        key = (
+            doc.page_content,
+            str(doc.metadata.get("qfile_id")),
+            doc.metadata.get("chunk_index"),
+        )
+        if key not in seen:
+            seen.add(key)
+            deduped.append(doc)
+    return deduped
+
+
 def format_file_list(
     list_files_array: list[QuivrKnowledge], max_files: int = 20
 ) -> str:
@@ -174,15 +239,21 @@ def format_file_list(
     return files_str
 
 
-def collect_tools(workflow_config: WorkflowConfig):
+def collect_tools(
+    workflow_config: WorkflowConfig,
+    activated_tools: List[BaseTool | Type] | None = None,
+):
+    if activated_tools is None:
+        activated_tools = workflow_config.activated_tools
+
     validated_tools = "Available tools which can be activated:\n"
     for i, tool in enumerate(workflow_config.validated_tools):
-        validated_tools += f"Tool {i+1} name: {tool.name}\n"
-        validated_tools += f"Tool {i+1} description: {tool.description}\n\n"
+        validated_tools += f"Tool {i + 1} name: {tool.name}\n"
+        validated_tools += f"Tool {i + 1} description: {tool.description}\n\n"
 
-    activated_tools = "Activated tools which can be deactivated:\n"
-    for i, tool in enumerate(workflow_config.activated_tools):
-        activated_tools += f"Tool {i+1} name: {tool.name}\n"
-        activated_tools += f"Tool {i+1} description: {tool.description}\n\n"
+    activated_tools_str = "Activated tools which can be deactivated:\n"
+    for i, tool in enumerate(activated_tools):
+        activated_tools_str += f"Tool {i + 1} name: {tool.name}\n"
+        activated_tools_str += f"Tool {i + 1} description: {tool.description}\n\n"
 
-    return validated_tools, activated_tools
+    return validated_tools, activated_tools_str
@@ -98,16 +98,23 @@ class LocalStorage(StorageBase):
 
     async def remove_file(self, file_id: UUID) -> None:
         """
-        Removes a file from the local storage. This method is currently not
-        implemented.
+        Removes a file from the local storage and deletes its copy (or symlink)
+        in the storage directory.
 
         Args:
             file_id (UUID): The unique identifier of the file to remove.
 
         Raises:
-            NotImplementedError: Always raises this error as the method is not yet implemented.
+            FileNotFoundError: If no file with this id is in the storage.
         """
-        raise NotImplementedError
+        file = next((f for f in self.files if f.id == file_id), None)
+        if file is None:
+            raise FileNotFoundError(f"file {file_id} not in storage")
+
+        if os.path.lexists(file.path):
+            os.remove(file.path)
+        self.files.remove(file)
+        self.hashes.discard(file.file_sha1)
 
     @classmethod
     def load(cls, config: LocalStorageConfig) -> Self:
@@ -126,6 +133,7 @@ class LocalStorage(StorageBase):
         """
         tstorage = cls(dir_path=config.storage_path)
         tstorage.files = [QuivrFile.deserialize(f) for f in config.files.values()]
+        tstorage.hashes = {f.file_sha1 for f in tstorage.files}
         return tstorage
 
 
@@ -144,7 +152,9 @@ class TransparentStorage(StorageBase):
         return len(self.id_files)
 
     async def remove_file(self, file_id: UUID) -> None:
-        raise NotImplementedError
+        if file_id not in self.id_files:
+            raise FileNotFoundError(f"file {file_id} not in storage")
+        del self.id_files[file_id]
 
     async def get_files(self) -> list[QuivrFile]:
         return list(self.id_files.values())
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from quivr_core.processor.embedding import EmbeddingScheduler, RateLimiter
+
+
+class SlowFakeEmbedding(DeterministicFakeEmbedding):
+    """Fake embedder recording its requests, failing the first request containing a `fail` text."""
+
+    delay: float = 0.05
+    requests: list = []
+    running: int = 0
+    max_running: int = 0
+    failed: bool = False
+
+    async def aembed_documents(self, texts):
+        self.requests.append(texts)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        if "fail" in texts and not self.failed:
+            self.failed = True
+            raise RuntimeError("rate limited")
+        return self.embed_documents(texts)
+
+
+async def _chunks(texts: list[str], chunk_size: int = 4):
+    for text in texts:
+        yield Document(page_content=text, metadata={"chunk_size": chunk_size})
+
+
+@pytest.mark.asyncio
+async def test_embedding_token_packing():
+    embedder = SlowFakeEmbedding(size=8, requests=[])
+    scheduler = EmbeddingScheduler(
+        embedder, max_batch_tokens=10, max_batch_size=100, max_concurrency=1
+    )
+    texts = [str(i) for i in range(5)]
+
+    batches = [b async for b in scheduler.astream(_chunks(texts))]
+
+    # 4 tokens per chunk: 2 chunks per request
+    assert [len(batch) for batch, _ in batches] == [2, 2, 1]
+    assert embedder.requests == [["0", "1"], ["2", "3"], ["4"]]
+    assert all(len(v) == 8 for _, vectors in batches for v in vectors)
+    assert scheduler.metrics.n_tokens == 20
+
+
+@pytest.mark.asyncio
+async def test_embedding_concurrency():
+    embedder = SlowFakeEmbedding(size=8, requests=[])
+    scheduler = EmbeddingScheduler(embedder, max_batch_size=1, max_concurrency=3)
+    texts = [str(i) for i in range(12)]
+
+    batches = [b async for b in scheduler.astream(_chunks(texts))]
+
+    assert sorted(d.page_content for batch, _ in batches for d in batch) == sorted(
+        texts
+    )
+    assert embedder.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_embedding_retry_failed_batch():
+    embedder = SlowFakeEmbedding(size=8, requests=[])
+    scheduler = EmbeddingScheduler(
+        embedder, max_batch_size=2, max_concurrency=2, backoff_base=0.01
+    )
+    texts = ["a", "b", "fail", "c", "d"]
+
+    batches = [b async for b in scheduler.astream(_chunks(texts))]
+
+    assert len(batches) == 3
+    assert scheduler.metrics.n_retries == 1
+    # Only the failed batch was sent twice
+    assert sorted(embedder.requests) == sorted(
+        [["a", "b"], ["fail", "c"], ["fail", "c"], ["d"]]
+    )
+
+
+@pytest.mark.asyncio
+async def test_embedding_failure():
+    embedder = SlowFakeEmbedding(size=8, requests=[])
+    scheduler = EmbeddingScheduler(embedder, max_retries=1)
+
+    with pytest.raises(RuntimeError):
+        _ = [b async for b in scheduler.astream(_chunks(["fail"]))]
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+
+    start = time.monotonic()
+    await limiter.acquire(600)
+    await limiter.acquire(5)
+    # 10 tokens per second
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.1)
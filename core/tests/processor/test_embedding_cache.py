@@ -0,0 +1,124 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from quivr_core.brain import Brain
+from quivr_core.processor.embedding_cache import CachedEmbeddings, EmbeddingStore
+from quivr_core.rag.entities.config import IngestionConfig
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def counting_embedder():
+    return CountingEmbedding(size=8, calls=[])
+
+
+@pytest.mark.asyncio
+async def test_embedding_cache_bulk_lookup(counting_embedder, tmp_path):
+    embedder = CachedEmbeddings(counting_embedder, cache_dir=tmp_path)
+    texts = [f"chunk {i}" for i in range(1000)]
+
+    vectors = await embedder.aembed_documents(texts[:600])
+    assert counting_embedder.calls == [texts[:600]]
+
+    # Only the misses are embedded, in a single call
+    all_vectors = await embedder.aembed_documents(texts)
+    assert counting_embedder.calls[1] == texts[600:]
+    expected = counting_embedder.embed_documents(texts)
+    assert all(v == pytest.approx(e) for v, e in zip(all_vectors, expected))
+    assert all_vectors[:600] == vectors
+    assert embedder.stats.hits == 600
+    assert embedder.stats.misses == 1000
+
+    # The cache is persisted and shared by the embedders of the same model
+    other = CachedEmbeddings(CountingEmbedding(size=8, calls=[]), cache_dir=tmp_path)
+    assert other.embed_documents(texts) == all_vectors
+    assert other.underlying.calls == []
+    other_model = CachedEmbeddings(
+        CountingEmbedding(size=4, calls=[]), cache_dir=tmp_path
+    )
+    other_model.embed_documents(texts[:1])
+    assert other_model.underlying.calls == [texts[:1]]
+
+
+def test_embedding_cache_queries(counting_embedder, tmp_path):
+    embedder = CachedEmbeddings(counting_embedder, cache_dir=tmp_path)
+
+    vector = embedder.embed_query("question")
+    assert embedder.embed_query("question") == vector
+    assert counting_embedder.calls == ["question"]
+    assert embedder.stats.query_hits == 1
+
+    # Queries are persisted too
+    other = CachedEmbeddings(CountingEmbedding(size=8, calls=[]), cache_dir=tmp_path)
+    assert other.embed_query("question") == vector
+    assert other.underlying.calls == []
+
+
+def test_embedding_store_eviction(tmp_path):
+    # 4 vectors of 8 float32 per block: 128 bytes
+    store = EmbeddingStore(tmp_path, max_size_bytes=300, block_rows=4)
+    keys = [i.to_bytes(16, "big") for i in range(12)]
+    vectors = [[float(i)] * 8 for i in range(12)]
+
+    for i in range(0, 12, 2):
+        store.put(keys[i : i + 2], vectors[i : i + 2])
+
+    # The least recently used block was evicted
+    found = store.get(keys)
+    assert found[:4] == [None] * 4
+    assert [v.tolist() for v in found[4:]] == vectors[4:]
+    assert len(list(tmp_path.glob("block-*"))) == 2
+
+
+def test_embedding_store_shared_eviction(tmp_path):
+    store = EmbeddingStore(tmp_path, max_size_bytes=300, block_rows=4)
+    other = EmbeddingStore(tmp_path, max_size_bytes=300, block_rows=4)
+    keys = [i.to_bytes(16, "big") for i in range(12)]
+    vectors = [[float(i)] * 8 for i in range(12)]
+    store.put(keys[:8], vectors[:8])
+
+    # Stored keys aren't written again: no dead rows are counted in the size of the store
+    other.put(keys[:8], vectors[:8])
+    other.put(keys[8:9] * 2, vectors[8:9] * 2)
+    assert store._disk_size() == 9 * 8 * 4
+
+    # The block refreshed by the other store is kept
+    other.get(keys[:1])
+    assert store.put(keys[9:], vectors[9:]) == 1
+    found = store.get(keys)
+    assert found[4:8] == [None] * 4
+    assert [v.tolist() for v in found[:4] + found[8:]] == vectors[:4] + vectors[8:]
+    assert len(list(tmp_path.glob("block-*"))) == 2
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_embedding_cache(
+    counting_embedder, fake_llm, temp_data_file, tmp_path
+):
+    config = IngestionConfig(embedding_cache_dir=tmp_path)
+    for _ in range(2):
+        brain = await Brain.afrom_files(
+            name="test_brain",
+            file_paths=[temp_data_file],
+            embedder=counting_embedder,
+            llm=fake_llm,
+            ingestion_config=config,
+        )
+    assert isinstance(brain.embedder, CachedEmbeddings)
+    # The second brain didn't embed the file
+    assert len(counting_embedder.calls) == 1
+
+    await brain.asearch("test data")
+    await brain.asearch("test data")
+    assert counting_embedder.calls[1:] == ["test data"]
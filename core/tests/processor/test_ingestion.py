@@ -0,0 +1,227 @@
+import asyncio
+import os
+from uuid import uuid4
+
+import pytest
+from langchain_core.documents import Document
+from quivr_core.files.file import FileExtension, QuivrFile
+from quivr_core.processor import ingestion
+from quivr_core.processor.ingestion import IngestionScheduler
+from quivr_core.processor.pool import ProcessorPool
+from quivr_core.processor.processor_base import ProcessorBase
+from quivr_core.rag.entities.config import IngestionConfig
+
+
+class SlowProcessor(ProcessorBase):
+    supported_extensions = [FileExtension.txt]
+    running = 0
+    max_running = 0
+
+    def __init__(self, **kwargs) -> None:
+        pass
+
+    @property
+    def processor_metadata(self):
+        return {"processor_cls": "SlowProcessor"}
+
+    async def process_file_inner(self, file: QuivrFile) -> list[Document]:
+        if file.original_filename == "broken.txt":
+            raise RuntimeError("can't parse file")
+        cls = type(self)
+        cls.running += 1
+        cls.max_running = max(cls.max_running, cls.running)
+        # Files listed first finish last
+        await asyncio.sleep(0.01 * (10 - int(file.original_filename.split(".")[0])))
+        cls.running -= 1
+        return [
+            Document(page_content=f"{file.original_filename}-{i}") for i in range(2)
+        ]
+
+
+def _qfile(name: str) -> QuivrFile:
+    return QuivrFile(
+        id=uuid4(),
+        brain_id=uuid4(),
+        original_filename=name,
+        path=name,  # type: ignore
+        file_extension=FileExtension.txt,
+        file_sha1=name,
+    )
+
+
+@pytest.fixture
+def slow_processor(monkeypatch):
+    SlowProcessor.running = 0
+    SlowProcessor.max_running = 0
+    monkeypatch.setattr(ingestion, "get_processor_class", lambda _: SlowProcessor)
+    return SlowProcessor
+
+
+@pytest.mark.asyncio
+async def test_process_files_ordered(slow_processor):
+    files = [_qfile(f"{i}.txt") for i in range(6)]
+    scheduler = IngestionScheduler(IngestionConfig(max_concurrent_files=3))
+
+    docs = await scheduler.aprocess_files(files, skip_file_error=False)
+
+    assert [d.page_content for d in docs] == [
+        f"{i}.txt-{j}" for i in range(6) for j in range(2)
+    ]
+    assert [d.metadata["chunk_index"] for d in docs] == [1, 2] * 6
+    assert slow_processor.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_process_files_skip_error(slow_processor):
+    files = [_qfile("1.txt"), _qfile("broken.txt"), _qfile("2.txt")]
+    scheduler = IngestionScheduler()
+
+    docs = await scheduler.aprocess_files(files, skip_file_error=True)
+    assert [d.page_content for d in docs] == [
+        "1.txt-0",
+        "1.txt-1",
+        "2.txt-0",
+        "2.txt-1",
+    ]
+
+    with pytest.raises(RuntimeError):
+        await scheduler.aprocess_files(files, skip_file_error=False)
+
+
+@pytest.mark.asyncio
+async def test_stream_files_ordered(slow_processor):
+    files = [_qfile(f"{i}.txt") for i in range(6)]
+    scheduler = IngestionScheduler(
+        IngestionConfig(max_concurrent_files=3, chunk_queue_size=1)
+    )
+
+    docs = [d async for d in scheduler.astream_files(files, skip_file_error=False)]
+
+    assert [d.page_content for d in docs] == [
+        f"{i}.txt-{j}" for i in range(6) for j in range(2)
+    ]
+    assert slow_processor.max_running == 3
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_index_documents_stream(slow_processor, embedder, mem_vector_store):
+    from langchain_community.vectorstores import FAISS
+
+    files = [_qfile(f"{i}.txt") for i in range(5)]
+    scheduler = IngestionScheduler(IngestionConfig(embedding_batch_size=3))
+
+    vector_db = await scheduler.aindex_documents(
+        scheduler.astream_files(files, skip_file_error=False), embedder
+    )
+    assert isinstance(vector_db, FAISS)
+    assert vector_db.index.ntotal == 10
+
+    vector_db = await scheduler.aindex_documents(
+        scheduler.astream_files(files, skip_file_error=False),
+        embedder,
+        mem_vector_store,
+    )
+    assert vector_db is mem_vector_store
+    assert len(mem_vector_store.store) == 10
+
+    with pytest.raises(ValueError):
+        await scheduler.aindex_documents(
+            scheduler.astream_files([], skip_file_error=False), embedder
+        )
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reuses_processors(monkeypatch):
+    built = []
+
+    class _Processor(SlowProcessor):
+        def __init__(self, **kwargs) -> None:
+            built.append(self)
+
+    monkeypatch.setattr(ingestion, "get_processor_class", lambda _: _Processor)
+    pool = ProcessorPool()
+    files = [_qfile(f"{i}.txt") for i in range(4)]
+
+    for _ in range(2):
+        scheduler = IngestionScheduler(processor_pool=pool)
+        await scheduler.aprocess_files(files, skip_file_error=False)
+        [d async for d in scheduler.astream_files(files, skip_file_error=False)]
+
+    assert len(built) == 1
+
+
+class PartialProcessor(SlowProcessor):
+    async def process_file_inner_stream(self, file: QuivrFile):
+        for i in range(2):
+            yield Document(page_content=f"{file.original_filename}-{i}")
+        if file.original_filename == "broken.txt":
+            raise RuntimeError("can't parse the end of the file")
+
+
+@pytest.mark.asyncio
+async def test_index_documents_skip_partial_file(monkeypatch, mem_vector_store):
+    monkeypatch.setattr(ingestion, "get_processor_class", lambda _: PartialProcessor)
+    files = [_qfile("1.txt"), _qfile("broken.txt"), _qfile("2.txt")]
+    scheduler = IngestionScheduler(
+        IngestionConfig(embedding_batch_size=1), processor_pool=ProcessorPool()
+    )
+
+    await scheduler.aindex_documents(
+        scheduler.astream_files(files, skip_file_error=True),
+        mem_vector_store.embeddings,
+        mem_vector_store,
+    )
+
+    # The chunks of the broken file indexed before its error are deleted
+    assert sorted(d["text"] for d in mem_vector_store.store.values()) == [
+        "1.txt-0",
+        "1.txt-1",
+        "2.txt-0",
+        "2.txt-1",
+    ]
+    assert [e.file for e in scheduler.file_errors] == [files[1]]
+
+
+@pytest.mark.asyncio
+async def test_stream_files_skip_processor_error(monkeypatch):
+    class _Processor(SlowProcessor):
+        def __init__(self, **kwargs) -> None:
+            raise ImportError("missing dependency")
+
+    monkeypatch.setattr(ingestion, "get_processor_class", lambda _: _Processor)
+    files = [_qfile("1.txt")]
+    scheduler = IngestionScheduler(processor_pool=ProcessorPool())
+
+    docs = [d async for d in scheduler.astream_files(files, skip_file_error=True)]
+
+    assert docs == []
+    assert [e.file for e in scheduler.file_errors] == files
+
+
+@pytest.mark.asyncio
+async def test_stream_files_starts_files_lazily(slow_processor):
+    files = [_qfile(f"{i}.txt") for i in range(6)]
+    scheduler = IngestionScheduler(IngestionConfig(max_concurrent_files=2))
+    n_tasks = len(asyncio.all_tasks())
+
+    stream = scheduler.astream_files(files, skip_file_error=False)
+    await anext(stream)
+
+    # The producers of 2 files, and the task starting them
+    assert len(asyncio.all_tasks()) - n_tasks <= 3
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_shares_process_executor():
+    config = IngestionConfig(max_cpu_workers=1)
+    loop = asyncio.get_running_loop()
+
+    pids = []
+    for _ in range(2):
+        with IngestionScheduler(config) as scheduler:
+            pids.append(await loop.run_in_executor(scheduler.executor, os.getpid))
+
+    # The worker process, and its processors, outlive the schedulers
+    assert pids[0] == pids[1]
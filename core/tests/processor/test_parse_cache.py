@@ -0,0 +1,101 @@
+from uuid import uuid4
+
+import pytest
+from quivr_core.files.file import FileExtension, QuivrFile
+from quivr_core.processor.cache import ParseCache
+from quivr_core.processor.implementations.simple_txt_processor import (
+    SimpleTxtProcessor,
+)
+from quivr_core.processor.splitter import SplitterConfig
+
+
+@pytest.fixture
+def parse_cache(tmp_path):
+    return ParseCache(cache_dir=tmp_path / "parse_cache")
+
+
+@pytest.mark.asyncio
+async def test_parse_cache_hit(parse_cache, quivr_txt):
+    processor = SimpleTxtProcessor(SplitterConfig(chunk_size=10, chunk_overlap=2))
+
+    docs = await processor.process_file(quivr_txt, parse_cache)
+    assert parse_cache.stats.misses == 1
+    assert parse_cache.stats.writes == 1
+
+    # Same content uploaded under another id and name
+    other_file = QuivrFile(
+        id=uuid4(),
+        brain_id=uuid4(),
+        original_filename="other.txt",
+        path=quivr_txt.path,
+        file_extension=FileExtension.txt,
+        file_sha1=quivr_txt.file_sha1,
+    )
+    cached_docs = await processor.process_file(other_file, parse_cache)
+    assert parse_cache.stats.hits == 1
+
+    assert [d.page_content for d in cached_docs] == [
+        d.page_content.replace(quivr_txt.original_filename, "other.txt") for d in docs
+    ]
+    assert all(d.metadata["qfile_id"] == other_file.id for d in cached_docs)
+    assert [d.metadata["chunk_index"] for d in cached_docs] == [
+        d.metadata["chunk_index"] for d in docs
+    ]
+
+
+def test_parse_cache_key(parse_cache, quivr_txt):
+    processor = SimpleTxtProcessor(SplitterConfig(chunk_size=10, chunk_overlap=2))
+    key = parse_cache.key(quivr_txt, processor)
+
+    assert key == parse_cache.key(
+        quivr_txt, SimpleTxtProcessor(SplitterConfig(chunk_size=10, chunk_overlap=2))
+    )
+    assert key != parse_cache.key(
+        quivr_txt, SimpleTxtProcessor(SplitterConfig(chunk_size=20, chunk_overlap=2))
+    )
+
+
+@pytest.mark.asyncio
+async def test_parse_cache_eviction(tmp_path, quivr_txt):
+    parse_cache = ParseCache(cache_dir=tmp_path / "parse_cache", max_size_bytes=1)
+    processor = SimpleTxtProcessor(SplitterConfig(chunk_size=10, chunk_overlap=2))
+
+    await processor.process_file(quivr_txt, parse_cache)
+    assert parse_cache.stats.evictions == 1
+    assert parse_cache._entries() == []
+
+    await processor.process_file(quivr_txt, parse_cache)
+    assert parse_cache.stats.misses == 2
+
+
+def test_parse_cache_key_processor_settings(parse_cache, quivr_txt):
+    from langchain_text_splitters import CharacterTextSplitter
+    from quivr_core.processor.implementations.default import TikTokenTxtProcessor
+
+    key = parse_cache.key(quivr_txt, TikTokenTxtProcessor())
+    assert key is not None
+    assert key != parse_cache.key(quivr_txt, TikTokenTxtProcessor(encoding="latin-1"))
+
+    # A custom splitter can't be fingerprinted: the file isn't cached
+    processor = TikTokenTxtProcessor(
+        splitter=CharacterTextSplitter(chunk_size=5, chunk_overlap=0)
+    )
+    assert parse_cache.key(quivr_txt, processor) is None
+
+
+@pytest.mark.asyncio
+async def test_parse_cache_streams_entry(parse_cache, quivr_txt):
+    processor = SimpleTxtProcessor(SplitterConfig(chunk_size=4, chunk_overlap=0))
+
+    stream = processor.process_file_stream(quivr_txt, parse_cache)
+    await anext(stream)
+    # The entry is written as the chunks are yielded, and only published once complete
+    assert len(list(parse_cache.cache_dir.glob("*/*.tmp"))) == 1
+    assert parse_cache._entries() == []
+    await stream.aclose()
+    assert list(parse_cache.cache_dir.glob("*/*.tmp")) == []
+
+    docs = await processor.process_file(quivr_txt, parse_cache)
+    cached_docs = await processor.process_file(quivr_txt, parse_cache)
+    assert parse_cache.stats.hits == 1
+    assert [d.page_content for d in cached_docs] == [d.page_content for d in docs]
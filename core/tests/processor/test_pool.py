@@ -0,0 +1,49 @@
+import pytest
+from langchain_core.documents import Document
+from quivr_core.files.file import FileExtension, QuivrFile
+from quivr_core.processor.pool import ProcessorPool
+from quivr_core.processor.processor_base import ProcessorBase
+from quivr_core.processor.splitter import SplitterConfig
+
+
+class CountingProcessor(ProcessorBase):
+    supported_extensions = [FileExtension.txt]
+    n_built = 0
+
+    def __init__(self, splitter_config: SplitterConfig = SplitterConfig(), **kwargs):
+        type(self).n_built += 1
+        self.splitter_config = splitter_config
+        self.closed = False
+
+    @property
+    def processor_metadata(self):
+        return {"processor_cls": "CountingProcessor"}
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+    async def process_file_inner(self, file: QuivrFile) -> list[Document]:
+        return [Document(page_content="content")]
+
+
+@pytest.mark.asyncio
+async def test_processor_pool():
+    CountingProcessor.n_built = 0
+    pool = ProcessorPool()
+
+    proc = pool.get(
+        CountingProcessor, splitter_config=SplitterConfig(chunk_size=10), tags=["a"]
+    )
+    assert proc is pool.get(
+        CountingProcessor, splitter_config=SplitterConfig(chunk_size=10), tags=["a"]
+    )
+    assert CountingProcessor.n_built == 1
+
+    other = pool.get(CountingProcessor, splitter_config=SplitterConfig(chunk_size=20))
+    assert other is not proc
+    assert len(pool) == 2
+
+    await pool.aclose()
+    assert proc.closed and other.closed
+    assert len(pool) == 0
+    assert pool.get(CountingProcessor) is not proc
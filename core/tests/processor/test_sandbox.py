@@ -0,0 +1,131 @@
+import os
+import time
+from uuid import uuid4
+
+import pytest
+from langchain_core.documents import Document
+from quivr_core.files.file import FileExtension, QuivrFile
+from quivr_core.processor import ingestion
+from quivr_core.processor.ingestion import IngestionScheduler
+from quivr_core.processor.processor_base import ProcessorBase
+from quivr_core.processor.sandbox import SandboxError, SandboxErrorKind, SandboxPool
+from quivr_core.rag.entities.config import IngestionConfig
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def _sleep(seconds: float) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+
+def _raise():
+    raise ValueError("bad file")
+
+
+def _crash():
+    os._exit(3)
+
+
+def _allocate(n_mb: int):
+    data = b"x" * (n_mb * 1024**2)
+    time.sleep(2)
+    return len(data)
+
+
+class HangingProcessor(ProcessorBase):
+    supported_extensions = [FileExtension.txt]
+
+    @property
+    def processor_metadata(self):
+        return {"processor_cls": "HangingProcessor"}
+
+    async def process_file_inner(self, file: QuivrFile) -> list[Document]:
+        if file.original_filename == "hang.txt":
+            time.sleep(60)
+        return [Document(page_content=file.original_filename)]
+
+
+@pytest.mark.asyncio
+async def test_sandbox_timeout():
+    pool = SandboxPool(max_workers=1, timeout=0.5)
+    try:
+        with pytest.raises(SandboxError) as exc_info:
+            await pool.arun(_sleep, 60)
+        assert exc_info.value.kind == SandboxErrorKind.TIMEOUT
+
+        # The hung worker was replaced
+        assert await pool.arun(_sleep, 0) != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_errors():
+    pool = SandboxPool(max_workers=1)
+    try:
+        pid = await pool.arun(_pid)
+
+        with pytest.raises(SandboxError) as exc_info:
+            await pool.arun(_raise)
+        assert exc_info.value.kind == SandboxErrorKind.ERROR
+        assert exc_info.value.error_type == "ValueError"
+        # The worker survives errors raised by the task
+        assert await pool.arun(_pid) == pid
+
+        with pytest.raises(SandboxError) as exc_info:
+            await pool.arun(_crash)
+        assert exc_info.value.kind == SandboxErrorKind.CRASH
+        assert await pool.arun(_pid) != pid
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_memory_limit():
+    pool = SandboxPool(max_workers=1, max_rss_bytes=300 * 1024**2)
+    try:
+        with pytest.raises(SandboxError) as exc_info:
+            await pool.arun(_allocate, 500)
+        assert exc_info.value.kind == SandboxErrorKind.MEMORY
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_recycle_workers():
+    pool = SandboxPool(max_workers=1, max_tasks_per_worker=2)
+    try:
+        pids = [await pool.arun(_pid) for _ in range(3)]
+        assert pids[0] == pids[1]
+        assert pids[2] != pids[1]
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_sandbox_parsing(monkeypatch):
+    monkeypatch.setattr(ingestion, "get_processor_class", lambda _: HangingProcessor)
+    files = [
+        QuivrFile(
+            id=uuid4(),
+            brain_id=uuid4(),
+            original_filename=name,
+            path=name,  # type: ignore
+            file_extension=FileExtension.txt,
+            file_sha1=name,
+        )
+        for name in ["1.txt", "hang.txt", "2.txt"]
+    ]
+
+    with IngestionScheduler(
+        IngestionConfig(sandbox_parsing=True, parse_timeout=5, max_cpu_workers=2)
+    ) as scheduler:
+        docs = [d async for d in scheduler.astream_files(files, skip_file_error=True)]
+
+    assert [d.page_content for d in docs] == ["1.txt", "2.txt"]
+    assert len(scheduler.file_errors) == 1
+    assert scheduler.file_errors[0].file is files[1]
+    assert scheduler.file_errors[0].kind == SandboxErrorKind.TIMEOUT
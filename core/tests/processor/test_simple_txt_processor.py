@@ -1,6 +1,7 @@
 import pytest
 from langchain_core.documents import Document
 from quivr_core.files.file import FileExtension
+from quivr_core.processor.implementations import simple_txt_processor
 from quivr_core.processor.implementations.simple_txt_processor import (
     SimpleTxtProcessor,
     recursive_character_splitter,
@@ -31,3 +32,35 @@ async def test_simple_processor(quivr_pdf, quivr_txt):
 
     assert len(docs) == 1
     assert docs[0].page_content == "This is some test data."
+
+
+def test_recursive_character_splitter_large_doc():
+    # Used to hit the recursion limit
+    doc = Document(page_content="a" * 100_000)
+
+    docs = recursive_character_splitter(doc, chunk_size=4, chunk_overlap=2)
+
+    assert len(docs) == 49_999
+    assert all(d.page_content == "aaaa" for d in docs)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content_size", [0, 5, 10, 11, 1000, 1001])
+async def test_simple_processor_stream(monkeypatch, tmp_path, quivr_txt, content_size):
+    content = "".join(chr(ord("a") + i % 26) for i in range(content_size))
+    quivr_txt.path = tmp_path / "content.txt"
+    quivr_txt.path.write_text(content)
+    # Read the file by small blocks
+    monkeypatch.setattr(simple_txt_processor, "READ_BLOCK_SIZE", 7)
+    proc = SimpleTxtProcessor(
+        splitter_config=SplitterConfig(chunk_size=10, chunk_overlap=3)
+    )
+
+    docs = [d async for d in proc.process_file_inner_stream(quivr_txt)]
+
+    assert [d.page_content for d in docs] == [
+        d.page_content
+        for d in recursive_character_splitter(
+            Document(page_content=content), chunk_size=10, chunk_overlap=3
+        )
+    ]
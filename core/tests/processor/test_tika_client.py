@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+import pytest
+from quivr_core.files.file import FileExtension, QuivrFile
+from quivr_core.processor.implementations import tika_client
+from quivr_core.processor.implementations.tika_client import TikaClient
+from quivr_core.processor.implementations.tika_processor import TikaProcessor
+
+
+class StubTikaServer(ThreadingHTTPServer):
+    """Local HTTP server answering like Tika: the parsed text is the request body."""
+
+    def __init__(self, statuses: list[int] | None = None, delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _StubTikaHandler)
+        # Status of the successive responses, then 200
+        self.statuses = list(statuses or [])
+        self.delay = delay
+        self.bodies: list[bytes] = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/tika"
+
+
+class _StubTikaHandler(BaseHTTPRequestHandler):
+    server: StubTikaServer
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.bodies.append(body)
+            status = self.server.statuses.pop(0) if self.server.statuses else 200
+            self.server.running += 1
+            self.server.max_running = max(self.server.max_running, self.server.running)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.running -= 1
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def tika_server(request):
+    server = StubTikaServer(**getattr(request, "param", {}))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def quivr_large_txt(tmp_path):
+    path = tmp_path / "large.txt"
+    # Larger than a read block
+    path.write_text("Quivr " * 50_000)
+    return QuivrFile(
+        id=uuid4(),
+        brain_id=uuid4(),
+        original_filename=path.name,
+        path=path,
+        file_extension=FileExtension.txt,
+        file_sha1="123",
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tika_server", [{"statuses": [503, 500]}], indirect=True)
+async def test_tika_client_retry_replays_body(tika_server, quivr_large_txt):
+    client = TikaClient(tika_server.url, backoff_base=0.01)
+
+    text = await client.parse(quivr_large_txt)
+
+    content = quivr_large_txt.path.read_bytes()
+    assert text == content.decode()
+    assert tika_server.bodies == [content] * 3
+    assert client.metrics.n_retries == 2
+    assert client.metrics.n_files == 1
+    assert client.metrics.bytes_sent == len(content)
+    assert client.metrics.bytes_per_second > 0
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tika_server", [{"statuses": [422]}], indirect=True)
+async def test_tika_client_no_retry_client_error(tika_server, quivr_txt):
+    client = TikaClient(tika_server.url, backoff_base=0.01)
+
+    with pytest.raises(RuntimeError, match="422"):
+        await client.parse(quivr_txt)
+
+    assert len(tika_server.bodies) == 1
+    assert client.metrics.n_failures == 1
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tika_server", [{"delay": 0.05}], indirect=True)
+async def test_tika_client_concurrency(tika_server, quivr_txt):
+    client = TikaClient(tika_server.url, max_concurrency=2)
+
+    texts = await asyncio.gather(*[client.parse(quivr_txt) for _ in range(6)])
+
+    assert texts == ["This is some test data."] * 6
+    assert tika_server.max_running == 2
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("tika_server", [{"statuses": [503]}], indirect=True)
+async def test_tika_client_backoff_releases_slot(tika_server, quivr_txt):
+    client = TikaClient(tika_server.url, max_concurrency=1)
+    client._backoff = lambda attempt: 0.3  # type: ignore
+    done = []
+
+    async def _parse(name: str):
+        await client.parse(quivr_txt)
+        done.append(name)
+
+    await asyncio.gather(_parse("retried"), _parse("other"))
+
+    # The other file is parsed while the first one waits for its retry
+    assert done == ["other", "retried"]
+    # The latencies don't include the backoff
+    assert client.metrics.max_latency < 0.3
+    await client.aclose()
+
+
+def test_tika_client_event_loops(tika_server, quivr_txt):
+    client = TikaClient(tika_server.url)
+
+    async def _parse():
+        await client.parse(quivr_txt)
+        return next(iter(client._clients.values()))[0]
+
+    first = asyncio.run(_parse())
+    second = asyncio.run(_parse())
+
+    # The connections of the closed event loop are closed
+    assert first is not second
+    assert first.is_closed
+    assert len(client._clients) == 1
+    asyncio.run(client.aclose())
+    assert second.is_closed
+    assert client._clients == {}
+
+
+@pytest.mark.asyncio
+async def test_tika_processor_shared_client(monkeypatch, tika_server, quivr_txt):
+    monkeypatch.setattr(tika_client, "_tika_clients", {})
+    monkeypatch.setattr(tika_client, "_tika_client_refs", {})
+    first = TikaProcessor(tika_url=tika_server.url)
+    second = TikaProcessor(tika_url=tika_server.url)
+    assert first.client is second.client
+    await first.client.parse(quivr_txt)
+
+    # The client is closed once both processors released it
+    await first.aclose()
+    await first.aclose()
+    assert len(second.client._clients) == 1
+    await second.aclose()
+    assert second.client._clients == {}
+    assert tika_client._tika_clients == {}
+
+    # A client passed to the processor belongs to the caller
+    client = TikaClient(tika_server.url)
+    await client.parse(quivr_txt)
+    await TikaProcessor(client=client).aclose()
+    assert len(client._clients) == 1
+    await client.aclose()
@@ -0,0 +1,16 @@
+import pytest
+from quivr_core.processor.tokenizer import count_tokens, get_encoding
+
+
+def test_get_encoding_cached():
+    assert get_encoding("cl100k_base") is get_encoding("cl100k_base")
+
+
+@pytest.mark.parametrize("n_texts", [0, 3, 40])
+def test_count_tokens(n_texts):
+    enc = get_encoding("cl100k_base")
+    texts = [f"chunk number {i} " * (i + 1) for i in range(n_texts)]
+    # Special tokens are counted as text
+    texts.append("<|endoftext|>")
+
+    assert count_tokens(texts) == [len(enc.encode_ordinary(t)) for t in texts]
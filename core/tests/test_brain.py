@@ -1,12 +1,23 @@
+import asyncio
+import time
 from dataclasses import asdict
+from pathlib import Path
 from uuid import uuid4
 
 import pytest
 from langchain_core.documents import Document
-from langchain_core.embeddings import Embeddings
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
 from quivr_core.brain import Brain
 from quivr_core.rag.entities.chat import ChatHistory
 from quivr_core.llm import LLMEndpoint
+from quivr_core.rag.entities.config import (
+    FAISSDocstoreType,
+    FAISSIndexConfig,
+    IngestionConfig,
+    LLMEndpointConfig,
+)
 from quivr_core.storage.local_storage import TransparentStorage
 
 
@@ -149,3 +160,430 @@ def test_brain_info_empty(fake_llm: LLMEndpoint, embedder, mem_vector_store):
         },
         "llm_info": asdict(fake_llm.info()),
     }
+
+
+@pytest.mark.asyncio
+async def test_brain_add_remove_file(
+    fake_llm: LLMEndpoint, embedder, temp_data_file, tmp_path, mem_vector_store
+):
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+        vector_db=mem_vector_store,
+    )
+    assert len(mem_vector_store.store) == 1
+
+    # Unchanged file is skipped
+    (file,) = await brain.storage.get_files()
+    assert await brain.aadd_file(temp_data_file) is file
+    assert len(mem_vector_store.store) == 1
+
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("This is some other test data.")
+    added = await brain.aadd_file(other_file)
+    assert added is not None
+    assert len(await brain.storage.get_files()) == 2
+    assert len(mem_vector_store.store) == 2
+
+    # Changed file replaces its previous version
+    other_file.write_text("This is some updated test data.")
+    updated = await brain.aadd_file(other_file)
+    assert updated is not None
+    assert {f.id for f in await brain.storage.get_files()} == {file.id, updated.id}
+    assert [d["text"] for d in mem_vector_store.store.values()] == [
+        "This is some test data.",
+        "This is some updated test data.",
+    ]
+
+    await brain.aremove_file(file.id)
+    assert [f.id for f in await brain.storage.get_files()] == [updated.id]
+    assert all(
+        d["metadata"]["qfile_id"] == updated.id for d in mem_vector_store.store.values()
+    )
+
+    with pytest.raises(ValueError):
+        await brain.aremove_file(file.id)
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_remove_file_faiss(
+    fake_llm: LLMEndpoint, embedder, temp_data_file, tmp_path
+):
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("This is some other test data.")
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file, other_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    assert brain.vector_db.index.ntotal == 2
+
+    # The file index is rebuilt from the vector store
+    file, _ = await brain.storage.get_files()
+    await brain.aremove_file(file.id)
+    assert brain.vector_db.index.ntotal == 1
+    assert len(await brain.storage.get_files()) == 1
+
+
+class FailingEmbedder(DeterministicFakeEmbedding):
+    """Fake embedder failing after `n_requests` requests."""
+
+    n_requests: int | None = None
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.n_requests is not None:
+            if self.n_requests == 0:
+                raise RuntimeError("embedding API down")
+            self.n_requests -= 1
+        return super().embed_documents(texts)
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_add_file_embedding_error(fake_llm, temp_data_file, tmp_path):
+    embedder = FailingEmbedder(size=20)
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    (file,) = await brain.storage.get_files()
+
+    # The embedding fails after some chunks of the file were indexed
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("\n\n".join(f"paragraph {i} " * 30 for i in range(40)))
+    embedder.n_requests = 2
+    with pytest.raises(RuntimeError, match="embedding API down"):
+        await brain.aadd_file(
+            other_file,
+            ingestion_config=IngestionConfig(
+                embedding_batch_size=1,
+                max_concurrent_embeddings=1,
+                embedding_max_retries=1,
+            ),
+        )
+
+    # The chunks and the file are removed
+    assert [f.id for f in await brain.storage.get_files()] == [file.id]
+    assert brain.vector_db.index.ntotal == 1
+    assert list(brain.file_chunk_ids) == [file.id]
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_save_load_mmap(
+    fake_llm, embedder, temp_data_file, tmp_path, monkeypatch
+):
+    from langchain_openai import OpenAIEmbeddings
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    # Only OpenAI embedders can be serialized
+    brain.embedder = OpenAIEmbeddings()
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    brain_path = await brain.save(tmp_path)
+
+    loaded = Brain.load(brain_path, mmap=True)
+
+    assert loaded.vector_db.index.ntotal == 1
+    assert {"config", "storage", "vectordb", "vectordb_index", "total"} <= set(
+        loaded.load_timings
+    )
+    # The docstore is loaded on first use
+    assert "vectordb_docstore" not in loaded.load_timings
+    assert list(loaded.file_chunk_ids) == [
+        f.id for f in await loaded.storage.get_files()
+    ]
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "docstore_type", [FAISSDocstoreType.MEMORY, FAISSDocstoreType.SQLITE]
+)
+async def test_brain_load_mmap_save_compact(
+    fake_llm, embedder, temp_data_file, tmp_path, monkeypatch, docstore_type
+):
+    from langchain_openai import OpenAIEmbeddings
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+        ingestion_config=IngestionConfig(
+            faiss_index_config=FAISSIndexConfig(docstore_type=docstore_type)
+        ),
+    )
+    brain.embedder = OpenAIEmbeddings()
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    brain_path = await brain.save(tmp_path)
+
+    loaded = Brain.load(brain_path, mmap=True)
+    loaded.embedder = OpenAIEmbeddings()
+    await loaded.save(tmp_path, compact=True)
+
+    # The store maps the new base segment, the previous one was removed
+    loaded.embedder = embedder
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("Other data.")
+    await loaded.aadd_file(other_file)
+    assert loaded.vector_db.index.ntotal == 2
+    assert len(loaded.vector_db.docstore) == 2
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_save_fsyncs_segments(
+    fake_llm, embedder, temp_data_file, tmp_path, monkeypatch
+):
+    from quivr_core.brain import persistence
+
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    synced = []
+    fsync = persistence._fsync
+
+    def _fsync(path):
+        synced.append(Path(path))
+        fsync(path)
+
+    monkeypatch.setattr(persistence, "_fsync", _fsync)
+    brain_path = Path(await brain.save(tmp_path))
+
+    # The new entries of the segments folder and of the brain folder are durable before the manifest
+    segments_path = brain_path / persistence.SEGMENTS_DIR
+    (segment,) = segments_path.iterdir()
+    assert synced.index(brain_path) < synced.index(segments_path)
+    assert synced.index(segments_path) < synced.index(segment)
+    assert synced[-1] == brain_path
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_save_incremental(
+    fake_llm, embedder, temp_data_file, tmp_path, monkeypatch
+):
+    from quivr_core.brain.persistence import read_manifest
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    brain_path = Path(await brain.save(tmp_path))
+    base = read_manifest(brain_path)
+    assert base is not None and [s.kind for s in base.segments] == ["base"]
+
+    # Only the new chunks and chat messages are written
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("This is some other test data.")
+    await brain.aadd_file(other_file)
+    brain.chat_history.append(HumanMessage(content="question"))
+    await brain.save(tmp_path)
+    manifest = read_manifest(brain_path)
+    assert manifest is not None and manifest.generation == 2
+    assert manifest.segments[0] == base.segments[0]
+    assert [(s.kind, s.n_chunks) for s in manifest.segments[1:]] == [("delta", 1)]
+
+    # Deleted chunks are recorded without rewriting the segments
+    await brain.aremove_file(next(iter(brain.file_chunk_ids)))
+    await brain.save(tmp_path, compact=False)
+    manifest = read_manifest(brain_path)
+    assert manifest is not None and len(manifest.deleted_chunk_ids) == 1
+
+    loaded = Brain.load(brain_path, embedder=embedder)
+    assert loaded.vector_db.index.ntotal == 1
+    assert loaded.vector_db.docstore.search(
+        loaded.vector_db.index_to_docstore_id[0]
+    ).page_content == ("This is some other test data.")
+    assert len(loaded.chat_history) == 1
+
+    # Compaction merges the segments and removes the old ones
+    await brain.save(tmp_path, compact=True)
+    manifest = read_manifest(brain_path)
+    assert manifest is not None and len(manifest.segments) == 1
+    assert manifest.deleted_chunk_ids == []
+    assert len(list((brain_path / "segments").iterdir())) == 1
+    assert Brain.load(brain_path, embedder=embedder).vector_db.index.ntotal == 1
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_save_interrupted(
+    fake_llm, embedder, temp_data_file, tmp_path, monkeypatch
+):
+    from quivr_core.brain import persistence
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    brain_path = Path(await brain.save(tmp_path))
+    published = (brain_path / "manifest.json").read_text()
+
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("This is some other test data.")
+    await brain.aadd_file(other_file)
+
+    def _crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(persistence.os, "replace", _crash)
+    with pytest.raises(OSError):
+        await brain.save(tmp_path)
+    monkeypatch.undo()
+
+    # The previous save is intact, and the unpublished segment is removed by the next save
+    assert (brain_path / "manifest.json").read_text() == published
+    assert Brain.load(brain_path, embedder=embedder).vector_db.index.ntotal == 1
+    await brain.save(tmp_path)
+    assert len(list((brain_path / "segments").iterdir())) == 2
+    assert Brain.load(brain_path, embedder=embedder).vector_db.index.ntotal == 2
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_search_many(embedder, monkeypatch):
+    docs = [Document(f"content_{i}") for i in range(10)]
+    brain = await Brain.afrom_langchain_documents(
+        name="test", langchain_documents=docs, embedder=embedder
+    )
+
+    calls = []
+    aembed_documents = type(embedder).aembed_documents
+    chunks = {"first": "content_1", "seventh": "content_7"}
+
+    # Asymmetric embeddings: the queries are embedded differently than the chunks
+    async def _aembed_query(self, text):
+        calls.append(text)
+        (vector,) = await aembed_documents(self, [chunks[text]])
+        return vector
+
+    monkeypatch.setattr(type(embedder), "aembed_query", _aembed_query)
+    results = await brain.asearch_many(["first", "seventh"], n_results=2)
+
+    assert sorted(calls) == ["first", "seventh"]
+    assert [r[0].chunk.page_content for r in results] == ["content_1", "content_7"]
+    assert [len(r) for r in results] == [2, 2]
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_ask_reuses_pipeline(
+    fake_llm: LLMEndpoint, embedder, temp_data_file, monkeypatch
+):
+    from quivr_core.rag.entities.config import RetrievalConfig
+    from quivr_core.rag.quivr_rag_langgraph import QuivrQARAGLangGraph
+
+    brain = await Brain.afrom_files(
+        name="test_brain", file_paths=[temp_data_file], embedder=embedder, llm=fake_llm
+    )
+    compiled = []
+    create_graph = QuivrQARAGLangGraph.create_graph
+
+    def _create_graph(self):
+        compiled.append(self)
+        return create_graph(self)
+
+    monkeypatch.setattr(QuivrQARAGLangGraph, "create_graph", _create_graph)
+    await brain.aask("question")
+    await brain.aask("question")
+    await brain.aask(
+        "question", retrieval_config=RetrievalConfig(llm_config=fake_llm.get_config())
+    )
+
+    # The graph is compiled once for equal configurations
+    assert len(compiled) == 1
+    assert brain.pipeline_cache.stats.hits == 2
+
+    # A pipeline whose config was modified isn't reused
+    compiled[0].retrieval_config.prompt = "edited"
+    await brain.aask("question")
+    assert brain.pipeline_cache.stats.discarded == 1
+    assert len(compiled) == 2
+    assert compiled[1].retrieval_config.prompt is None
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    """Fake chat model with a slow round trip, recording the concurrent calls."""
+
+    delay: float = 0.5
+    in_flight: int = 0
+    max_in_flight: int = 0
+    sync_calls: int = 0
+
+    def _generate(self, *args, **kwargs):
+        self.sync_calls += 1
+        return super()._generate(*args, **kwargs)
+
+    def _stream(self, *args, **kwargs):
+        self.sync_calls += 1
+        return super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_ask_streaming_concurrent(embedder, temp_data_file):
+    n_questions = 8
+    chat_model = SlowFakeChatModel(responses=["answer"])
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=LLMEndpoint(llm=chat_model, llm_config=LLMEndpointConfig(model="fake")),
+    )
+
+    async def _ask(question: str) -> str:
+        answer = ""
+        async for chunk in brain.ask_streaming(
+            question, chat_history=ChatHistory(uuid4(), brain.id)
+        ):
+            answer += chunk.answer
+        return answer
+
+    start = time.perf_counter()
+    answers = await asyncio.gather(*(_ask(f"question {i}") for i in range(n_questions)))
+    elapsed = time.perf_counter() - start
+
+    assert answers == ["answer"] * n_questions
+    # The LLM calls of the questions overlap: none of them blocks the event loop
+    assert chat_model.sync_calls == 0
+    assert chat_model.max_in_flight == n_questions
+    # The questions share a single pipeline
+    assert brain.pipeline_cache.stats.misses == 1
+    # Each question makes two LLM calls, rewrite and generate_rag: 2 * n_questions * delay if serialized
+    assert elapsed < n_questions * chat_model.delay
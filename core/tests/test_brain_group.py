@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from langchain_core.documents import Document
+from quivr_core.brain import Brain, BrainGroup
+from quivr_core.llm import LLMEndpoint
+
+
+async def _brain(name: str, contents: list[str], embedder) -> Brain:
+    return await Brain.afrom_langchain_documents(
+        name=name,
+        langchain_documents=[Document(c) for c in contents],
+        embedder=embedder,
+    )
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_group_search(embedder):
+    first = await _brain("first", ["content_1", "content_2"], embedder)
+    second = await _brain("second", ["content_3", "content_4"], embedder)
+    group = BrainGroup([first, second])
+
+    results = await group.asearch("content_3", n_results=3)
+
+    assert len(results) == 3
+    assert results[0].chunk.page_content == "content_3"
+    assert results[0].chunk.metadata["brain_id"] == second.id
+    assert results[0].distance == pytest.approx(0)
+    distances = [r.distance for r in results]
+    assert distances == sorted(distances)
+
+    (many,) = await group.asearch_many(["content_1"], n_results=1)
+    assert many[0].chunk.metadata["brain_id"] == first.id
+
+
+@pytest.mark.base
+def test_brain_group_vector_store_sync(embedder):
+    first = asyncio.run(_brain("first", ["content_1", "content_2"], embedder))
+    second = asyncio.run(_brain("second", ["content_3", "content_4"], embedder))
+    store = BrainGroup([first, second]).as_vector_store()
+
+    results = store.similarity_search_with_score("content_3", k=2)
+    assert [doc.page_content for doc, _ in results][0] == "content_3"
+    assert results[0][1] == pytest.approx(0)
+
+    docs = store.as_retriever(search_kwargs={"k": 1}).invoke("content_1")
+    assert [doc.page_content for doc in docs] == ["content_1"]
+    assert docs[0].metadata["brain_id"] == first.id
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_group_vector_store_sync_in_loop(embedder):
+    first = await _brain("first", ["content_1", "content_2"], embedder)
+    store = BrainGroup([first]).as_vector_store()
+
+    # A sync retriever called from a coroutine
+    docs = store.as_retriever(search_kwargs={"k": 1}).invoke("content_2")
+
+    assert [doc.page_content for doc in docs] == ["content_2"]
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_group_deadline(embedder, monkeypatch):
+    fast = await _brain("fast", ["content_1"], embedder)
+    slow = await _brain("slow", ["content_1"], embedder)
+    broken = await _brain("broken", ["content_1"], embedder)
+
+    async def _slow_search(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    async def _broken_search(*args, **kwargs):
+        raise RuntimeError("shard down")
+
+    monkeypatch.setattr(slow, "asearch_many", _slow_search)
+    monkeypatch.setattr(broken, "asearch_many", _broken_search)
+    group = BrainGroup([slow, broken, fast], timeout=0.2)
+
+    start = time.perf_counter()
+    results = await group.asearch("content_1")
+
+    # The slow and the broken brains don't stall the search
+    assert time.perf_counter() - start < 5
+    assert [r.chunk.metadata["brain_id"] for r in results] == [fast.id]
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_group_ask_streaming(
+    fake_llm: LLMEndpoint, embedder, answers, tmp_path
+):
+    brains = []
+    for name in ["first", "second"]:
+        path = tmp_path / f"{name}.txt"
+        path.write_text(f"Data of the {name} brain.")
+        brains.append(
+            await Brain.afrom_files(
+                name=name, file_paths=[path], embedder=embedder, llm=fake_llm
+            )
+        )
+    group = BrainGroup(brains)
+
+    response = ""
+    async for chunk in group.ask_streaming("question"):
+        response += chunk.answer
+
+    assert response == answers[1]
+    assert len(group.chat_history) == 2
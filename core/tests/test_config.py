@@ -26,3 +26,11 @@ def test_default_retrievalconfig():
     print("\n\n", config.llm_config, "\n\n")
     print("\n\n", LLMEndpointConfig(), "\n\n")
     assert config.llm_config == LLMEndpointConfig()
+
+
+def test_config_fingerprint():
+    assert RetrievalConfig().fingerprint() == RetrievalConfig().fingerprint()
+    assert (
+        RetrievalConfig(prompt="prompt").fingerprint()
+        != RetrievalConfig().fingerprint()
+    )
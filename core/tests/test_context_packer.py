@@ -0,0 +1,116 @@
+from collections import Counter
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from quivr_core.rag.context_packer import ContextPacker
+from quivr_core.rag.entities.config import ContextPackingPolicy
+from quivr_core.rag.utils import combine_documents
+
+PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", "Answer the question with the context."),
+        MessagesPlaceholder("chat_history"),
+        ("user", "Context: {context}\nQuestion: {question}"),
+    ]
+)
+
+
+class CountingTokenizer:
+    def __init__(self):
+        self.calls: Counter[str] = Counter()
+
+    def __call__(self, text: str) -> int:
+        self.calls[text] += 1
+        return len(text.split())
+
+
+@pytest.fixture
+def docs():
+    return [
+        Document(
+            page_content=f"chunk {i} " + "word " * 50,
+            metadata={"original_file_name": f"file_{i}.txt"},
+        )
+        for i in range(5)
+    ]
+
+
+@pytest.fixture
+def inputs(docs):
+    chat_history = []
+    for i in range(4):
+        chat_history += [
+            HumanMessage(content=f"question {i} " + "word " * 30),
+            AIMessage(content=f"answer {i} " + "word " * 30),
+        ]
+    return {
+        "chat_history": chat_history,
+        "context": combine_documents(docs),
+        "question": "What is the answer?",
+    }
+
+
+def test_pack_within_budget(inputs, docs):
+    packer = ContextPacker(CountingTokenizer())
+    assert packer.pack(inputs, PROMPT, docs, max_context_tokens=10_000) == (
+        inputs,
+        docs,
+    )
+
+
+@pytest.mark.parametrize(
+    "policy,n_docs,n_messages",
+    [(ContextPackingPolicy.RELEVANCE, 5, 2), (ContextPackingPolicy.RECENCY, 2, 8)],
+)
+def test_pack_policy(inputs, docs, policy, n_docs, n_messages):
+    packer = ContextPacker(CountingTokenizer(), policy=policy)
+    max_context_tokens = 500
+    packed_inputs, packed_docs = packer.pack(
+        inputs, PROMPT, docs, max_context_tokens=max_context_tokens
+    )
+
+    # The most relevant chunks and the most recent messages are kept
+    assert packed_docs == docs[:n_docs]
+    assert packed_inputs["chat_history"] == inputs["chat_history"][-n_messages:]
+    assert packed_inputs["context"] == combine_documents(packed_docs)
+    assert packer.context_length(packed_inputs, PROMPT, packed_docs) <= (
+        max_context_tokens * 0.85
+    )
+    # The inputs aren't modified
+    assert len(inputs["chat_history"]) == 8
+
+
+def test_pack_keeps_most_relevant_chunk(inputs, docs):
+    packer = ContextPacker(CountingTokenizer())
+    packed_inputs, packed_docs = packer.pack(
+        inputs, PROMPT, docs, max_context_tokens=10
+    )
+    assert packed_docs == docs[:1]
+    assert packed_inputs["chat_history"] == []
+
+
+def test_pack_tokenizes_once(inputs, docs):
+    count_tokens = CountingTokenizer()
+    packer = ContextPacker(count_tokens)
+    packer.pack(inputs, PROMPT, docs, max_context_tokens=500)
+    packer.pack(inputs, PROMPT, docs, max_context_tokens=300)
+
+    # Only the fixed part of the prompt is tokenized on each pack
+    assert len(count_tokens.calls) == 1 + 4 + 5
+    assert sorted(count_tokens.calls.values()) == [1] * 9 + [2]
+
+
+def test_count_cache_lru():
+    count_tokens = CountingTokenizer()
+    packer = ContextPacker(count_tokens, max_cached=2)
+    packer.count("hot")
+    packer.count("cold")
+    packer.count("hot")
+    packer.count("new")
+
+    # The least recently used count is evicted
+    packer.count("hot")
+    packer.count("cold")
+    assert count_tokens.calls == {"hot": 1, "cold": 2, "new": 1}
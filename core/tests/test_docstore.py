@@ -0,0 +1,215 @@
+import pickle
+from uuid import uuid4
+
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from quivr_core.brain import Brain
+from quivr_core.brain.docstore import CompactDocstore, SQLiteDocstore
+from quivr_core.brain.faiss_index import QuivrFAISS
+from quivr_core.rag.entities.config import (
+    FAISSDocstoreType,
+    FAISSIndexConfig,
+    IngestionConfig,
+)
+
+
+@pytest.fixture
+def file_chunks():
+    file_metadata = {
+        "qfile_id": uuid4(),
+        "qfile_path": "/tmp/file.txt",
+        "original_file_name": "file.txt",
+        "file_sha1": "123",
+        "file_size": 1024,
+        "processor_cls": "SimpleTxtProcessor",
+        "splitter": {"chunk_size": 400, "chunk_overlap": 100},
+    }
+    return {
+        str(uuid4()): Document(
+            page_content=f"chunk {i}",
+            metadata={**file_metadata, "chunk_index": i, "chunk_size": 2},
+        )
+        for i in range(100)
+    }
+
+
+def test_compact_docstore_interns_metadata(file_chunks):
+    docstore = CompactDocstore()
+    docstore.add(file_chunks)
+
+    assert len(docstore) == 100
+    assert len(docstore._shared) == 1
+    for id, doc in file_chunks.items():
+        found = docstore.search(id)
+        assert isinstance(found, Document)
+        assert found.page_content == doc.page_content
+        assert found.metadata == doc.metadata
+
+    assert docstore.search("missing") == "ID missing not found."
+    with pytest.raises(ValueError):
+        docstore.add(file_chunks)
+
+
+@pytest.mark.parametrize("docstore_class", [CompactDocstore, SQLiteDocstore])
+def test_docstore_metadata_types(docstore_class):
+    docstore = docstore_class()
+    values = [1, True, 1.0, "1"]
+    docstore.add(
+        {
+            str(i): Document(page_content="chunk", metadata={"flag": value})
+            for i, value in enumerate(values)
+        }
+    )
+
+    # Equal values of different types aren't merged
+    assert len(docstore._shared) == len(values)
+    for i, value in enumerate(values):
+        flag = docstore.search(str(i)).metadata["flag"]
+        assert type(flag) is type(value) and flag == value
+
+
+@pytest.mark.parametrize("docstore_class", [CompactDocstore, SQLiteDocstore])
+def test_docstore_reclaims_shared_metadata(docstore_class, file_chunks):
+    docstore = docstore_class()
+    docstore.add(file_chunks)
+    other_metadata = {"qfile_id": uuid4()}
+    other_chunks = {
+        str(uuid4()): Document(page_content="other", metadata=other_metadata)
+        for _ in range(3)
+    }
+    docstore.add(other_chunks)
+    ids = list(file_chunks)
+
+    docstore.delete(ids[:10])
+    assert len(docstore._shared) == 2
+    # The metadata of a file is dropped with its last chunk
+    docstore.delete(ids[10:])
+    assert len(docstore._shared) == 1
+
+    # Re-added files get a new entry
+    docstore.add(file_chunks)
+    assert len(docstore._shared) == 2
+    assert docstore.search(ids[0]) == file_chunks[ids[0]]
+    for id, doc in other_chunks.items():
+        assert docstore.search(id) == doc
+    if isinstance(docstore, SQLiteDocstore):
+        (n_rows,) = docstore.conn.execute("SELECT COUNT(*) FROM shared").fetchone()
+        assert n_rows == 2
+    else:
+        docstore.delete(list(other_chunks))
+        assert len(pickle.loads(pickle.dumps(docstore))._shared) == 1
+
+
+def test_compact_docstore_delete(file_chunks):
+    docstore = CompactDocstore()
+    docstore.add(file_chunks)
+    ids = list(file_chunks)
+
+    docstore.delete(ids[:10])
+    assert len(docstore) == 90
+    assert isinstance(docstore.search(ids[0]), str)
+    assert [id for id, _ in docstore.items()] == ids[10:]
+    with pytest.raises(ValueError):
+        docstore.delete(ids[:10])
+
+
+def test_compact_docstore_pickle(file_chunks):
+    docstore = CompactDocstore()
+    docstore.add(file_chunks)
+
+    data = pickle.dumps(docstore)
+    loaded = pickle.loads(data)
+    assert dict(loaded.items()) == dict(docstore.items())
+    assert len(data) < len(pickle.dumps(InMemoryDocstore(file_chunks)))
+
+    # The interning table is rebuilt on load
+    loaded.add(
+        {
+            "new": Document(
+                page_content="new", metadata=next(iter(file_chunks.values())).metadata
+            )
+        }
+    )
+    assert len(loaded._shared) == 1
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_faiss_compact_docstore(fake_llm, embedder, temp_data_file):
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    assert isinstance(brain.vector_db.docstore, CompactDocstore)
+
+    (result,) = await brain.asearch("test data", n_results=1)
+    assert result.chunk.metadata["original_file_name"] == temp_data_file.name
+    assert result.chunk.metadata["chunk_index"] == 1
+
+
+def test_sqlite_docstore(file_chunks):
+    docstore = SQLiteDocstore()
+    docstore.add(file_chunks)
+    ids = list(file_chunks)
+
+    assert len(docstore) == 100
+    assert len(docstore._shared) == 1
+    assert docstore.search(ids[3]) == file_chunks[ids[3]]
+    assert dict(docstore.metadatas()) == {
+        id: doc.metadata for id, doc in file_chunks.items()
+    }
+    with pytest.raises(ValueError):
+        docstore.add({ids[0]: file_chunks[ids[0]]})
+
+    docstore.delete(ids[:10])
+    assert len(docstore) == 90
+    assert docstore.search(ids[0]) == f"ID {ids[0]} not found."
+    with pytest.raises(ValueError):
+        docstore.delete(ids[:10])
+
+
+def test_sqlite_docstore_copy_on_write(file_chunks, tmp_path):
+    docstore = SQLiteDocstore()
+    docstore.add(file_chunks)
+    path = tmp_path / "docstore.sqlite"
+    docstore.save(path)
+
+    loaded = SQLiteDocstore(path, read_only=True)
+    assert len(loaded) == 100
+    loaded.delete(list(file_chunks)[:50])
+    assert len(loaded) == 50
+    assert loaded.path != path
+    # The saved docstore is unchanged
+    assert len(SQLiteDocstore(path, read_only=True)) == 100
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_faiss_sqlite_docstore(fake_llm, embedder, temp_data_file, tmp_path):
+    config = IngestionConfig(
+        faiss_index_config=FAISSIndexConfig(docstore_type=FAISSDocstoreType.SQLITE)
+    )
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+        ingestion_config=config,
+    )
+    assert isinstance(brain.vector_db.docstore, SQLiteDocstore)
+    brain.vector_db.save_local(str(tmp_path))
+    assert (tmp_path / "index.sqlite").exists()
+
+    loaded = QuivrFAISS.load_local(
+        str(tmp_path), embedder, allow_dangerous_deserialization=True
+    )
+    assert isinstance(loaded.docstore, SQLiteDocstore)
+    (doc,) = await loaded.asimilarity_search("test data", k=1)
+    assert doc.metadata["original_file_name"] == temp_data_file.name
+
+    (file,) = await brain.storage.get_files()
+    await brain.aremove_file(file.id)
+    assert len(brain.vector_db.docstore) == 0
@@ -0,0 +1,326 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from quivr_core.brain import Brain
+from quivr_core.brain.brain_defaults import build_faiss_vectordb
+from quivr_core.brain.faiss_index import QuivrFAISS
+from quivr_core.rag.entities.config import (
+    FAISSIndexConfig,
+    FAISSIndexType,
+    IngestionConfig,
+)
+
+DIM = 20
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(42).standard_normal((1000, DIM)).astype(np.float32)
+
+
+def _fill(vector_db: QuivrFAISS, vectors: np.ndarray):
+    for start in range(0, len(vectors), 100):
+        batch = vectors[start : start + 100]
+        vector_db.add_embeddings(
+            [(f"chunk {start + i}", v.tolist()) for i, v in enumerate(batch)],
+            metadatas=[{"chunk_index": start + i} for i in range(len(batch))],
+            ids=[str(start + i) for i in range(len(batch))],
+        )
+    vector_db.flush()
+
+
+@pytest.mark.base
+@pytest.mark.parametrize(
+    "config",
+    [
+        FAISSIndexConfig(index_type=FAISSIndexType.FLAT),
+        FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, nlist=8, nprobe=8),
+        FAISSIndexConfig(
+            index_type=FAISSIndexType.IVF_PQ,
+            nlist=8,
+            nprobe=8,
+            pq_m=4,
+            pq_nbits=4,
+            rerank_factor=8,
+        ),
+        FAISSIndexConfig(index_type=FAISSIndexType.HNSW),
+        FAISSIndexConfig(index_type=FAISSIndexType.SQ_FP16),
+        FAISSIndexConfig(index_type=FAISSIndexType.SQ_INT8),
+    ],
+    ids=lambda c: c.index_type.value,
+)
+def test_faiss_index_types(embedder, vectors, config):
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    _fill(vector_db, vectors)
+
+    assert vector_db.index.ntotal == len(vectors)
+    for i in [0, 123, 999]:
+        ((doc, _),) = vector_db.similarity_search_with_score_by_vector(
+            vectors[i].tolist(), k=1
+        )
+        assert doc.metadata["chunk_index"] == i
+
+
+@pytest.mark.base
+def test_faiss_index_training_buffer(embedder, vectors):
+    config = FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, train_size=500)
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+
+    vector_db.add_embeddings([("chunk", vectors[0].tolist())])
+    assert vector_db.index is None
+    assert vector_db.n_pending == 1
+
+    # A search trains the index on the buffered vectors
+    assert len(vector_db.similarity_search_by_vector(vectors[0].tolist(), k=1)) == 1
+    assert vector_db.index.ntotal == 1
+
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    _fill(vector_db, vectors)
+    assert vector_db.index.is_trained
+    assert vector_db.n_pending == 0
+
+
+@pytest.mark.base
+@pytest.mark.parametrize(
+    "config",
+    [
+        FAISSIndexConfig(index_type=FAISSIndexType.FLAT),
+        FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, nlist=8, nprobe=8),
+        FAISSIndexConfig(
+            index_type=FAISSIndexType.IVF_PQ,
+            nlist=8,
+            nprobe=8,
+            pq_m=4,
+            pq_nbits=4,
+            rerank_factor=8,
+        ),
+        FAISSIndexConfig(index_type=FAISSIndexType.HNSW),
+        FAISSIndexConfig(index_type=FAISSIndexType.SQ_INT8, rerank_factor=4),
+    ],
+    ids=lambda c: c.index_type.value,
+)
+def test_faiss_index_delete(embedder, vectors, config, tmp_path):
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    _fill(vector_db, vectors[:100])
+    deleted = [str(i) for i in range(0, 100, 4)]
+
+    vector_db.delete(deleted)
+
+    hnsw = config.index_type == FAISSIndexType.HNSW
+    # HNSW doesn't support removing vectors, they are skipped until purged
+    assert vector_db.index.ntotal == (100 if hnsw else 75)
+    assert len(vector_db.index_to_docstore_id) == 75
+    results = vector_db.similarity_search_with_score_by_vector(
+        vectors[0].tolist(), k=100
+    )
+    assert len(results) == 75
+    assert all(doc.metadata["chunk_index"] % 4 != 0 for doc, _ in results)
+
+    vector_db.add_embeddings(
+        [("new chunk", vectors[100].tolist())],
+        metadatas=[{"chunk_index": 100}],
+        ids=["100"],
+    )
+    for i in [1, 99, 100]:
+        ((doc, _),) = vector_db.similarity_search_with_score_by_vector(
+            vectors[i].tolist(), k=1
+        )
+        assert doc.metadata["chunk_index"] == i
+    ((doc, _),) = vector_db.similarity_search_with_score_by_vector(
+        vectors[50].tolist(), k=1, filter={"chunk_index": 50}
+    )
+    assert doc.metadata["chunk_index"] == 50
+
+    vector_db.save_local(str(tmp_path))
+    assert vector_db.index.ntotal == 76
+    loaded = QuivrFAISS.load_local(
+        str(tmp_path),
+        embedder,
+        allow_dangerous_deserialization=True,
+        index_config=config,
+    )
+    assert sorted(loaded.index_to_docstore_id) == list(range(76))
+    ((doc, _),) = loaded.similarity_search_with_score_by_vector(
+        vectors[99].tolist(), k=1
+    )
+    assert doc.metadata["chunk_index"] == 99
+    if hnsw:
+        assert loaded.index.hnsw.efSearch == config.ef_search
+
+
+@pytest.mark.base
+def test_faiss_index_save_load(embedder, vectors, tmp_path):
+    config = FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, nlist=8, nprobe=4)
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    _fill(vector_db, vectors)
+    vector_db.set_search_params(nprobe=8)
+    vector_db.save_local(str(tmp_path))
+
+    loaded = QuivrFAISS.load_local(
+        str(tmp_path),
+        embedder,
+        allow_dangerous_deserialization=True,
+        index_config=vector_db.index_config,
+    )
+    assert loaded.index.ntotal == len(vectors)
+    assert loaded.index.nprobe == 8
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_faiss_index_config(embedder, fake_llm):
+    docs = [Document(f"content_{i}") for i in range(50)]
+    brain = await Brain.afrom_langchain_documents(
+        name="test",
+        langchain_documents=docs,
+        embedder=embedder,
+        llm=fake_llm,
+        ingestion_config=IngestionConfig(
+            faiss_index_config=FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT)
+        ),
+    )
+
+    assert brain.vector_db.index.ntotal == 50
+    result = await brain.asearch("content_1", n_results=1)
+    assert result[0].chunk.page_content == "content_1"
+
+
+@pytest.mark.base
+def test_faiss_load_mmap(embedder, vectors, tmp_path):
+    config = FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, nlist=8)
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    _fill(vector_db, vectors)
+    vector_db.save_local(str(tmp_path))
+
+    loaded = QuivrFAISS.load_local(
+        str(tmp_path),
+        embedder,
+        allow_dangerous_deserialization=True,
+        mmap=True,
+        lazy_docstore=True,
+        index_config=config,
+    )
+    assert "index" in loaded.load_timings
+    assert loaded._docstore is None
+
+    # The docstore is loaded by the first search
+    ((doc, _),) = loaded.similarity_search_with_score_by_vector(
+        vectors[10].tolist(), k=1
+    )
+    assert doc.metadata["chunk_index"] == 10
+    assert "docstore" in loaded.load_timings
+
+    # The mapped index is copied on the first modification
+    loaded.add_embeddings([("new chunk", vectors[0].tolist())], ids=["new"])
+    assert loaded.index.ntotal == len(vectors) + 1
+    loaded.save_local(str(tmp_path))
+    reloaded = QuivrFAISS.load_local(
+        str(tmp_path), embedder, allow_dangerous_deserialization=True, mmap=True
+    )
+    assert reloaded.index.ntotal == len(vectors) + 1
+
+
+@pytest.mark.base
+@pytest.mark.parametrize("filter_exact_max", [0, 20_000], ids=["selector", "exact"])
+@pytest.mark.parametrize(
+    "index_type",
+    [FAISSIndexType.FLAT, FAISSIndexType.IVF_FLAT, FAISSIndexType.HNSW],
+    ids=lambda t: t.value,
+)
+def test_faiss_filtered_search(embedder, vectors, index_type, filter_exact_max):
+    config = FAISSIndexConfig(
+        index_type=index_type, nlist=8, nprobe=8, filter_exact_max=filter_exact_max
+    )
+    vector_db = build_faiss_vectordb(embedder, DIM, config)
+    vector_db.add_embeddings(
+        [(f"chunk {i}", v.tolist()) for i, v in enumerate(vectors)],
+        metadatas=[
+            {"chunk_index": i, "qfile_id": f"file-{i % 50}"}
+            for i in range(len(vectors))
+        ],
+        ids=[str(i) for i in range(len(vectors))],
+    )
+    vector_db.flush()
+
+    # The filter matches 20 chunks out of 1000: all of them are reachable
+    results = vector_db.similarity_search_with_score_by_vector(
+        vectors[507].tolist(), k=25, filter={"qfile_id": "file-7"}, fetch_k=5
+    )
+    assert len(results) == 20
+    assert results[0][0].metadata["chunk_index"] == 507
+    assert {doc.metadata["qfile_id"] for doc, _ in results} == {"file-7"}
+    scores = [score for _, score in results]
+    assert scores == sorted(scores)
+
+    results = vector_db.similarity_search_with_score_by_vector(
+        vectors[0].tolist(), k=3, filter={"qfile_id": ["file-1", "file-2"]}
+    )
+    assert len(results) == 3
+    assert {doc.metadata["qfile_id"] for doc, _ in results} <= {"file-1", "file-2"}
+    assert (
+        vector_db.similarity_search_with_score_by_vector(
+            vectors[0].tolist(), filter={"qfile_id": "unknown"}
+        )
+        == []
+    )
+
+    # The index follows the modifications of the store
+    vector_db.delete([str(i) for i in range(0, 1000, 50)])
+    vector_db.add_embeddings(
+        [("new chunk", vectors[0].tolist())],
+        metadatas=[{"qfile_id": "file-0"}],
+        ids=["new"],
+    )
+    ((doc, _),) = vector_db.similarity_search_with_score_by_vector(
+        vectors[0].tolist(), k=1, filter={"qfile_id": "file-0"}
+    )
+    assert doc.page_content == "new chunk"
+
+
+def test_metadata_index_resolve():
+    from quivr_core.brain.metadata_index import MetadataIndex
+
+    index = MetadataIndex.from_metadatas(
+        (i, {"chunk_index": i, "qfile_id": i // 10, "splitter": {"size": 400}})
+        for i in range(100)
+    )
+
+    assert len(index) == 100
+    assert index.resolve({"qfile_id": 3}).tolist() == list(range(30, 40))
+    assert index.resolve({"qfile_id": [1, 9]}).tolist() == [
+        *range(10, 20),
+        *range(90, 100),
+    ]
+    assert index.resolve({"qfile_id": 3, "other": "value"}).tolist() == []
+    # Resolved by post-filtering
+    assert index.resolve({"chunk_index": 3}) is None
+    assert index.resolve({"qfile_id": None}) is None
+    assert index.resolve({}) is None
+
+
+@pytest.mark.base
+def test_faiss_batched_search(embedder, vectors):
+    vector_db = build_faiss_vectordb(embedder, DIM, FAISSIndexConfig())
+    vector_db.add_embeddings(
+        [(f"chunk {i}", v.tolist()) for i, v in enumerate(vectors)],
+        metadatas=[
+            {"chunk_index": i, "qfile_id": f"file-{i % 50}"}
+            for i in range(len(vectors))
+        ],
+    )
+    queries = [vectors[3].tolist(), vectors[3].tolist(), vectors[700].tolist()]
+
+    for filter in [None, {"qfile_id": "file-3"}, lambda m: m["chunk_index"] % 2]:
+        results = vector_db.similarity_search_with_score_by_vectors(
+            queries, k=4, filter=filter, fetch_k=100
+        )
+        assert results == [
+            vector_db.similarity_search_with_score_by_vector(
+                q, k=4, filter=filter, fetch_k=100
+            )
+            for q in queries
+        ]
+
+    # The chunks hit by several queries are read once
+    first, second, _ = vector_db.similarity_search_with_score_by_vectors(queries, k=4)
+    assert all(a is b for (a, _), (b, _) in zip(first, second))
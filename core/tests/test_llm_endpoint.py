@@ -46,3 +46,69 @@ def test_llm_endpoint_constructor():
     )
 
     assert not llm_endpoint.supports_func_calling()
+
+
+@pytest.mark.base
+def test_llm_endpoint_from_config_registry(monkeypatch):
+    from quivr_core.llm import LLMRegistry
+    from quivr_core.llm import llm_endpoint
+
+    monkeypatch.setattr(llm_endpoint, "llm_registry", LLMRegistry())
+    config = LLMEndpointConfig(llm_api_key="test")
+
+    # Identical configurations share the endpoint and its client
+    llm = LLMEndpoint.from_config(config)
+    assert LLMEndpoint.from_config(LLMEndpointConfig(llm_api_key="test")) is llm
+    assert (
+        LLMEndpoint.from_config(
+            LLMEndpointConfig(llm_api_key="test", temperature=0.1)
+        )._llm
+        is not llm._llm
+    )
+
+    # The endpoint owns its configuration
+    config.temperature = 0.5
+    assert llm.get_config().temperature == 0.7
+    llm.get_config().set_llm_model("gpt-4o-mini")
+    llm.get_config().temperature = 0.5
+    assert llm.get_config() == LLMEndpointConfig(llm_api_key="test")
+
+    # The shared endpoint can't be modified for the other users of the configuration
+    with pytest.raises(AttributeError):
+        llm.token_counter = len  # type: ignore[misc]
+    with pytest.raises(AttributeError):
+        llm.tokenizer = None  # type: ignore[misc]
+
+
+def test_llm_endpoint_lazy_tokenizer(monkeypatch):
+    from transformers import AutoTokenizer
+
+    from quivr_core.llm import LLMRegistry, approximate_token_count
+    from quivr_core.llm import llm_endpoint
+
+    registry = LLMRegistry()
+    registry.offline = True
+    monkeypatch.setattr(llm_endpoint, "llm_registry", registry)
+    calls = []
+
+    def _from_pretrained(name, **kwargs):
+        calls.append(kwargs)
+        raise OSError("not in the cache")
+
+    monkeypatch.setattr(AutoTokenizer, "from_pretrained", _from_pretrained)
+    config = LLMEndpointConfig(model="test", tokenizer_hub="Quivr/test-tokenizer")
+    first = LLMEndpoint(llm=FakeListChatModel(responses=[]), llm_config=config)
+    second = LLMEndpoint(llm=FakeListChatModel(responses=[]), llm_config=config)
+    assert calls == []
+
+    # Loaded once, offline, falling back to tiktoken
+    assert first.count_tokens("hello world") == 2
+    assert second.count_tokens("hello world") == 2
+    assert calls == [{"local_files_only": True}]
+
+    registry.token_counter = approximate_token_count
+    assert first.count_tokens("a" * 10) == 3
+
+    registry.clear()
+    assert registry._tokenizers == {}
+    assert registry._tokenizer_locks == {}
@@ -1,3 +1,4 @@
+import asyncio
 from uuid import uuid4
 
 import pytest
@@ -98,3 +99,96 @@ async def test_quivrqaraglanggraph(
 
     # Assert whole response makes sense
     assert "".join([r.answer for r in stream_responses]) == full_response
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_quivrqaraglanggraph_retrieve_batched(embedder, monkeypatch):
+    from langchain_core.documents import Document
+    from quivr_core.brain.brain_defaults import build_default_vectordb
+
+    docs = [Document(f"content_{i}") for i in range(10)]
+    vector_store = await build_default_vectordb(docs, embedder)
+    rag_pipeline = QuivrQARAGLangGraph(
+        retrieval_config=RetrievalConfig(k=3),
+        llm=LLMEndpoint.from_config(LLMEndpointConfig()),
+        vector_store=vector_store,
+    )
+
+    calls = []
+    search = vector_store.asimilarity_search_with_score_by_vectors
+
+    async def _search(embeddings, **kwargs):
+        calls.append(len(embeddings))
+        return await search(embeddings, **kwargs)
+
+    monkeypatch.setattr(
+        vector_store, "asimilarity_search_with_score_by_vectors", _search
+    )
+    state = await rag_pipeline.retrieve(
+        {"tasks": ["content_1", "content_1", "content_2"]}  # type: ignore
+    )
+
+    # A single search for all the tasks, the chunks retrieved by several tasks are kept once
+    assert calls == [3]
+    contents = [doc.page_content for doc in state["docs"]]
+    assert contents[0] == "content_1"
+    assert len(contents) == len(set(contents))
+
+
+@pytest.mark.asyncio
+async def test_quivrqaraglanggraph_edit_system_prompt_isolated(monkeypatch):
+    from langchain_core.tools import tool
+    from quivr_core.rag.entities.config import WorkflowConfig
+    from quivr_core.rag.quivr_rag_langgraph import UpdatedPromptAndTools
+
+    @tool
+    def search(query: str) -> str:
+        """Search the web."""
+        return query
+
+    @tool
+    def calculator(expression: str) -> str:
+        """Evaluate an expression."""
+        return expression
+
+    workflow_config = WorkflowConfig()
+    workflow_config.validated_tools += [search, calculator]
+    workflow_config.activated_tools += [calculator]
+    retrieval_config = RetrievalConfig(
+        prompt="Be concise.", workflow_config=workflow_config
+    )
+    rag_pipeline = QuivrQARAGLangGraph(
+        retrieval_config=retrieval_config,
+        llm=LLMEndpoint.from_config(LLMEndpointConfig()),
+    )
+
+    async def _ainvoke_structured_output(prompt, output_class):
+        # Answers the requests concurrently, in the reverse order
+        instruction = "Answer in French" if "in French" in prompt else "Be polite"
+        await asyncio.sleep(0.1 if instruction == "Answer in French" else 0)
+        return UpdatedPromptAndTools(
+            prompt=instruction,
+            tools_to_activate=["search"] if instruction == "Be polite" else [],
+            tools_to_deactivate=["calculator"],
+        )
+
+    monkeypatch.setattr(
+        rag_pipeline, "ainvoke_structured_output", _ainvoke_structured_output
+    )
+    french, polite = await asyncio.gather(
+        rag_pipeline.aedit_system_prompt({"instructions": "Answer in French"}),  # type: ignore
+        rag_pipeline.aedit_system_prompt({"instructions": "Be polite"}),  # type: ignore
+    )
+
+    # Each request gets its own prompt and tools
+    assert rag_pipeline.get_prompt(french) == "Answer in French"
+    assert rag_pipeline.get_activated_tools(french) == []
+    assert rag_pipeline.get_prompt(polite) == "Be polite"
+    assert rag_pipeline.get_activated_tools(polite) == [search]
+
+    # The shared config isn't modified
+    assert retrieval_config.prompt == "Be concise."
+    assert retrieval_config.workflow_config.activated_tools == [calculator]
+    assert rag_pipeline.get_prompt({}) == "Be concise."  # type: ignore
+    assert rag_pipeline.get_activated_tools({}) == [calculator]  # type: ignore
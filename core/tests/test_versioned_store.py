@@ -0,0 +1,174 @@
+import gc
+import threading
+import weakref
+
+import numpy as np
+import pytest
+from quivr_core.brain import Brain
+from quivr_core.brain.brain_defaults import build_faiss_vectordb
+from quivr_core.brain.versioned_store import VersionedFAISS
+from quivr_core.llm import LLMEndpoint
+from quivr_core.rag.entities.config import FAISSIndexConfig, FAISSIndexType
+
+DIM = 20
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(42).standard_normal((400, DIM)).astype(np.float32)
+
+
+def _add(vector_db, vectors: np.ndarray, start: int, stop: int):
+    vector_db.add_embeddings(
+        [(f"chunk {i}", vectors[i].tolist()) for i in range(start, stop)],
+        metadatas=[{"qfile_id": i % 4} for i in range(start, stop)],
+        ids=[str(i) for i in range(start, stop)],
+    )
+
+
+def _versioned(embedder, vectors, config=None, **kwargs) -> VersionedFAISS:
+    base = build_faiss_vectordb(embedder, DIM, config)
+    _add(base, vectors, 0, 100)
+    base.flush()
+    return VersionedFAISS(base, **kwargs)
+
+
+def _ids(vector_db, vector, k=1, **kwargs) -> list[str]:
+    hits = vector_db.similarity_search_with_score_by_vector(
+        vector.tolist(), k=k, **kwargs
+    )
+    return [doc.page_content.removeprefix("chunk ") for doc, _ in hits]
+
+
+@pytest.mark.base
+def test_versioned_store_publish(embedder, vectors):
+    vector_db = _versioned(embedder, vectors)
+    published = []
+    vector_db.subscribe(lambda snapshot: published.append(snapshot.version))
+    pinned = vector_db.snapshot()
+
+    # Added chunks are searched once published
+    _add(vector_db, vectors, 100, 150)
+    assert vector_db.version == 0
+    assert _ids(vector_db, vectors[120]) != ["120"]
+    assert vector_db.publish() == 1
+    assert published == [1]
+    assert _ids(vector_db, vectors[120]) == ["120"]
+    assert _ids(vector_db, vectors[120], filter={"qfile_id": 0}) == ["120"]
+    assert len(vector_db.snapshot()) == 150
+
+    # A pinned snapshot doesn't see the later versions
+    assert len(pinned) == 100
+    (hits,) = pinned.similarity_search_with_score_by_vectors(
+        [vectors[120].tolist()], k=1
+    )
+    assert hits[0][0].page_content != "chunk 120"
+
+
+@pytest.mark.base
+@pytest.mark.parametrize(
+    "config",
+    [
+        FAISSIndexConfig(index_type=FAISSIndexType.FLAT),
+        FAISSIndexConfig(index_type=FAISSIndexType.IVF_FLAT, nlist=4, nprobe=4),
+    ],
+    ids=lambda c: c.index_type.value,
+)
+def test_versioned_store_delete_compact(embedder, vectors, config):
+    vector_db = _versioned(embedder, vectors, config, max_segments=3)
+    _add(vector_db, vectors, 100, 150)
+    vector_db.publish()
+
+    # Deleted chunks are filtered out of the results until the segments are compacted
+    vector_db.delete(["10", "120"])
+    assert vector_db.version == 2
+    assert "10" not in _ids(vector_db, vectors[10], k=5)
+    assert "120" not in _ids(vector_db, vectors[120], k=5)
+    assert {id for id, _ in vector_db.metadatas()} == {str(i) for i in range(150)} - {
+        "10",
+        "120",
+    }
+    with pytest.raises(ValueError):
+        vector_db.delete(["10"])
+
+    pinned = vector_db.snapshot()
+    segment = weakref.ref(pinned.segments[0])
+    for start in range(150, 250, 50):
+        _add(vector_db, vectors, start, start + 50)
+        vector_db.publish()
+
+    # More than `max_segments` segments are compacted into a single one with the configured index
+    snapshot = vector_db.snapshot()
+    assert len(snapshot.segments) == 1
+    assert snapshot.segments[0].index_config.index_type == config.index_type
+    assert len(snapshot) == 248
+    assert _ids(vector_db, vectors[220]) == ["220"]
+    assert "10" not in _ids(vector_db, vectors[10], k=5)
+
+    # The replaced segments are freed once no reader holds them
+    gc.collect()
+    assert segment() is not None
+    del pinned
+    gc.collect()
+    assert segment() is None
+
+
+@pytest.mark.base
+def test_versioned_store_concurrent_readers(embedder, vectors):
+    vector_db = _versioned(embedder, vectors, max_segments=2)
+    errors = []
+    done = threading.Event()
+
+    def _read():
+        while not done.is_set():
+            snapshot = vector_db.snapshot()
+            (hits,) = snapshot.similarity_search_with_score_by_vectors(
+                [vectors[0].tolist()], k=500
+            )
+            # Each search sees a whole version: its chunks, never a partially published one
+            if len(hits) != len(snapshot):
+                errors.append((snapshot.version, len(hits), len(snapshot)))
+
+    readers = [threading.Thread(target=_read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for start in range(100, 400, 20):
+        _add(vector_db, vectors, start, start + 20)
+        vector_db.publish()
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert vector_db.version > 15
+    assert len(vector_db.snapshot()) == 400
+
+
+@pytest.mark.base
+@pytest.mark.asyncio
+async def test_brain_versioned_store(fake_llm, embedder, temp_data_file, tmp_path):
+    brain = await Brain.afrom_files(
+        name="test_brain",
+        file_paths=[temp_data_file],
+        embedder=embedder,
+        llm=fake_llm,
+    )
+    brain.vector_db = VersionedFAISS(brain.vector_db)
+
+    other_file = tmp_path / "other.txt"
+    other_file.write_text("This is some other test data.")
+    await brain.aadd_file(other_file)
+    assert brain.vector_db.version == 1
+    (result,) = await brain.asearch("This is some other test data.", n_results=1)
+    assert result.chunk.page_content == "This is some other test data."
+
+    (file, _) = await brain.storage.get_files()
+    await brain.aremove_file(file.id)
+    results = await brain.asearch("This is some test data.")
+    assert [r.chunk.page_content for r in results] == ["This is some other test data."]
+
+    # Saved compacted, as a FAISS store
+    brain.llm = LLMEndpoint.from_config(fake_llm.get_config())
+    brain_path = await brain.save(tmp_path / "saved")
+    assert len(brain.vector_db.snapshot().segments) == 1
+    assert Brain.load(brain_path, embedder=embedder).vector_db.index.ntotal == 1